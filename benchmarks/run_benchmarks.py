@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks
+==========
+Benchmark suite for the *MLDatabase* package.
+
+Creates synthetic DECam exposures at several scales and measures how long it
+takes to initialize a database, update it incrementally, update it with
+outdated exposures, obtain the objid counter and perform typical queries.
+The results are stored as a JSON-file, which can be compared against the
+results of a previous run with the `--compare` argument.
+
+Run ``python benchmarks/run_benchmarks.py --help`` for all options.
+
+"""
+
+
+# %% IMPORTS
+# Built-in imports
+import argparse
+import json
+import os
+from os import path
+import platform
+import shutil
+import subprocess
+import sys
+from tempfile import mkdtemp
+import time
+
+# Package imports
+import numpy as np
+
+# MLDatabase imports
+import mldatabase
+from mldatabase.synthetic import make_exposures, mark_outdated
+
+
+# %% GLOBALS
+# Scales as (number of exposures, rows per exposure)
+SCALES = {
+    'tiny': (10, 1000),
+    'small': (50, 10000),
+    'medium': (200, 50000),
+    'large': (1000, 100000)}
+
+# Default directory the results are written to
+RESULTS_DIR = path.join(path.dirname(path.abspath(__file__)), 'results')
+
+
+# %% FUNCTION DEFINITIONS
+# This function runs an mld command in a subprocess and times it
+def time_command(exp_dir, *args):
+    # Create the command
+    cmd = [sys.executable, '-m', 'mldatabase', '-d', exp_dir, *args]
+
+    # Run it and time it
+    start = time.perf_counter()
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL)
+    wall_time = time.perf_counter()-start
+
+    # Obtain the stage breakdown of this command if it was profiled
+    stages = {}
+    if '--profile' in args:
+        profile = mldatabase.get_update_profiles(exp_dir)[-1]
+        stages = {name: round(record['wall_time'], 6)
+                  for name, record in profile['stages'].items()}
+
+    # Return the results
+    return({'wall_time': wall_time, 'stages': stages})
+
+
+# This function times a function in this process, returning the best time
+def time_function(func, repeat):
+    # Initialize list of times
+    times = []
+
+    # Call func repeat times
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter()-start)
+
+    # Return the results
+    return({'wall_time': min(times), 'repeat': repeat})
+
+
+# This function runs all benchmarks for a single scale
+def run_scale(scale, work_dir, repeat, seed):
+    # Obtain the size of this scale
+    n_expnums, n_rows = SCALES[scale]
+    exp_dir = path.join(work_dir, scale)
+    results = {'n_expnums': n_expnums, 'n_rows': n_rows}
+    print(f"Running scale {scale!r} ({n_expnums:,} exposures with {n_rows:,} "
+          f"rows each).")
+
+    # Generate the synthetic exposures
+    start = time.perf_counter()
+    expnums = make_exposures(exp_dir, n_expnums, n_rows, seed=seed)
+    results['generate'] = {'wall_time': time.perf_counter()-start}
+
+    # Initialize the database
+    results['init'] = time_command(exp_dir, 'init', '--profile')
+
+    # Update a database that is already up-to-date
+    results['update_noop'] = time_command(exp_dir, 'update')
+
+    # Add 10% new exposures and update incrementally
+    n_new = max(1, n_expnums//10)
+    make_exposures(exp_dir, n_new, n_rows, start=expnums[-1]+1, seed=seed)
+    results['update_incremental'] = time_command(exp_dir, 'update',
+                                                 '--profile')
+    results['update_incremental']['n_expnums'] = n_new
+
+    # Mark 10% of exposures as outdated and update
+    outdated = mark_outdated(exp_dir, expnums, 0.1, seed)
+    results['update_outdated'] = time_command(exp_dir, 'update', '--profile')
+    results['update_outdated']['n_expnums'] = len(outdated)
+
+    # Time the Python API
+    db = mldatabase.Database(exp_dir)
+    results['get_objid_counter'] = time_function(db.counter, repeat)
+
+    # Pick an object that is observed in many exposures
+    cntr = db.counter()
+    objid = max(cntr, key=cntr.get)
+
+    # Time typical queries
+    def open_only():
+        with db.open():
+            pass
+
+    def light_curve():
+        with db.open() as df:
+            obj = df[df.objid == objid]
+            obj.evaluate(obj.hjd)
+            obj.evaluate(obj.mag)
+
+    def mean_mag():
+        with db.open() as df:
+            df.mag.mean()
+
+    def exposure_count():
+        with db.open() as df:
+            df[df.expnum == expnums[0]].count()
+
+    for name, func in [('open_database', open_only),
+                       ('query_light_curve', light_curve),
+                       ('query_mean_mag', mean_mag),
+                       ('query_exposure_count', exposure_count)]:
+        results[name] = time_function(func, repeat)
+
+    # Record the size of the database
+    results['database_size'] = path.getsize(
+        path.join(exp_dir, '.mldatabase', 'exp_master.hdf5'))
+
+    # Return the results
+    return(results)
+
+
+# This function prints a comparison between two sets of results
+def compare_results(old, new):
+    # Print header
+    print(f"\n{'scale':<8} {'benchmark':<22} {'old (s)':>10} {'new (s)':>10} "
+          f"{'ratio':>7}")
+
+    # Loop over all scales and benchmarks that both results share
+    for scale, new_results in new['scales'].items():
+        old_results = old['scales'].get(scale, {})
+        for name, new_result in new_results.items():
+            old_result = old_results.get(name)
+            if not isinstance(new_result, dict) or old_result is None:
+                continue
+
+            # Print the wall times of this benchmark
+            old_time = old_result['wall_time']
+            new_time = new_result['wall_time']
+            print(f"{scale:<8} {name:<22} {old_time:>10.4f} {new_time:>10.4f} "
+                  f"{new_time/old_time:>7.2f}")
+
+
+# %% MAIN FUNCTION
+def main():
+    # Initialize argparser
+    parser = argparse.ArgumentParser(
+        description="Run the MLDatabase benchmark suite",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        '-s', '--scales',
+        help="Scales to run the benchmarks for",
+        nargs='+',
+        choices=list(SCALES),
+        default=['tiny', 'small'])
+    parser.add_argument(
+        '-r', '--repeat',
+        help="Number of times every Python API benchmark is repeated",
+        type=int,
+        default=3)
+    parser.add_argument(
+        '-o', '--output',
+        help="Directory the results are written to",
+        default=RESULTS_DIR)
+    parser.add_argument(
+        '-c', '--compare',
+        help="JSON-file with results of a previous run to compare against",
+        default=None)
+    parser.add_argument(
+        '-w', '--work_dir',
+        help=("Directory the synthetic databases are created in. If not "
+              "given, a temporary directory is used and removed afterward"),
+        default=None)
+    parser.add_argument(
+        '--seed',
+        help="Seed used for generating the synthetic exposures",
+        type=int,
+        default=0)
+    args = parser.parse_args()
+
+    # Create the working directory
+    work_dir = args.work_dir if args.work_dir else mkdtemp(prefix='mld_bench_')
+    os.makedirs(work_dir, exist_ok=True)
+
+    # Run all benchmarks
+    try:
+        results = {
+            'mldatabase': mldatabase.__version__,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'scales': {scale: run_scale(scale, work_dir, args.repeat,
+                                        args.seed)
+                       for scale in args.scales}}
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    # Write the results
+    os.makedirs(args.output, exist_ok=True)
+    filename = path.join(args.output, time.strftime(
+        'bench_%Y%m%d_%H%M%S.json'))
+    with open(filename, 'w') as file:
+        json.dump(results, file, indent=4)
+    print(f"Benchmark results were written to {filename!r}.")
+
+    # Compare against previous results if requested
+    if args.compare is not None:
+        with open(args.compare, 'r') as file:
+            compare_results(json.load(file), results)
+
+
+# %% MAIN EXECUTION
+if(__name__ == '__main__'):
+    main()
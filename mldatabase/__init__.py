@@ -10,12 +10,32 @@ MLDatabase
 # %% IMPORTS AND DECLARATIONS
 # Import base modules and definitions
 from .__version__ import __version__
-from . import __main__
+from . import (
+    __main__, blooms, crossmatch, export, federation, grouping, profiling,
+    pyramid, reader, sketches)
 from .__main__ import *
+from .blooms import *
+from .crossmatch import *
+from .export import *
+from .federation import *
+from .grouping import *
+from .profiling import *
+from .pyramid import *
+from .reader import *
+from .sketches import *
 
 # All declaration
 __all__ = []
 __all__.extend(__main__.__all__)
+__all__.extend(blooms.__all__)
+__all__.extend(crossmatch.__all__)
+__all__.extend(export.__all__)
+__all__.extend(federation.__all__)
+__all__.extend(grouping.__all__)
+__all__.extend(profiling.__all__)
+__all__.extend(pyramid.__all__)
+__all__.extend(reader.__all__)
+__all__.extend(sketches.__all__)
 
 # Author declaration
 __author__ = "Ellert van der Velden (@1313e)"
@@ -8,13 +8,17 @@ from collections import Counter
 from contextlib import contextmanager
 from glob import glob
 from itertools import islice
+from multiprocessing import get_context
 import os
 from os import path
 from pkg_resources import parse_version
+from queue import Empty, Queue
 import re
 import shutil
+import signal
 import sys
 from tempfile import NamedTemporaryFile
+import threading
 import time
 
 # Package imports
@@ -27,12 +31,25 @@ from tqdm import tqdm
 
 # MLDatabase imports
 from mldatabase import __version__
+from mldatabase._cache import cached_file, clear_cache
+from mldatabase._coordination import (
+    Heartbeat, claim_exposure, expire_stale_files, get_active_claims,
+    get_worker_id, read_reports, write_report)
 from mldatabase._globals import (
-    EXP_HEADER, EXP_REGEX, MASTER_EXP_FILE, MASTER_FILE, MLD_NAME, PKG_NAME,
-    REQ_FILES, SIZE_SUFFIXES, TEMP_EXP_FILE, XTR_HEADER)
+    CACHE_DIR_ENV, CACHE_SIZE_ENV, CLUSTERED_DIR, EXP_HEADER, EXP_REGEX,
+    MASTER_EXP_FILE, MASTER_FILE, MLD_NAME, PKG_NAME, PYRAMID_FILE, REQ_FILES,
+    SIZE_SUFFIXES, TEMP_EXP_FILE, VAEX_COLUMN, XTR_HEADER)
+from mldatabase._journal import (
+    clear_journal, fsync_file, read_journal, read_journal_counts,
+    write_journal, write_journal_counts)
+from mldatabase._writer import (
+    append_columns, get_working_set, is_resizable, truncate_columns,
+    write_columns)
+from mldatabase.profiling import UpdateProfiler
 
 # All declaration
-__all__ = ['get_objid_counter', 'open_database']
+__all__ = ['Database', 'clear_cache', 'get_excluded_expnums',
+           'get_objid_counter', 'get_row_slices', 'open_database']
 
 
 # %% GLOBALS
@@ -40,12 +57,644 @@ __all__ = ['get_objid_counter', 'open_database']
 main_desc = (f"{PKG_NAME}; a Python CLI package for making micro-lensing "
              f"databases from DECam exposures.")
 
-# Define global ARGS
-global ARGS
-ARGS = argparse.Namespace()
+# Define the storage of the arguments of every thread
+_LOCAL = threading.local()
+
+# Number of processed exposures that are merged together without a budget
+MERGE_BATCH_SIZE = 100
+
+# Number of seconds after which a batch of processed exposures that is not
+# full is merged anyway if no further exposure has been processed yet
+MERGE_BATCH_DELAY = 10.0
+
+# Number of seconds between checks of whether a batch must be merged while
+# waiting for exposures to be processed
+MERGE_POLL_INTERVAL = 1.0
+
+# Define the quality statistics that are computed for every exposure
+EXP_STATS_DTYPE = [('n_rows', int),
+                   ('mag_median', float),
+                   ('magerr_median', float),
+                   ('contam_frac', float),
+                   ('fitsky_median', float)]
+
+# Define the dtype of the 'expnums' dataset in the master file
+# The rows of an exposure in the master exposure file are given by its
+# 'row_start' and 'row_stop', which are -1 if it has no rows in it
+EXPNUMS_DTYPE = [*list(XTR_HEADER.items())[:-1], ('last_modified', int),
+                 *EXP_STATS_DTYPE, ('row_start', int), ('row_stop', int)]
+
+# Define the dtype of the 'changelog' dataset in the master file
+CHANGELOG_DTYPE = [('version', int),
+                   ('expnum', int),
+                   ('replaced', bool)]
+
+# Define the dtype of the 'removed_objids' dataset in the master file
+REMOVED_OBJIDS_DTYPE = [('version', int),
+                        ('objid', int)]
 
 
 # %% CLASS DEFINITIONS
+# Define class that forwards to the arguments of the current thread
+class ArgsProxy(object):
+    """
+    Proxy of the :obj:`~argparse.Namespace` object that holds the arguments
+    (paths, options and state) of the database that is being used in the
+    current thread.
+
+    All functions in this module obtain these arguments through the `ARGS`
+    proxy, which allows for different databases to be used at the same time
+    in different threads. The arguments are set with :func:`~set_args` and
+    :meth:`~Database.activate`.
+
+    """
+
+    # Forward all attribute access to the arguments of the current thread
+    def __getattr__(self, name):
+        return(getattr(get_args(), name))
+
+    def __setattr__(self, name, value):
+        setattr(get_args(), name, value)
+
+    def __delattr__(self, name):
+        delattr(get_args(), name)
+
+    def __contains__(self, name):
+        return(name in get_args())
+
+
+# Define global ARGS
+ARGS = ArgsProxy()
+
+
+# Define class that represents a single micro-lensing database
+class Database(object):
+    """
+    Represents the micro-lensing database in the provided `exp_dir`, which
+    carries its own paths and state. This allows for any number of databases
+    to be used in the same process, including at the same time in different
+    threads.
+
+    The command-line interface is a thin wrapper around this class.
+
+    Optional
+    --------
+    exp_dir : str or None. Default: None
+        The relative or absolute path to the directory that contains (or will
+        contain) the micro-lensing database.
+        If *None*, the directory of the database that is currently being used
+        in this thread is used, or the current working directory if there is
+        none.
+        This argument is equivalent to the optional `-d`/`--dir` argument when
+        using the command-line interface.
+
+    """
+
+    def __init__(self, exp_dir=None):
+        # If no exp_dir was given, use the arguments of this thread if any
+        if exp_dir is None and 'mld' in ARGS:
+            self._args = argparse.Namespace(**vars(get_args()))
+            return
+
+        # Determine directory path
+        exp_dir = path.abspath(exp_dir if exp_dir else '.')
+
+        # Check if provided dir exists
+        if not path.exists(exp_dir):
+            # If not, raise error
+            raise OSError(f"Provided DIR {exp_dir!r} does not exist!")
+
+        # Create the arguments of this database
+        mld = path.join(exp_dir, MLD_NAME)
+        self._args = argparse.Namespace(
+            dir=exp_dir,
+            mld=mld,
+            master_file=path.join(mld, MASTER_FILE),
+            master_exp_file=path.join(mld, MASTER_EXP_FILE),
+            CLI_flag=False)
+
+    def __repr__(self):
+        return(f"{self.__class__.__name__}({self.dir!r})")
+
+    # This function checks if an objid is in the database
+    def __contains__(self, objid):
+        # Import has_objids
+        from mldatabase.blooms import has_objids
+
+        # Check if objid is in this database
+        return(has_objids(objid, self.dir))
+
+    # The directory that contains the exposure files
+    @property
+    def dir(self):
+        return(self._args.dir)
+
+    # The directory that contains the database
+    @property
+    def mld(self):
+        return(self._args.mld)
+
+    # Whether the database exists
+    @property
+    def exists(self):
+        return(path.exists(self.mld))
+
+    # The version of the database, which is increased by every update that
+    # changes its exposures
+    @property
+    def version(self):
+        with h5py.File(self._args.master_file, 'r') as m_file:
+            return(int(m_file.attrs.get('db_version', 0)))
+
+    # This function makes this database the database of the current thread
+    @contextmanager
+    def activate(self, **options):
+        """
+        Context manager that makes this database the database that is used by
+        all functions in the current thread, with the provided `options` as
+        additional arguments.
+
+        """
+
+        # Create a copy of the arguments with the provided options
+        args = argparse.Namespace(**vars(self._args))
+        vars(args).update(options)
+
+        # Set the arguments of this thread, restoring the previous ones after
+        prev_args = getattr(_LOCAL, 'args', None)
+        set_args(args)
+        try:
+            yield args
+        finally:
+            set_args(prev_args)
+
+    # This function initializes the database
+    def init(self, n_expnums=None, *, jobs=1, max_memory=None,
+             profile=False, pyramid=False):
+        """
+        Initializes a new micro-lensing database and updates it.
+
+        See :meth:`~update` for the description of all arguments.
+
+        """
+
+        with self.activate(n_expnums=n_expnums, jobs=jobs,
+                           max_memory=max_memory, profile=profile,
+                           pyramid=pyramid):
+            init_database()
+
+    # This function deletes and reinitializes the database
+    def reset(self, n_expnums=None, *, jobs=1, max_memory=None,
+              profile=False, pyramid=False):
+        """
+        Deletes and reinitializes an existing micro-lensing database.
+
+        See :meth:`~update` for the description of all arguments.
+
+        """
+
+        with self.activate(n_expnums=n_expnums, jobs=jobs,
+                           max_memory=max_memory, profile=profile,
+                           pyramid=pyramid):
+            reset_database()
+
+    # This function updates the database
+    def update(self, n_expnums=None, *, jobs=1, max_memory=None,
+               profile=False, watch=False, interval=10.0, settle=30.0,
+               latency=300.0, batch_size=100, coordinate=False,
+               stale=600.0, pyramid=False):
+        """
+        Updates an existing micro-lensing database with all exposures that are
+        missing or outdated.
+
+        Optional
+        --------
+        n_expnums : int or None. Default: None
+            The number of exposures to use. If *None*, all are used.
+        jobs : int. Default: 1
+            The number of processes that are used for processing exposures.
+        max_memory : int or None. Default: None
+            The memory budget for updating the database in bytes. If *None*,
+            processed exposures are merged in batches of 100.
+        profile : bool. Default: False
+            Whether to record a profile of every update stage.
+        pyramid : bool. Default: False
+            Whether to build a pyramid of binned light curves after the
+            update. Once built, it is rebuilt after every update.
+        watch : bool. Default: False
+            Whether to keep running and add new exposures as they arrive. See
+            the 'update' command for the description of `interval`,
+            `settle`, `latency` and `batch_size`.
+        coordinate : bool. Default: False
+            Whether to coordinate the processes that process exposures with
+            :meth:`~work` instead. See the 'update' command for the
+            description of `stale`.
+
+        """
+
+        with self.activate(n_expnums=n_expnums, jobs=jobs,
+                           max_memory=max_memory, profile=profile,
+                           watch=watch, interval=interval, settle=settle,
+                           latency=latency, batch_size=batch_size,
+                           coordinate=coordinate, stale=stale,
+                           pyramid=pyramid):
+            update_database()
+
+    # This function processes exposures for a coordinating process
+    def work(self, n_expnums=None, max_expnums=None, *, stale=600.0):
+        """
+        Processes exposures for a process that is coordinating the update of
+        this database, until all exposures have been processed.
+
+        Optional
+        --------
+        n_expnums : int or None. Default: None
+            The number of exposures to use. If *None*, all are used.
+        max_expnums : int or None. Default: None
+            The maximum number of exposures to process. If *None*, there is no
+            maximum.
+        stale : float. Default: 600.0
+            The number of seconds after which claims of other processes that
+            show no sign of life are taken over.
+
+        """
+
+        with self.activate(n_expnums=n_expnums, max_expnums=max_expnums,
+                           stale=stale):
+            run_worker()
+
+    # This function provides safe access to the database
+    @contextmanager
+    def access(self):
+        """
+        Context manager that checks that this database can be accessed, and
+        holds an access lock-file while it is being accessed, which prevents
+        it from being updated.
+
+        Yields
+        ------
+        mld : str
+            The absolute path to the database directory.
+
+        """
+
+        with self.activate():
+            # Check that database file exists
+            check_database_exists(True)
+
+            # If so, make sure that the update-lock file does not exist
+            if path.exists(path.join(ARGS.mld, '.mld_update.lock')):
+                # If the update-lock file does exist, raise error and exit
+                raise_error(f"Database in provided DIR {ARGS.dir!r} is "
+                            f"currently being updated! Access is not "
+                            f"possible!")
+
+            # Obtain list of non-merged exposures
+            temp_files = glob(path.join(ARGS.mld,
+                                        TEMP_EXP_FILE.replace('{}', '*')))
+
+            # If temp_files is not empty or a step was journaled, raise warning
+            if temp_files or read_journal(ARGS.mld) is not None:
+                print(f"WARNING: Database in provided DIR {ARGS.dir!r} was "
+                      f"interrupted during last update. It can be accessed, "
+                      f"but it is recommended to finish the update with 'mld "
+                      f"update -n 0' first!")
+
+            # Open a lock-file
+            with NamedTemporaryFile(suffix='.lock', prefix='.mld_access_',
+                                    dir=ARGS.mld):
+                yield ARGS.mld
+
+    # This function opens the database
+    @contextmanager
+    def open(self, *, cache_dir=None, cache_size=None):
+        """
+        Context manager for accessing this database as a
+        :obj:`~vaex.dataframe.DataFrame` object.
+
+        See :func:`~open_database` for more information.
+
+        """
+
+        # Import vaex
+        import vaex
+
+        # Obtain access to the database
+        with self.access() as mld,\
+                cached_exp_file(mld, cache_dir, cache_size) as exp_file:
+            # Open the database
+            df = vaex.open(exp_file)
+
+            # Wrap within try-finally statement
+            try:
+                # Add the exposure data as virtual columns
+                with h5py.File(path.join(mld, MASTER_FILE), 'r') as m_file:
+                    add_exposure_columns(df, m_file['expnums'][()])
+
+                # Yield the database
+                yield df
+
+            # After context manager returns, clean up
+            finally:
+                # Close database
+                df.close()
+
+    # This function returns the objid counter of the database
+    def counter(self):
+        """
+        Returns a :obj:`~collections.Counter` object that stores the number of
+        times each *objid* can be found in this database.
+
+        """
+
+        # Obtain the objids and their counts
+        objids, counts = self.objid_counts()
+
+        # Create empty counter
+        counter = Counter()
+
+        # Add objids to it
+        counter.update(dict(zip(objids, counts)))
+
+        # Return counter
+        return(counter)
+
+    # This function returns the objids and their counts
+    def objid_counts(self):
+        """
+        Returns the sorted objids in this database and the number of times
+        each of them can be found in it, as two arrays.
+
+        """
+
+        # Open the master hdf5-file
+        with h5py.File(self._args.master_file, 'r') as file:
+            # Obtain the objids dataset
+            objids = file['objids'][()]
+
+        # Return the objids and counts
+        return(objids['objid'], objids['count'])
+
+    # This function returns the changes made since a database version
+    def changes(self, since=0):
+        """
+        Returns the changes that were made to this database after the provided
+        database version `since`.
+
+        Returns
+        -------
+        changes : :obj:`~numpy.ndarray` object
+            Structured array with the 'version' in which an exposure was
+            changed, its 'expnum' and whether its rows 'replaced' previous
+            rows of the same exposure (instead of being added), sorted on
+            version.
+
+        """
+
+        # Open the master hdf5-file
+        with h5py.File(self._args.master_file, 'r') as m_file:
+            # If there is no changelog, there are no logged changes
+            if 'changelog' not in m_file:
+                return(np.empty(0, dtype=CHANGELOG_DTYPE))
+
+            # Obtain all changes up to the current version
+            changes = m_file['changelog'][()]
+            version = m_file.attrs.get('db_version', 0)
+
+        # Return all changes made after since
+        return(changes[(changes['version'] > since) &
+                       (changes['version'] <= version)])
+
+    # This function returns the rows changed since a database version
+    def changed_rows(self, since, columns=None, *, chunk_size=1_000_000):
+        """
+        Returns all rows in this database that were added or replaced after
+        the provided database version `since`.
+
+        Optional
+        --------
+        columns : list of str or None. Default: None
+            The columns to return. If *None*, all columns are returned.
+        chunk_size : int. Default: 1_000_000
+            The number of rows that are read at once.
+
+        Returns
+        -------
+        rows : :obj:`~pandas.DataFrame` object
+            The rows of all exposures that were changed after `since`.
+
+        """
+
+        # Determine the columns that must be returned
+        if columns is None:
+            columns = list(EXP_HEADER)
+
+        # Obtain the exposures that were changed
+        expnums = np.unique(self.changes(since)['expnum'])
+
+        # Obtain access to the database
+        chunks = []
+        with self.access() as mld,\
+                h5py.File(path.join(mld, MASTER_EXP_FILE), 'r') as file:
+            # Obtain the datasets of all required columns
+            dsets = {name: file[VAEX_COLUMN.format(name)] for name in columns}
+
+            # Read the rows of the changed exposures chunk by chunk
+            for row_slice in find_row_slices(expnums):
+                for start in range(row_slice.start, row_slice.stop,
+                                   chunk_size):
+                    stop = min(start+chunk_size, row_slice.stop)
+                    chunks.append({name: dset[start:stop]
+                                   for name, dset in dsets.items()})
+
+        # Return the rows
+        return(pd.DataFrame({
+            name: np.concatenate([chunk[name] for chunk in chunks])
+            if chunks else np.empty(0, dtype=EXP_HEADER[name])
+            for name in columns}))
+
+    # This function returns the objids changed since a database version
+    def changed_objids(self, since):
+        """
+        Returns the sorted objids of all rows in this database that were
+        added, replaced or removed after the provided database version
+        `since`.
+
+        """
+
+        return(np.union1d(self.changed_rows(since, ['objid'])['objid'],
+                          self.removed_objids(since)))
+
+    # This function returns the objids removed since a database version
+    def removed_objids(self, since):
+        """
+        Returns the sorted objids of all rows that were removed from this
+        database after the provided database version `since`, which are the
+        previous rows of all exposures that were replaced.
+
+        """
+
+        # Open the master hdf5-file
+        with h5py.File(self._args.master_file, 'r') as m_file:
+            # If nothing was logged, no objids were removed
+            if 'removed_objids' not in m_file:
+                return(np.empty(0, dtype=int))
+
+            # Obtain all removed objids up to the current version
+            removed = m_file['removed_objids'][()]
+            version = m_file.attrs.get('db_version', 0)
+
+        # Return all objids removed after since
+        return(np.unique(removed['objid'][(removed['version'] > since) &
+                                          (removed['version'] <= version)]))
+
+    # This function returns the expnums of all exposures that are excluded
+    def excluded_expnums(self, **criteria):
+        """
+        Returns the expnums of all exposures in this database that fail the
+        provided `criteria`.
+
+        See :func:`~get_excluded_expnums` for all criteria.
+
+        """
+
+        with self.activate():
+            return(find_excluded_expnums(**criteria))
+
+    # This function returns the light curves of objids
+    def light_curves(self, objids, columns=None):
+        """
+        Returns all rows of the provided `objids` in this database, sorted on
+        objid and hjd.
+
+        See :func:`~mldatabase.get_light_curves` for more information.
+
+        """
+
+        # Import get_light_curves
+        from mldatabase.blooms import get_light_curves
+
+        # Obtain the light curves
+        return(get_light_curves(objids, self.dir, columns=columns))
+
+    # This function returns the rows of a selection of exposures
+    def row_slices(self, expnums=None, *, filters=None, hjd_range=None):
+        """
+        Returns the slices of all rows in this database that belong to the
+        exposures that are selected with the provided arguments.
+
+        See :func:`~get_row_slices` for all arguments.
+
+        """
+
+        with self.access():
+            return(find_row_slices(expnums, filters, hjd_range))
+
+
+# Define class that processes exposures while the database is being updated
+class ExposureProducer(threading.Thread):
+    """
+    Daemon thread that processes all exposures in the provided `exp_dict`
+    (with a pool of `ARGS.jobs` processes if this is more than one), and puts
+    the path to the temporary HDF5-file and the record of every processed
+    exposure in a queue that holds at most `maxsize` of them. *None* is put
+    in the queue once it has finished.
+
+    """
+
+    def __init__(self, exp_dict, maxsize):
+        # Call super constructor
+        super().__init__(daemon=True)
+
+        # Save provided exp_dict and create the queue
+        self.exp_dict = exp_dict
+        self.queue = Queue(maxsize)
+
+        # Save the arguments of the thread that creates this thread
+        self._args = get_args()
+        self._stopped = threading.Event()
+        self.error = None
+
+    # This function processes all exposures
+    def run(self):
+        # Use the arguments of the thread that created this thread
+        set_args(self._args)
+
+        # Process all exposures, saving any error that is raised
+        try:
+            with ARGS.profiler.stage('process') as counters:
+                if(ARGS.jobs > 1):
+                    self._run_parallel(counters)
+                else:
+                    self._run_serial(counters)
+        except BaseException as error:
+            self.error = error
+
+        # Signal that all exposures have been processed
+        finally:
+            self.queue.put(None)
+
+    # This function processes all exposures in this thread
+    def _run_serial(self, counters):
+        for expnum, exp_files in self.exp_dict.items():
+            if self._stopped.is_set():
+                break
+            self.queue.put(export_exp_files(expnum, exp_files))
+            counters['rows'] += 1
+
+    # This function processes all exposures in a process pool
+    def _run_parallel(self, counters):
+        # Create the arguments of the processes
+        args = argparse.Namespace(dir=ARGS.dir, mld=ARGS.mld,
+                                  master_file=ARGS.master_file,
+                                  master_exp_file=ARGS.master_exp_file,
+                                  profile=ARGS.profiler.enabled,
+                                  CLI_flag=False)
+
+        # Obtain the functions of the processes from the package module, as
+        # this module is not importable by them when it is executed as a
+        # script
+        from mldatabase import __main__ as mld_main
+
+        # Create the process pool
+        # Processes are spawned, as forking while other threads use
+        # HDF5-files (e.g., when updating multiple databases at once) can
+        # deadlock
+        pool = get_context('spawn').Pool(
+            min(ARGS.jobs, len(self.exp_dict)), mld_main.init_export_process,
+            (args,))
+
+        # Process all exposures
+        try:
+            for result, stages in pool.imap_unordered(
+                    mld_main.export_exp_files_task, self.exp_dict.items()):
+                ARGS.profiler.add_stages(stages)
+                if self._stopped.is_set():
+                    break
+                self.queue.put(result)
+                counters['rows'] += 1
+
+        # Close the process pool
+        finally:
+            pool.terminate()
+            pool.join()
+
+    # This function stops processing after the current exposure
+    def stop(self):
+        self._stopped.set()
+
+    # This function stops processing and waits until this thread finishes
+    def close(self):
+        # Stop processing
+        self.stop()
+
+        # Discard all results until the thread has finished
+        if self.is_alive():
+            while self.queue.get() is not None:
+                pass
+            self.join()
+
+
 # Define formatter that automatically extracts help strings of subcommands
 class HelpFormatterWithSubCommands(argparse.ArgumentDefaultsHelpFormatter):
     # Override the add_argument function
@@ -96,6 +745,34 @@ class HelpFormatterWithSubCommands(argparse.ArgumentDefaultsHelpFormatter):
 # %% COMMAND FUNCTION DEFINITIONS
 # This function handles the 'init' subcommand
 def cli_init():
+    Database().init(ARGS.n_expnums, jobs=ARGS.jobs,
+                    max_memory=ARGS.max_memory, profile=ARGS.profile,
+                    pyramid=ARGS.pyramid)
+
+
+# This function handles the 'reset' subcommand
+def cli_reset():
+    Database().reset(ARGS.n_expnums, jobs=ARGS.jobs,
+                     max_memory=ARGS.max_memory, profile=ARGS.profile,
+                     pyramid=ARGS.pyramid)
+
+
+# This function handles the 'update' subcommand
+def cli_update():
+    Database().update(
+        ARGS.n_expnums, jobs=ARGS.jobs, max_memory=ARGS.max_memory,
+        profile=ARGS.profile, watch=ARGS.watch, interval=ARGS.interval,
+        settle=ARGS.settle, latency=ARGS.latency, batch_size=ARGS.batch_size,
+        coordinate=ARGS.coordinate, stale=ARGS.stale, pyramid=ARGS.pyramid)
+
+
+# This function handles the 'worker' subcommand
+def cli_worker():
+    Database().work(ARGS.n_expnums, ARGS.max_expnums, stale=ARGS.stale)
+
+
+# This function initializes a database
+def init_database():
     # Check if a database already exists in this folder
     check_database_exists(False)
 
@@ -111,13 +788,77 @@ def cli_init():
     os.mkdir(ARGS.mld)
 
     # Update the database
-    cli_update()
+    update_database()
+
+
+# This function handles the 'export' subcommand
+def cli_export():
+    # Import export_database
+    from mldatabase.export import export_database
+
+    # Export the database
+    print(f"Exporting micro-lensing database in {ARGS.dir!r} to "
+          f"{ARGS.output!r}.")
+    try:
+        n_rows = export_database(
+            ARGS.output, ARGS.dir, ARGS.columns, fmt=ARGS.format,
+            expnums=ARGS.expnums, objid_range=ARGS.objid_range,
+            hjd_range=ARGS.hjd_range, batch_size=ARGS.batch_size,
+            n_partitions=ARGS.partitions)
+    except (ImportError, OSError, ValueError) as error:
+        raise_error(str(error))
+
+    # Print the number of exported rows
+    print(f"Exported {n_rows:,} rows.")
+
+
+# This function handles the 'federate' subcommand
+def cli_federate():
+    # Import Federation
+    from mldatabase.federation import Federation
+
+    # Combine all provided databases
+    try:
+        fed = Federation(ARGS.dirs, ARGS.threads)
+    except (OSError, ValueError) as error:
+        raise_error(str(error))
+
+    # If objids were provided, print their light curves
+    if ARGS.objids is not None:
+        data = fed.light_curves(ARGS.objids, ARGS.columns)
+        with pd.option_context('display.max_rows', None,
+                               'display.width', None):
+            print(data if len(data) else "No rows found.")
+        return
+
+    # Else, obtain the statistics of every database
+    def get_stats(db):
+        with h5py.File(path.join(db.mld, MASTER_FILE), 'r') as m_file:
+            return(m_file.attrs['n_expnums'], m_file.attrs['n_objids'],
+                   int(m_file['objids']['count'].sum()))
+    stats = fed.map(get_stats)
+
+    # Obtain the number of unique objects in all databases
+    n_objids = len(fed.objid_counts()[0])
+
+    # Print the statistics of every database and their combination
+    width = max(len(db.dir) for db in fed)
+    print(f"{'DIR': <{width}}\t{'# of exposures':>14}\t"
+          f"{'# of objects':>14}\t{'# of rows':>14}")
+    print('='*(width+48))
+    for db, (n_exps, n_objs, n_rows) in zip(fed, stats):
+        print(f"{db.dir: <{width}}\t{n_exps:>14,}\t{n_objs:>14,}\t"
+              f"{n_rows:>14,}")
+    print('-'*(width+48))
+    print(f"{'Combined': <{width}}\t{sum(x[0] for x in stats):>14,}\t"
+          f"{n_objids:>14,}\t{sum(x[2] for x in stats):>14,}")
 
 
 # This function handles the 'ipython' subcommand
 def cli_ipython():
     # Open the database
-    with open_database() as df:
+    with open_database(cache_dir=ARGS.cache_dir,
+                       cache_size=ARGS.cache_size) as df:
         # Create user namespace dictionary
         user_ns = {'df': df}
 
@@ -146,8 +887,8 @@ def cli_ipython():
             user_ns=user_ns)
 
 
-# This function handles the 'reset' subcommand
-def cli_reset():
+# This function deletes and reinitializes a database
+def reset_database():
     # Check if a database already exists in this folder
     check_database_exists(True)
 
@@ -164,7 +905,7 @@ def cli_reset():
     shutil.rmtree(ARGS.mld)
 
     # Initialize the database
-    cli_init()
+    init_database()
 
 
 # This function handles the 'status' subcommand
@@ -188,10 +929,7 @@ def cli_status():
 
         # Obtain database size
         mld_size = path.getsize(ARGS.master_exp_file)
-        size_order = int(np.log2(mld_size)//10) if mld_size else 0
-        size_val = mld_size/(1 << (size_order*10))
-        size_suffix = SIZE_SUFFIXES[size_order]
-        stat_list.append(('Size', f"{size_val:,.1f} {size_suffix}"))
+        stat_list.append(('Size', format_size(mld_size)))
 
         # Add 'last updated' stat
         mtime = time.localtime(path.getmtime(ARGS.master_exp_file))
@@ -203,6 +941,29 @@ def cli_status():
             # Obtain relevant statistics
             stat_list.append(('# of exposures', m_file.attrs['n_expnums']))
             stat_list.append(('# of known objects', m_file.attrs['n_objids']))
+            stat_list.append(('Version', m_file.attrs.get('db_version', 0)))
+
+            # Import read_sketch
+            from mldatabase.sketches import read_sketch
+
+            # Obtain the approximate statistics of all sketched exposures
+            records = m_file['expnums'][()]
+            if 'row_start' in records.dtype.names:
+                records = records[records['row_start'] >= 0]
+                sketch = read_sketch(m_file, records, sample_size=0)
+            else:
+                sketch = None
+
+        # Add the approximate statistics if there are any
+        if sketch is not None and sketch.n_expnums:
+            stat_list.append(('Statistics (approximate)',))
+            stat_list.append(('# of sketched exposures', sketch.n_expnums))
+            stat_list.append(('# of distinct objects', sketch.n_objids))
+            for name, fmt in [('mag', '.2f'), ('magerr', '.4f')]:
+                q05, q50, q95 = sketch.quantiles(name, [0.05, 0.5, 0.95])
+                stat_list.append((f'Median {name}', f"{q50:{fmt}}"))
+                stat_list.append((f'{name} 5%-95%',
+                                  f"{q05:{fmt}} - {q95:{fmt}}"))
 
     # Determine the maximum length of all keys
     width = max([len(stat[0]) for stat in stat_list if (len(stat) == 2)])
@@ -240,8 +1001,37 @@ def cli_status():
     print(status_str)
 
 
-# This function handles the 'update' subcommand
-def cli_update():
+# This function handles the 'xmatch' subcommand
+def cli_xmatch():
+    # Import xmatch
+    from mldatabase.crossmatch import xmatch
+
+    # Read the catalog and cross-match it against the database
+    try:
+        catalog = pd.read_csv(ARGS.catalog,
+                              usecols=[ARGS.ra_col, ARGS.decl_col])
+        matches = xmatch(catalog[ARGS.ra_col], catalog[ARGS.decl_col],
+                         ARGS.radius, ARGS.dir, nearest=not ARGS.all,
+                         n_threads=ARGS.threads)
+    except (OSError, ValueError) as error:
+        raise_error(str(error))
+
+    # Write the matches to the output file if one was provided
+    if ARGS.output is not None:
+        matches.to_csv(ARGS.output, index=False)
+        print(f"Wrote {len(matches):,} matches of "
+              f"{matches['index'].nunique():,} of {len(catalog):,} sources "
+              f"to {ARGS.output!r}.")
+
+    # Else, print them
+    else:
+        with pd.option_context('display.max_rows', None,
+                               'display.width', None):
+            print(matches if len(matches) else "No matches found.")
+
+
+# This function updates a database
+def update_database():
     # Check if a database already exists in this folder
     check_database_exists(True)
 
@@ -251,10 +1041,17 @@ def cli_update():
     # Determine all files in the database directory as a string
     mld_files_str = str(next(os.walk(ARGS.mld))[2])
 
+    # When coordinating workers, their lock-files are allowed to exist
+    if getattr(ARGS, 'coordinate', False):
+        mld_files_str = re.sub(r"\.mld_worker_[^']*\.lock", '',
+                               mld_files_str)
+
     # If the database exists, make sure currently no lock files exist
     if '.lock' in mld_files_str:
         # If a lock-file already exists, raise proper error
-        if '.mld_update.lock' in mld_files_str:
+        if('.mld_update.lock' in mld_files_str or
+           '.mld_watch.lock' in mld_files_str or
+           '.mld_coordinate.lock' in mld_files_str):
             raise_error(f"Database in provided DIR {ARGS.dir!r} is currently "
                         f"already being updated by a different process! Update"
                         f" is not possible!")
@@ -262,56 +1059,422 @@ def cli_update():
             raise_error(f"Database in provided DIR {ARGS.dir!r} is currently "
                         f"being accessed! Update is not possible!")
 
-    # Create the lock-file
+    # Check if the database must be watched
+    if getattr(ARGS, 'watch', False):
+        watch_database()
+
+    # Check if workers must be coordinated
+    elif getattr(ARGS, 'coordinate', False):
+        coordinate_workers()
+
+    # Else, perform a single update
+    else:
+        run_update(lock_file, perform_update)
+
+
+# This function processes exposures for a coordinating process
+def run_worker():
+    # Check if a database already exists in this folder
+    check_database_exists(True)
+
+    # Determine all files in the database directory as a string
+    mld_files_str = str(next(os.walk(ARGS.mld))[2])
+
+    # Make sure that the database is not being updated without coordination
+    if(('.mld_update.lock' in mld_files_str or
+        '.mld_watch.lock' in mld_files_str) and
+       '.mld_coordinate.lock' not in mld_files_str):
+        raise_error(f"Database in provided DIR {ARGS.dir!r} is currently "
+                    f"being updated without coordination! Processing "
+                    f"exposures is not possible!")
+
+    # Create the lock-file of this worker, which prevents normal updates
+    lock_file = path.join(ARGS.mld, f".mld_worker_{get_worker_id()}.lock")
     os.mknod(lock_file)
 
+    # Create a disabled profiler, as processing is not profiled
+    ARGS.profiler = UpdateProfiler(False)
+
+    # Initialize the number of exposures this worker processed
+    n_processed = 0
+    print(f"Worker {get_worker_id()!r} is processing exposures in "
+          f"{ARGS.dir!r}.")
+
     # Wrap in try-statement to ensure lock-file is removed afterward
     try:
-        # Perform the update
-        perform_update()
+        # Keep claiming exposures until all have been claimed
+        while(ARGS.max_expnums is None or n_processed < ARGS.max_expnums):
+            # Determine which exposures require processing
+            # The master file cannot be read while the coordinator writes it
+            try:
+                exp_dict = get_pending_exp_dict()
+            except OSError:
+                time.sleep(1)
+                continue
+            claimed = None
+
+            # Loop over all pending exposures and claim the first available
+            for expnum, exp_files in exp_dict.items():
+                claimed = claim_exposure(ARGS.mld, expnum, ARGS.stale)
+                if claimed is not None:
+                    break
+
+            # If no exposure could be claimed, all of them have been
+            if claimed is None:
+                break
+
+            # Keep the claim and lock-file alive while processing
+            heartbeat = Heartbeat([claimed, lock_file], ARGS.stale/4)
+            heartbeat.start()
+
+            # Process the claimed exposure and report it to the coordinator
+            try:
+                print(f"Processing exposure {expnum}.")
+                process_exp_files(expnum, exp_files, report=True)
+                n_processed += 1
+
+            # Release the claim
+            finally:
+                heartbeat.stop()
+                os.remove(claimed)
+
+    # If a KeyboardInterrupt is raised, stop processing
+    except KeyboardInterrupt:
+        print("WARNING: Processing has been interrupted.")
 
     # Remove lock-file
     finally:
         os.remove(lock_file)
 
+    # Print the number of processed exposures
+    print(f"Worker {get_worker_id()!r} processed {n_processed:,} exposures.")
+
 
 # %% FUNCTION DEFINITIONS
-# This function processes the exp_dir provided through a function
-def get_dirs(exp_dir=None):
-    # Check if ARGS is available
+# This function returns the arguments of the current thread
+def get_args():
+    # Create empty arguments if this thread has none yet
+    if not hasattr(_LOCAL, 'args'):
+        _LOCAL.args = argparse.Namespace()
+
+    # Return the arguments
+    return(_LOCAL.args)
+
+
+# This function sets the arguments of the current thread
+def set_args(args):
+    # If args is None, remove the arguments of this thread
+    if args is None:
+        _LOCAL.__dict__.pop('args', None)
+    else:
+        _LOCAL.args = args
+
+
+# This function performs a single update while holding the update-lock file
+def run_update(lock_file, func, *args):
+    # Create the lock-file
+    os.mknod(lock_file)
+
+    # Create the profiler for this update
+    ARGS.profiler = UpdateProfiler(ARGS.profile)
+    completed = False
+
+    # Wrap in try-statement to ensure lock-file is removed afterward
     try:
-        mld = ARGS.mld
-        exp_dir = ARGS.dir
+        # Perform the update
+        func(*args)
+        completed = True
 
-    # If it is not, obtain the mld directory manually
-    except AttributeError:
-        # Determine directory path
-        ARGS.dir = path.abspath(exp_dir if exp_dir else '.')
+    # Remove lock-file and write the profile if requested
+    finally:
+        os.remove(lock_file)
+        if ARGS.profile:
+            profile_file = ARGS.profiler.dump(ARGS.mld,
+                                              n_expnums=ARGS.n_expnums,
+                                              completed=completed)
+            print(f"Profile of this update was written to {profile_file!r}.")
 
-        # Check if provided dir exists
-        if not path.exists(ARGS.dir):
-            # If not, raise error
-            raise OSError(f"Provided DIR {ARGS.dir!r} does not exist!")
 
-        # Obtain absolute path to database
-        ARGS.mld = path.join(ARGS.dir, MLD_NAME)
-        ARGS.master_file = path.join(ARGS.mld, MASTER_FILE)
-        ARGS.master_exp_file = path.join(ARGS.mld, MASTER_EXP_FILE)
+# This function continuously updates the database with new exposures
+def watch_database():
+    """
+    Watches DIR for new and modified exposure files and adds them to the
+    database in micro-batches, until interrupted.
+
+    An exposure is considered complete once the sizes and last-modified times
+    of both of its files have not changed for `ARGS.settle` seconds.
+    Complete exposures are added to the database as soon as `ARGS.batch_size`
+    of them are available, or when waiting any longer would cause the oldest
+    one to miss the `ARGS.latency` target (taking into account how long the
+    previous batch took).
+    The update-lock file is only held while a batch is being added, such that
+    the database can be accessed in between batches.
+    Every batch is appended to the master exposure file in place (see
+    :func:`~merge_temp_files`), such that the time it takes to add a batch
+    depends on the size of the batch rather than that of the database.
+
+    """
+
+    # Determine paths to the update-lock and watch-lock files
+    lock_file = path.join(ARGS.mld, '.mld_update.lock')
+    watch_lock_file = path.join(ARGS.mld, '.mld_watch.lock')
+
+    # Try to set up inotify to be woken up when files in DIR change
+    try:
+        from inotify_simple import INotify, flags
+    except ImportError:
+        inotify = None
+    else:
+        inotify = INotify()
+        inotify.add_watch(ARGS.dir, flags.CLOSE_WRITE | flags.MOVED_TO |
+                          flags.CREATE | flags.MODIFY)
+
+    # Initialize dicts of pending exposures and when they became complete
+    pending = {}
+    ready_since = {}
+
+    # Initialize the duration of the last batch and the known exposures
+    batch_time = 0
+    expnums_known = get_known_expnums()
+    waiting = False
 
-        # Set CLI_flag to False
-        ARGS.CLI_flag = False
+    # Print that the database is being watched
+    print(f"Watching {ARGS.dir!r} for new exposures (using "
+          f"{'inotify' if inotify else 'polling'}). Press Ctrl-C to stop.")
 
-        # Obtain mld and exp_dir
-        mld = ARGS.mld
-        exp_dir = ARGS.dir
+    # Create the watch-lock file, preventing other updates in between batches
+    os.mknod(watch_lock_file)
 
-    # Return mld and exp_dir
-    return(mld, exp_dir)
+    # Wrap in try-statement to ensure watch-lock file is removed afterward
+    try:
+        while True:
+            # Keep the watch-lock file from becoming stale
+            os.utime(watch_lock_file)
+
+            # Obtain all exposures that are currently in DIR
+            now = time.time()
+            exp_dict = get_exp_dict()
+
+            # Determine which exposures are missing or outdated
+            for expnum, exp_files in exp_dict.items():
+                # Obtain the sizes and last-modified times of both files
+                try:
+                    stats = tuple((st.st_size, st.st_mtime)
+                                  for st in map(os.stat, exp_files))
+                except FileNotFoundError:
+                    continue
+
+                # Skip this exposure if it is known and up-to-date
+                mtime = expnums_known.get(expnum)
+                if mtime is not None and int(stats[0][1]) <= mtime:
+                    pending.pop(expnum, None)
+                    ready_since.pop(expnum, None)
+                    continue
+
+                # If the files changed, (re)start waiting for them to settle
+                if(pending.get(expnum, (None,))[0] != stats):
+                    pending[expnum] = (stats, now)
+                    ready_since.pop(expnum, None)
+
+                # If the files have settled, the exposure is complete
+                elif(now-pending[expnum][1] >= ARGS.settle):
+                    ready_since.setdefault(expnum, now)
+
+            # Remove pending exposures whose files disappeared
+            for expnum in set(pending).difference(exp_dict):
+                pending.pop(expnum)
+                ready_since.pop(expnum, None)
+
+            # Check if a batch must be added to the database
+            if ready_since and(
+                    len(ready_since) >= ARGS.batch_size or
+                    now-min(ready_since.values())+batch_time >= ARGS.latency):
+                # If the database is being accessed, wait until it is not
+                if glob(path.join(ARGS.mld, '.mld_access_*.lock')):
+                    if not waiting:
+                        print("Database is currently being accessed. Waiting "
+                              "until it is closed before adding new "
+                              "exposures.")
+                    waiting = True
+                else:
+                    # Select the exposures that have been complete longest
+                    expnums = sorted(ready_since, key=ready_since.get)
+                    expnums = expnums[:ARGS.batch_size]
+
+                    # Add them to the database
+                    waiting = False
+                    batch_start = time.time()
+                    run_update(lock_file, perform_update,
+                               {expnum: exp_dict[expnum]
+                                for expnum in expnums})
+                    batch_time = time.time()-batch_start
+
+                    # Update which exposures are known
+                    expnums_known = get_known_expnums()
+                    for expnum in expnums:
+                        ready_since.pop(expnum)
+                    print(f"Added {len(expnums):,} exposures in "
+                          f"{batch_time:,.1f} seconds. Watching for new "
+                          f"exposures.")
+                    continue
+
+            # Determine how long to wait until the next deadline
+            timeout = ARGS.interval
+            for expnum, (_, changed) in pending.items():
+                if expnum not in ready_since:
+                    timeout = min(timeout, changed+ARGS.settle-now)
+            if ready_since:
+                timeout = min(timeout, min(ready_since.values()) +
+                              ARGS.latency-batch_time-now)
+            timeout = max(timeout, 1 if waiting else 0.1)
+
+            # Wait for changes in DIR or until the timeout has passed
+            if inotify is not None:
+                inotify.read(timeout=int(timeout*1000), read_delay=100)
+            else:
+                time.sleep(timeout)
+
+    # If a KeyboardInterrupt is raised, stop watching
+    except KeyboardInterrupt:
+        print("\nStopped watching for new exposures.")
+
+    # Remove the watch-lock file
+    finally:
+        os.remove(watch_lock_file)
+        if inotify is not None:
+            inotify.close()
+
+
+# This function merges all exposures that were processed by workers
+def coordinate_workers():
+    """
+    Coordinates all workers that process exposures with ``mld worker`` (on
+    this or any other node that shares DIR), until all of them have finished.
+
+    Every `ARGS.interval` seconds, all exposures that were reported by the
+    workers are registered in the master file and merged into the database.
+    Claims, partial files and lock-files of workers that have not shown any
+    sign of life for `ARGS.stale` seconds are expired, such that their
+    exposures can be claimed by other workers.
+    Coordinating stops once no exposures in DIR require processing anymore
+    and all processed exposures have been merged.
+
+    """
+
+    # Determine paths to the update-lock and coordinate-lock files
+    lock_file = path.join(ARGS.mld, '.mld_update.lock')
+    coord_lock_file = path.join(ARGS.mld, '.mld_coordinate.lock')
+
+    # Print that workers are being coordinated
+    print(f"Coordinating workers for {ARGS.dir!r}. Start workers with "
+          f"'mld -d {ARGS.dir} worker'.")
+
+    # Create the coordinate-lock file
+    os.mknod(coord_lock_file)
+
+    # Wrap in try-statement to ensure coordinate-lock file is removed
+    try:
+        while True:
+            # Keep the coordinate-lock file from becoming stale
+            os.utime(coord_lock_file)
+
+            # Expire everything of workers that have crashed
+            expire_stale_files(ARGS.mld, ARGS.stale)
+
+            # Merge all exposures that were reported, as well as those of
+            # workers that were interrupted before reporting them
+            expnums_temp = set(map(get_temp_expnum, glob(path.join(
+                ARGS.mld, TEMP_EXP_FILE.replace('{}', '*')))))
+            if(read_reports(ARGS.mld) or expnums_temp.difference(
+                    get_active_claims(ARGS.mld, ARGS.stale))):
+                run_update(lock_file, perform_update, {})
+
+            # If no exposures require processing anymore, stop coordinating
+            elif not (get_active_claims(ARGS.mld, ARGS.stale) or
+                      get_pending_exp_dict()):
+                break
+
+            # Wait before checking again
+            time.sleep(ARGS.interval)
+
+    # If a KeyboardInterrupt is raised, stop coordinating
+    except KeyboardInterrupt:
+        print("\nStopped coordinating workers.")
+
+    # Remove the coordinate-lock file
+    finally:
+        os.remove(coord_lock_file)
+
+    # Print that coordination has finished
+    print("All exposures have been processed.")
+
+
+# This function returns the last-modified times of all known exposures
+def get_known_expnums():
+    # If the master file does not exist yet, no exposures are known
+    if not path.exists(ARGS.master_file):
+        return({})
+
+    # Open the master file
+    with h5py.File(ARGS.master_file, 'r') as m_file:
+        # If the exposures dataset does not exist yet, no exposures are known
+        if 'expnums' not in m_file:
+            return({})
+
+        # Obtain all known exposures
+        expnums = m_file['expnums'][()]
+
+    # Return the last-modified times of all known exposures
+    return(dict(zip(expnums['expnum'].tolist(),
+                    expnums['last_modified'].tolist())))
+
+
+# This function returns all exposures that are missing or outdated
+def get_pending_exp_dict():
+    # Obtain all known and all available exposures
+    expnums_known = get_known_expnums()
+    exp_dict = get_exp_dict(ARGS.n_expnums)
+
+    # Initialize empty dict of pending exposures
+    pending_dict = {}
+
+    # Loop over all available exposures
+    for expnum, exp_files in exp_dict.items():
+        # Skip this exposure if it is known and up-to-date
+        mtime = expnums_known.get(expnum)
+        if(mtime is not None and int(path.getmtime(exp_files[0])) <= mtime):
+            continue
+
+        # Skip this exposure if it was processed but not merged yet
+        if path.exists(path.join(ARGS.mld, TEMP_EXP_FILE.format(expnum))):
+            continue
+
+        # Add it to pending_dict
+        pending_dict[expnum] = exp_files
+
+    # Return pending_dict
+    return(pending_dict)
+
+
+# This function returns all exposure files in DIR
+def get_exp_dict(n_expnums=None):
+    # Obtain sorted string of all files available
+    filenames = str(sorted(next(os.walk(ARGS.dir))[2]))
+
+    # Create a regex iterator
+    re_iter = re.finditer(EXP_REGEX, filenames)
+
+    # Create dict with up to n_expnums exposure files
+    exp_dict = {int(m['expnum']): (path.join(ARGS.dir, m['exp_file']),
+                                   path.join(ARGS.dir, m['xtr_file']))
+                for m in islice(re_iter, n_expnums)}
+
+    # Return exp_dict
+    return(exp_dict)
 
 
 # This function returns a context manager used for opening and closing database
-@contextmanager
-def open_database(exp_dir=None):
+def open_database(exp_dir=None, *, cache_dir=None, cache_size=None):
     """
     Context manager for accessing an existing micro-lensing database in the
     provided `exp_dir` as a :obj:`~vaex.dataframe.DataFrame` object.
@@ -327,56 +1490,102 @@ def open_database(exp_dir=None):
         If *None*, the current working directory is used.
         This argument is equivalent to the optional `-d`/`--dir` argument when
         using the command-line interface.
+    cache_dir : str or None. Default: None
+        The path to a directory on a node-local disk in which a copy of the
+        database is cached, which is shared by all processes on the node.
+        If *None*, the 'MLDATABASE_CACHE_DIR' environment variable is used,
+        and the database is not cached if it is not set either.
+    cache_size : int, str or None. Default: None
+        The maximum size of the cache in bytes (e.g., '100GiB'), after which
+        the least-recently-used copies are evicted.
+        If *None*, the 'MLDATABASE_CACHE_SIZE' environment variable is used,
+        and the cache is only limited by the free disk space if it is not set
+        either.
 
     Yields
     ------
     df : :obj:`~vaex.dataframe.DataFrame` object
         The vaex DataFrame that contains all of the data stored in the database
         in `exp_dir`.
+        The exposure data stored in the master file (e.g., 'filter' and
+        'skypc2') is available as virtual columns, which are looked up per
+        chunk from the 'expnum' column without being stored per row.
+        As 'filter' is also a DataFrame method, use ``df['filter']`` to access
+        the filter column.
 
     """
 
-    # Obtain mld and exp_dir
-    mld, exp_dir = get_dirs(exp_dir)
+    # Return the context manager of this database
+    return(Database(exp_dir).open(cache_dir=cache_dir, cache_size=cache_size))
 
-    # Check that database file exists
-    check_database_exists(True)
 
-    # If so, make sure that the update-lock file does not exist
-    if path.exists(path.join(mld, '.mld_update.lock')):
-        # If the update-lock file does exist, raise error and exit
-        raise_error(f"Database in provided DIR {exp_dir!r} is currently "
-                    f"being updated! Access is not possible!")
+# This function provides the master exposure file of a database
+@contextmanager
+def cached_exp_file(mld, cache_dir=None, cache_size=None):
+    """
+    Context manager that yields the path to the master exposure file of the
+    database in `mld`, or to its copy in the node-local `cache_dir`.
+
+    See :func:`~open_database` for all arguments.
 
-    # Obtain list of non-merged exposures
-    temp_files = glob(path.join(mld, TEMP_EXP_FILE.replace('{}', '*')))
+    """
 
-    # If temp_files is not empty, raise warning
-    if temp_files:
-        print(f"WARNING: Database in provided DIR {exp_dir!r} was interrupted "
-              f"during last update. It can be accessed, but it is recommended "
-              f"to finish the update with 'mld update -n 0' first!")
+    # Obtain the cache options from the environment if not provided
+    if cache_dir is None:
+        cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if cache_size is None:
+        cache_size = os.environ.get(CACHE_SIZE_ENV)
+    if isinstance(cache_size, str):
+        cache_size = parse_size(cache_size)
 
-    # Obtain the path to the master exposure file
-    master_exp_file = path.join(mld, MASTER_EXP_FILE)
+    # Obtain the version of the database, which validates its copies
+    with h5py.File(path.join(mld, MASTER_FILE), 'r') as m_file:
+        version = int(m_file.attrs.get('db_version', 0))
 
-    # Import vaex
-    import vaex
+    # Yield the master exposure file
+    with cached_file(path.join(mld, MASTER_EXP_FILE), version, cache_dir,
+                     cache_size) as exp_file:
+        yield exp_file
 
-    # Open a lock-file
-    with NamedTemporaryFile(suffix='.lock', prefix='.mld_access_', dir=mld):
-        # Wrap within try-finally statement
-        try:
-            # Open the database
-            df = vaex.open(master_exp_file)
 
-            # Yield the database
-            yield df
+# This function adds the exposure data of every row as virtual columns
+def add_exposure_columns(df, expnums):
+    """
+    Adds all fields in the provided `expnums` array that are not a column of
+    the provided :obj:`~vaex.dataframe.DataFrame` `df` yet as virtual columns.
 
-        # After context manager returns, clean up
-        finally:
-            # Close database
-            df.close()
+    The values of every row are obtained with a vectorized lookup of its
+    'expnum' in `expnums`, such that no per-row copy of them is stored.
+
+    """
+
+    # Sort the exposures on expnum
+    expnums = np.sort(expnums, order='expnum')
+    keys = expnums['expnum']
+
+    # Create a lookup function for the provided values
+    def make_lookup(values):
+        # This function returns the values of all provided expnums
+        def lookup(expnum):
+            index = np.searchsorted(keys, np.asarray(expnum))
+            return(values[index.clip(max=len(keys)-1)])
+        return(lookup)
+
+    # Loop over all fields in expnums
+    for name in expnums.dtype.names:
+        # Skip all fields that already exist and all bookkeeping fields
+        if(name in df.get_column_names() or
+           name in ('last_modified', 'row_start', 'row_stop')):
+            continue
+
+        # Obtain the values of this field, decoding strings
+        values = expnums[name]
+        if(values.dtype.kind == 'S'):
+            values = values.astype(str)
+
+        # Add the lookup as a function and use it for a virtual column
+        df.add_function(f'_exp_{name}', make_lookup(values))
+        df.add_virtual_column(name, f'_exp_{name}(expnum)')
 
 
 # This function returns a Counter object with the number of objid data points
@@ -403,88 +1612,331 @@ def get_objid_counter(exp_dir=None):
 
     """
 
-    # Obtain mld and exp_dir
-    mld, exp_dir = get_dirs(exp_dir)
+    # Return the counter of this database
+    return(Database(exp_dir).counter())
 
-    # Open the master hdf5-file
+
+# This function returns the expnums of all exposures that must be excluded
+def get_excluded_expnums(exp_dir=None, *, min_rows=None, max_mag_median=None,
+                         max_magerr_median=None, max_contam_frac=None,
+                         max_fitsky_median=None):
+    """
+    Accesses an existing micro-lensing database in the provided `exp_dir` and
+    returns the expnums of all exposures whose quality statistics, which are
+    computed when the exposures are processed, fail the provided criteria.
+
+    The returned expnums can be cheaply excluded from a query with, e.g.,
+    ``df[~df.expnum.isin(excluded)]``.
+    The statistics themselves are available as virtual columns in the
+    DataFrame yielded by :func:`~open_database`.
+
+    Optional
+    --------
+    exp_dir : str or None. Default: None
+        The relative or absolute path to the directory that contains an
+        existing micro-lensing database.
+        If *None*, the current working directory is used.
+        This argument is equivalent to the optional `-d`/`--dir` argument when
+        using the command-line interface.
+    min_rows : int or None. Default: None
+        Exclude all exposures with fewer than `min_rows` detections.
+    max_mag_median : float or None. Default: None
+        Exclude all exposures with a median 'mag' above `max_mag_median`.
+    max_magerr_median : float or None. Default: None
+        Exclude all exposures with a median 'magerr' above
+        `max_magerr_median`.
+    max_contam_frac : float or None. Default: None
+        Exclude all exposures in which the fraction of detections with a
+        finite 'contam' that have a non-zero 'contam' is above
+        `max_contam_frac`.
+    max_fitsky_median : float or None. Default: None
+        Exclude all exposures with a median 'fitsky' above
+        `max_fitsky_median`.
+
+    Returns
+    -------
+    excluded : :obj:`~numpy.ndarray` object
+        Sorted array containing the expnums of all excluded exposures.
+        Exposures whose statistics are unknown (because they were processed by
+        an older version of MLDatabase) are never excluded.
+
+    """
+
+    # Return the excluded expnums of this database
+    return(Database(exp_dir).excluded_expnums(
+        min_rows=min_rows, max_mag_median=max_mag_median,
+        max_magerr_median=max_magerr_median, max_contam_frac=max_contam_frac,
+        max_fitsky_median=max_fitsky_median))
+
+
+# This function determines the excluded exposures of the current database
+def find_excluded_expnums(min_rows=None, max_mag_median=None,
+                          max_magerr_median=None, max_contam_frac=None,
+                          max_fitsky_median=None):
+    # Open the master hdf5-file
+    with h5py.File(ARGS.master_file, 'r') as file:
+        # Obtain the expnums dataset
+        expnums = file['expnums'][()]
+
+    # Initialize the mask of excluded exposures
+    mask = np.zeros(expnums.shape, dtype=bool)
+
+    # Exclude all exposures with too few detections
+    if min_rows is not None and 'n_rows' in expnums.dtype.names:
+        n_rows = expnums['n_rows']
+        mask |= (n_rows >= 0) & (n_rows < min_rows)
+
+    # Exclude all exposures with statistics above the provided maximums
+    for name, max_value in [('mag_median', max_mag_median),
+                            ('magerr_median', max_magerr_median),
+                            ('contam_frac', max_contam_frac),
+                            ('fitsky_median', max_fitsky_median)]:
+        if max_value is not None and name in expnums.dtype.names:
+            mask |= expnums[name] > max_value
+
+    # Return the sorted excluded expnums
+    return(np.sort(expnums['expnum'][mask]))
+
+
+# This function returns the rows of a selection of exposures
+def get_row_slices(exp_dir=None, expnums=None, *, filters=None,
+                   hjd_range=None):
+    """
+    Accesses an existing micro-lensing database in the provided `exp_dir` and
+    returns the slices of all rows in its master exposure file that belong to
+    the exposures selected by all provided arguments.
+
+    The rows of every exposure are obtained from the row index in the master
+    file, which is kept up-to-date by every update. Selecting exposures
+    therefore never requires reading the 'expnum' or 'hjd' columns.
+
+    Optional
+    --------
+    exp_dir : str or None. Default: None
+        The relative or absolute path to the directory that contains an
+        existing micro-lensing database.
+        If *None*, the current working directory is used.
+        This argument is equivalent to the optional `-d`/`--dir` argument when
+        using the command-line interface.
+    expnums : list of int or None. Default: None
+        Select solely the exposures with these expnums.
+    filters : str, list of str or None. Default: None
+        Select solely the exposures that were taken with one of these filter
+        bands.
+    hjd_range : tuple of float or None. Default: None
+        Select solely the exposures whose 'hjd' lies within this
+        (inclusive) range.
+
+    Returns
+    -------
+    row_slices : list of :obj:`~slice` objects
+        The sorted slices of all selected rows, where the rows of exposures
+        that follow each other are combined into a single slice.
+        These can be used directly to index the columns provided by, e.g.,
+        :func:`~mldatabase.open_columns`.
+
+    """
+
+    # Return the row slices of this database
+    return(Database(exp_dir).row_slices(expnums, filters=filters,
+                                        hjd_range=hjd_range))
+
+
+# This function selects exposures from their records
+def select_exposures(records, expnums=None, filters=None, hjd_range=None):
+    """
+    Returns a mask of all exposure `records` in the 'expnums' dataset that
+    satisfy the provided criteria.
+
+    See :func:`~get_row_slices` for all criteria.
+
+    """
+
+    # Initialize the mask of selected exposures
+    mask = np.ones(records.shape, dtype=bool)
+
+    # Select all exposures that satisfy the provided criteria
+    if expnums is not None:
+        mask &= np.isin(records['expnum'], expnums)
+    if filters is not None:
+        filters = [filters] if isinstance(filters, (str, bytes)) else filters
+        filters = [value.encode() if isinstance(value, str) else value
+                   for value in filters]
+        mask &= np.isin(records['filter'], filters)
+    if hjd_range is not None:
+        mask &= (records['hjd'] >= hjd_range[0])
+        mask &= (records['hjd'] <= hjd_range[1])
+
+    # Return the mask
+    return(mask)
+
+
+# This function determines the rows of exposures in the current database
+def find_row_slices(expnums=None, filters=None, hjd_range=None):
+    # Open the master hdf5-file
     with h5py.File(ARGS.master_file, 'r') as file:
-        # Obtain the objids dataset
-        objids = file['objids'][()]
+        # Obtain the expnums dataset
+        records = file['expnums'][()]
+
+    # Check that the database has a row index
+    if 'row_start' not in records.dtype.names:
+        raise_error(f"Database in provided DIR {ARGS.dir!r} has no row "
+                    f"index yet! Create it with 'mld update -n 0' first!")
+
+    # Select all exposures that have rows and satisfy the provided criteria
+    mask = records['row_start'] >= 0
+    mask &= select_exposures(records, expnums, filters, hjd_range)
 
-    # Create empty counter
-    counter = Counter()
+    # Obtain the row ranges of all selected exposures, sorted on their rows
+    records = np.sort(records[mask], order=['row_start', 'row_stop'])
 
-    # Add objids to it
-    counter.update(dict(zip(objids['objid'], objids['count'])))
+    # Combine the ranges that follow each other into slices
+    row_slices = []
+    for start, stop in zip(records['row_start'].tolist(),
+                           records['row_stop'].tolist()):
+        if row_slices and (row_slices[-1].stop == start):
+            row_slices[-1] = slice(row_slices[-1].start, stop)
+        elif(start < stop):
+            row_slices.append(slice(start, stop))
 
-    # Return counter
-    return(counter)
+    # Return the row slices
+    return(row_slices)
 
 
 # This function performs the update process
-def perform_update():
+def perform_update(exp_dict=None):
     # Print that database is being updated
     print(f"Updating micro-lensing database in {ARGS.dir!r}.")
 
-    # Open the master HDF5-file, creating it if it does not exist yet
-    with h5py.File(ARGS.master_file, mode='a') as m_file:
-        # Set the version of MLDatabase
-        m_file.attrs['version'] = __version__
-
-        # Obtain what exposures the database knows about
-        n_expnums_known = m_file.attrs.setdefault('n_expnums', 0)
-        expnums_dset =\
-            m_file.require_dataset('expnums',
-                                   shape=(n_expnums_known,),
-                                   dtype=[*list(XTR_HEADER.items())[:-1],
-                                          ('last_modified', int)],
-                                   maxshape=(None,))
-        expnums_known = expnums_dset[:]
-
-    # Obtain sorted string of all files available
-    filenames = str(sorted(next(os.walk(ARGS.dir))[2]))
+    # Obtain the profiler of this update
+    profiler = ARGS.profiler
+
+    # Roll forward from the last step of an interrupted update if required
+    expnums_pending = recover_journal()
+
+    # Determine all exposures in DIR and which ones require processing
+    with profiler.stage('scan') as counters:
+        # Open the master HDF5-file, creating it if it does not exist yet
+        with h5py.File(ARGS.master_file, mode='a') as m_file:
+            # Set the version of MLDatabase
+            m_file.attrs['version'] = __version__
+            m_file.attrs.setdefault('db_version', 0)
+
+            # Obtain what exposures the database knows about
+            n_expnums_known = m_file.attrs.setdefault('n_expnums', 0)
+            migrate_expnums(m_file)
+            expnums_dset =\
+                m_file.require_dataset('expnums',
+                                       shape=(n_expnums_known,),
+                                       dtype=EXPNUMS_DTYPE,
+                                       maxshape=(None,))
+
+            # Obtain all exposures that are currently being processed by
+            # workers, before reading their reports, such that an exposure
+            # that finishes in between is still considered to be claimed
+            expnums_claimed = set(get_active_claims(
+                ARGS.mld, getattr(ARGS, 'stale', 600)))
+
+            # Register all exposures that were processed by workers
+            reports = []
+            expnums_reported = set()
+            expnums_replaced = []
+            for report_file, record in read_reports(ARGS.mld):
+                # Remove this report if its temporary file no longer exists
+                if not path.exists(path.join(ARGS.mld, TEMP_EXP_FILE.format(
+                        record['expnum']))):
+                    os.remove(report_file)
+                    continue
+
+                # Save the record of this exposure
+                reports.append(report_file)
+                expnums_reported.add(int(record['expnum']))
+                if save_exposure_record(m_file, record):
+                    expnums_replaced.append(record['expnum'])
+
+            # Register all processed exposures that are neither reported nor
+            # claimed, whose process was interrupted before registering them
+            # Their records were stored in their temporary files
+            records = expnums_dset[:]
+            last_modified = dict(zip(records['expnum'].tolist(),
+                                     records['last_modified'].tolist()))
+            for temp_file in glob(path.join(
+                    ARGS.mld, TEMP_EXP_FILE.replace('{}', '*'))):
+                # Skip this exposure if it is reported or claimed
+                expnum = get_temp_expnum(temp_file)
+                if expnum in expnums_reported or expnum in expnums_claimed:
+                    continue
+
+                # If it has no record, it can only be merged if it is known
+                # Else, it is removed, such that it is processed again
+                record = read_temp_record(temp_file)
+                if record is None:
+                    if expnum not in last_modified:
+                        os.remove(temp_file)
+                    continue
+
+                # Skip this exposure if its record was already registered
+                if(last_modified.get(expnum) == record['last_modified']):
+                    continue
+
+                # Save the record of this exposure
+                if save_exposure_record(m_file, record):
+                    expnums_replaced.append(expnum)
+            expnums_known = expnums_dset[:]
+
+        # Obtain up to ARGS.n_expnums exposure files if none were provided
+        if exp_dict is None:
+            exp_dict = get_exp_dict(ARGS.n_expnums)
+        else:
+            exp_dict = dict(exp_dict)
+
+        # Add the required flat exposure files (REGEX above ignores it)
+#        exp_dict[0] = (path.join(ARGS.dir, REQ_FILES[0]),
+#                       path.join(ARGS.dir, REQ_FILES[1]))
+
+        # Initialize the number of exposures found and their types
+        n_expnums = len(exp_dict)
+        expnums_outdated = []
+
+        # Create empty list of temporary HDF5-files
+        temp_files = []
+
+        # Determine which ones require updating
+        for expnum, mtime in zip(expnums_known['expnum'].tolist(),
+                                 expnums_known['last_modified'].tolist()):
+            # Try to obtain the exp_files of this expnum
+            exp_files = exp_dict.get(expnum)
+
+            # If this is not None, it is already known
+            if exp_files is not None:
+                # Check if it requires updating by comparing modified times
+                if(int(path.getmtime(exp_files[0])) > mtime):
+                    # If so, add to expnums_outdated
+                    expnums_outdated.append(expnum)
+                    continue
+                else:
+                    # If not, remove from dict
+                    exp_dict.pop(expnum)
 
-    # Create a regex iterator
-    re_iter = re.finditer(EXP_REGEX, filenames)
+            # Determine path to temporary HDF5-file of exposure
+            temp_hdf5 = path.join(ARGS.mld, TEMP_EXP_FILE.format(expnum))
 
-    # Create dict with up to ARGS.n_expnums exposure files
-    exp_dict = {int(m['expnum']): (path.join(ARGS.dir, m['exp_file']),
-                                   path.join(ARGS.dir, m['xtr_file']))
-                for m in islice(re_iter, ARGS.n_expnums)}
-
-    # Add the required flat exposure files (REGEX above explicitly ignores it)
-#    exp_dict[0] = (path.join(ARGS.dir, REQ_FILES[0]),
-#                   path.join(ARGS.dir, REQ_FILES[1]))
-
-    # Initialize the number of exposures found and their types
-    n_expnums = len(exp_dict)
-    expnums_outdated = []
-
-    # Create empty list of temporary HDF5-files
-    temp_files = []
-
-    # Determine which ones require updating
-    for expnum, *_, mtime in expnums_known:
-        # Try to obtain the exp_files of this expnum
-        exp_files = exp_dict.get(expnum)
-
-        # If this is not None, it is already known
-        if exp_files is not None:
-            # Check if it requires updating by comparing last-modified times
-            if(path.getmtime(exp_files[0]) > mtime):
-                # If so, add to expnums_outdated
-                expnums_outdated.append(expnum)
-                continue
-            else:
-                # If not, remove from dict
-                exp_dict.pop(expnum)
+            # If it already exists and is not being written, add it
+            # Claimed exposures are only finished if their report was read
+            if path.exists(temp_hdf5) and (expnum in expnums_reported or
+                                           expnum not in expnums_claimed):
+                temp_files.append(temp_hdf5)
 
-        # Determine path to temporary HDF5-file of exposure
-        temp_hdf5 = path.join(ARGS.mld, TEMP_EXP_FILE.format(expnum))
+        # Save the number of exposures that were scanned
+        counters['rows'] = n_expnums
 
-        # If it already exists, add it to temp_files
-        if path.exists(temp_hdf5):
-            temp_files.append(temp_hdf5)
+        # Record in the journal which exposures will have to be removed
+        expnums_replaced = list(map(int, {*expnums_replaced,
+                                          *expnums_pending}))
+        if expnums_outdated or expnums_replaced:
+            write_journal(ARGS.mld, {
+                'op': 'outdated', 'state': 'pending', 'files': [],
+                'expnums': [*expnums_outdated, *expnums_replaced]})
 
     # Print the number of exposure files found
     n_expnums_outdated = len(expnums_outdated)
@@ -494,201 +1946,1020 @@ def perform_update():
           f"are new and {n_expnums_outdated:,} are outdated. Also found "
           f"{n_expnums_temp:,} processed exposure files that require merging.")
 
-    # If exp_dict contains at least 1 item
-    if exp_dict:
-        # Create tqdm iterator for processing
-        exp_iter = tqdm(exp_dict.items(), desc="Processing exposure files",
+    # Exposures that were reprocessed by workers are outdated as well
+    expnums_outdated = [*expnums_outdated, *expnums_replaced]
+
+    # Determine the next version of the database, which becomes the version
+    # as soon as any step of this update changes the master exposure file
+    with h5py.File(ARGS.master_file, 'r') as m_file:
+        db_version = m_file.attrs['db_version']+1
+
+    # Determine the rows of all outdated exposures, which must be removed
+    # even if nothing must be merged, as an interrupted update may have left
+    # them behind
+    outdated_slices = []
+    if expnums_outdated and path.exists(ARGS.master_exp_file):
+        with h5py.File(ARGS.master_file, 'r+') as m_file:
+            if not row_index_match(m_file):
+                index_exposure_rows(m_file)
+        outdated_slices = find_row_slices(expnums_outdated)
+
+    # If the outdated exposures have no rows, nothing must be removed
+    # This avoids rewriting the entire master exposure file for nothing
+    if not outdated_slices:
+        clear_journal(ARGS.mld)
+
+    # Else, remove their rows
+    else:
+        print("\nRemoving outdated exposures from the database.")
+
+        # Remove all outdated exposures from the master exposure file
+        with profiler.stage('outdated', bytes_read=path.getsize(
+                ARGS.master_exp_file)) as counters:
+            # Determine the rows that the remaining exposures will occupy
+            with h5py.File(ARGS.master_file, 'r') as m_file:
+                rows = get_removed_row_ranges(m_file['expnums'][()],
+                                              expnums_outdated)
+
+            # Determine the objids of all rows that are removed
+            objids, counts = count_objids(expnums_outdated)
+
+            # Log the outdated exposures and the objids of their removed rows
+            # as changes of the version
+            with h5py.File(ARGS.master_file, 'r+') as m_file:
+                log_changes(m_file, db_version, expnums_outdated,
+                            expnums_outdated)
+                log_removed_objids(m_file, db_version, objids)
+
+            # Determine the rows of the exposures that were not outdated
+            row_slices = []
+            start = 0
+            for row_slice in outdated_slices:
+                row_slices.append(slice(start, row_slice.start))
+                start = row_slice.stop
+            row_slices.append(slice(start, get_n_rows(ARGS.master_exp_file)))
+
+            # Define function that exports the remaining rows
+            def export_func(master_temp_file):
+                counters['rows'] = write_exp_file(
+                    master_temp_file, [(ARGS.master_exp_file, row_slice)
+                                       for row_slice in row_slices],
+                    resizable=getattr(ARGS, 'watch', False))
+
+            # Remove the rows, replacing the pending journal entry
+            run_journaled_step(
+                {'op': 'outdated', 'files': [], 'version': int(db_version),
+                 'expnums': list(map(int, expnums_outdated)),
+                 'rows': rows},
+                export_func, objids, -counts)
+            counters['bytes_written'] = path.getsize(ARGS.master_exp_file)
+
+        # Remove the clustered copy of the database, as it is outdated now
+        shutil.rmtree(path.join(ARGS.mld, CLUSTERED_DIR), ignore_errors=True)
+
+    # If there are exposures that must be processed or merged
+    if exp_dict or temp_files:
+        # Update database
+        print("\nUpdating database with processed exposures (NOTE: This may "
+              "take a while for large databases).")
+
+        # Remove all processing reports, as they have been registered now
+        for report_file in reports:
+            os.remove(report_file)
+
+        # Start processing all exposures in a separate thread
+        producer = ExposureProducer(
+            exp_dict, get_queue_size(exp_dict, ARGS.max_memory))
+        producer.start()
+
+        # Create tqdm iterators for processing and merging
+        exp_iter = tqdm(desc="Processing exposure files", total=len(exp_dict),
                         dynamic_ncols=True)
+        temp_iter = tqdm(desc="Merging processed exposure files",
+                         total=len(temp_files)+len(exp_dict),
+                         dynamic_ncols=True)
 
-        # Process all exposure files
+        # Merge batches of processed exposures as soon as they are available
+        # TODO: Figure out how to avoid copying over all the data every time
         try:
-            for expnum, exp_files in exp_iter:
-                # Set which exposure is being processed in exp_iter
-                exp_iter.set_postfix_str(path.basename(exp_files[0]))
+            for temp_files_list in iter_merge_batches(
+                    iter_processed_files(producer, temp_files, exp_iter),
+                    ARGS.max_memory, ARGS.master_exp_file,
+                    MERGE_BATCH_DELAY):
+                # Log the exposures in this batch as changes of the version
+                expnums_merged = list(map(get_temp_expnum, temp_files_list))
+                with h5py.File(ARGS.master_file, 'r+') as m_file:
+                    log_changes(m_file, db_version, expnums_merged,
+                                expnums_outdated)
+
+                # Merge this batch into the master exposure file
+                merge_temp_files(temp_files_list, db_version)
+
+                # Update tqdm iterator
+                temp_iter.update(len(temp_files_list))
+
+        # Stop processing and close the tqdm iterators
+        finally:
+            producer.close()
+            exp_iter.close()
+            temp_iter.close()
+
+        # If processing raised an error, raise it properly
+        if isinstance(producer.error, OSError):
+            raise_error(str(producer.error))
+        elif producer.error is not None:
+            raise producer.error
+
+        # Remove the clustered copy of the database, as it is outdated now
+        shutil.rmtree(path.join(ARGS.mld, CLUSTERED_DIR), ignore_errors=True)
 
-                # Process this exposure
-                temp_files.append(process_exp_files(expnum, exp_files))
+        # Open master file
+        with h5py.File(ARGS.master_file, 'r+') as m_file:
+            # If the objid counts do not match the database, recount them
+            if not objid_counts_match(m_file):
+                print("\nObjid counts do not match the database. Recounting "
+                      "all objects in the database.")
+                with profiler.stage('objids') as counters:
+                    del m_file['objids']
+                    m_file.attrs['n_objids'] = 0
+                    update_objid_counts(m_file, *count_objids())
+                    counters['rows'] = int(m_file['objids']['count'].sum())
+
+            # Obtain the total number of exposures and objects now
+            n_expnums = m_file.attrs['n_expnums']
+            n_objids = m_file.attrs.get('n_objids', 0)
 
-        # If a KeyboardInterrupt is raised, update database with progress
+        # Print that processing is finished
+        print(f"The database now contains {n_expnums:,} exposures with "
+              f"{n_objids:,} objects.")
+
+    # If no new exposure files are found, database is already up-to-date
+    elif not outdated_slices:
+        print("Database is already up-to-date.")
+
+    # Index the rows of all exposures if this has not been done yet
+    with h5py.File(ARGS.master_file, 'r+') as m_file:
+        if not row_index_match(m_file):
+            print("\nIndexing the rows of all exposures in the database.")
+            with profiler.stage('index') as counters:
+                index_exposure_rows(m_file)
+                counters['rows'] = m_file.attrs['n_expnums']
+
+        # Import update_sketches
+        from mldatabase.sketches import update_sketches
+
+        # Sketch all exposures that were added or changed
+        with profiler.stage('sketches') as counters:
+            counters['rows'] = update_sketches(m_file, ARGS.master_exp_file)
+
+        # Import update_blooms
+        from mldatabase.blooms import update_blooms
+
+        # Compute the objid filters of all blocks of rows that changed
+        with profiler.stage('blooms') as counters:
+            counters['rows'] = update_blooms(m_file, ARGS.master_exp_file)
+
+    # Build the pyramid if requested, or rebuild it if it is outdated
+    pyramid_file = path.join(ARGS.mld, PYRAMID_FILE)
+    if getattr(ARGS, 'pyramid', False) or path.exists(pyramid_file):
+        # Import update_pyramid
+        from mldatabase.pyramid import update_pyramid
+
+        # Update the pyramid
+        with profiler.stage('pyramid') as counters:
+            if update_pyramid(ARGS.mld, True):
+                counters['bytes_written'] = path.getsize(pyramid_file)
+
+
+# This function provides the temporary files of all processed exposures
+def iter_processed_files(producer, temp_files, exp_iter):
+    """
+    Generator that provides the paths to all provided `temp_files`, followed
+    by those of all exposures as soon as they have been processed by the
+    provided :obj:`~ExposureProducer` object `producer`, whose records are
+    saved in the master file.
+
+    Whenever no processed exposure is available, *None* is provided first,
+    and again every :attr:`~MERGE_POLL_INTERVAL` seconds while waiting for
+    one, such that :func:`~iter_merge_batches` can provide the current batch
+    while processing continues.
+
+    If a KeyboardInterrupt is raised while waiting for exposures to be
+    processed, processing is stopped and only the exposures that were already
+    processed are provided.
+
+    """
+
+    # Provide all temporary files that already exist
+    yield from temp_files
+
+    # Provide all exposures as soon as they are processed
+    while True:
+        # If no exposure is available, signal this
+        if producer.queue.empty():
+            yield None
+
+        # Wait for the next exposure to be processed
+        try:
+            item = producer.queue.get(timeout=MERGE_POLL_INTERVAL)
+
+        # If none was processed in time, signal that again
+        except Empty:
+            continue
+
+        # If a KeyboardInterrupt is raised, stop processing
         except KeyboardInterrupt:
             print("WARNING: Processing has been interrupted. Updating "
                   "database with currently processed exposures.")
+            producer.stop()
+            continue
 
-        # Open master file
+        # If all exposures have been processed, stop
+        if item is None:
+            return
+
+        # Save that this exposure has been processed
+        exp_file_hdf5, record = item
         with h5py.File(ARGS.master_file, 'r+') as m_file:
-            # Obtain the total number of exposures now
-            n_expnums_known = m_file.attrs['n_expnums']
+            save_exposure_record(m_file, record)
+        exp_iter.update(1)
 
-    # If temp_files contains at least 1 item
-    if temp_files:
-        # Import vaex
-        import vaex
+        # Provide its temporary file
+        yield exp_file_hdf5
 
-        # Update database
-        print("\nUpdating database with processed exposures (NOTE: This may "
-              "take a while for large databases).")
 
-        # Divide temp_files up into lists of length 100 with last of length 150
-        n_temp = len(temp_files)
-        temp_files = [temp_files[slc] for slc in dyn_range(len(temp_files))]
+# This function merges temporary files into the master exposure file
+def merge_temp_files(temp_files_list, db_version):
+    """
+    Merges the provided `temp_files_list` into the master exposure file,
+    making `db_version` the version of the database.
 
-        # If the master exposure file exists and there are outdated exposures
-        if path.exists(ARGS.master_exp_file) and expnums_outdated:
-            # Wrap in try-statement to ensure file is closed
-            try:
-                # Open the master exposure file
-                master_df = vaex.open(ARGS.master_exp_file)
+    When watching for new exposures, the master exposure file is written with
+    resizable columns, and every batch is appended to it in place, such that
+    adding a batch only writes the rows of that batch. Otherwise, the master
+    exposure file is rewritten with contiguous columns, which can be mapped
+    into memory by readers.
 
-                # Solely select the exposures that were not outdated
-                for expnum in expnums_outdated:
-                    master_df = master_df.filter(master_df.expnum != expnum,
-                                                 'and')
+    """
 
-                # Extract the master DataFrame
-                master_df = master_df.extract()
+    # Merge this list of temporary files into the master exposure file
+    with ARGS.profiler.stage('merge') as counters:
+        # Determine the objids of all rows that are added
+        objids, counts = count_objids(files=temp_files_list)
+
+        # Determine the rows that the exposures in this list will occupy
+        n_rows = start = get_n_rows(ARGS.master_exp_file)
+        rows = []
+        for temp_file in temp_files_list:
+            stop = start+get_n_rows(temp_file)
+            rows.append([get_temp_expnum(temp_file), start, stop])
+            start = stop
+
+        # Determine if the batch can be appended to the master file in place
+        resizable = getattr(ARGS, 'watch', False)
+        append = (resizable and path.exists(ARGS.master_exp_file) and
+                  is_resizable(ARGS.master_exp_file))
+        nbytes = (path.getsize(ARGS.master_exp_file)
+                  if path.exists(ARGS.master_exp_file) else 0)
+
+        # Define function that exports the merged rows
+        def export_func(filename):
+            # Append all temporary files to the master file if it exists
+            exp_files = temp_files_list
+            if not append and path.exists(ARGS.master_exp_file):
+                exp_files = [ARGS.master_exp_file, *exp_files]
+
+            # Write all their rows
+            counters['rows'] = write_exp_file(
+                filename, [(exp_file, slice(None)) for exp_file in exp_files],
+                resizable=resizable, append=append)
+
+        # Record the amount of data that is merged
+        counters['bytes_read'] = sum(map(path.getsize, temp_files_list))
+        if not append:
+            counters['bytes_read'] += nbytes
+
+        # Merge the temporary files
+        run_journaled_step(
+            {'op': 'append' if append else 'merge', 'expnums': [],
+             'version': int(db_version), 'n_rows': n_rows,
+             'files': list(map(path.basename, temp_files_list)),
+             'rows': rows},
+            export_func, objids, counts)
+        counters['bytes_written'] = path.getsize(ARGS.master_exp_file)
+        if append:
+            counters['bytes_written'] -= nbytes
+
+
+# This function writes the rows of exposure files to an exposure file
+def write_exp_file(filename, row_slices, *, resizable=False, append=False):
+    """
+    Writes the rows of all provided `row_slices`, which are pairs of an
+    exposure HDF5-file and a slice of its rows, to the HDF5-file `filename`,
+    in the order in which they are provided.
 
-                # Export to HDF5
-                master_temp_file = path.join(ARGS.mld, 'temp.hdf5')
-                master_df.export_hdf5(master_temp_file)
+    All columns are written in parallel by :func:`~write_columns`, directly
+    from memory maps of the provided files, such that the data is only
+    copied once.
 
-            # Close master exposure file
-            finally:
-                master_df.close()
+    Optional
+    --------
+    resizable : bool. Default: False
+        Whether the columns of `filename` must be written resizable instead
+        of contiguous.
+    append : bool. Default: False
+        Whether the rows must be appended to the resizable columns of the
+        existing HDF5-file `filename` in place.
+
+    Returns
+    -------
+    n_rows : int
+        The number of rows that were written.
 
-            # Remove original master file
-            os.remove(ARGS.master_exp_file)
+    """
 
-            # Rename master_temp_file to master exposure file name
-            os.rename(master_temp_file, ARGS.master_exp_file)
+    # Import ColumnReader
+    from mldatabase.reader import ColumnReader
 
-        # Create tqdm iterator for merging
-        temp_iter = tqdm(desc="Merging processed exposure files", total=n_temp,
-                         dynamic_ncols=True)
+    # Open all exposure files
+    readers = {}
+    try:
+        for exp_file, _ in row_slices:
+            if exp_file not in readers:
+                readers[exp_file] = ColumnReader(exp_file)
+
+        # Obtain the segments of every column
+        columns = {
+            name: [readers[exp_file].get_segment(name, row_slice)
+                   for exp_file, row_slice in row_slices]
+            for name in readers[row_slices[0][0]].columns}
+
+        # Write them
+        if append:
+            return(append_columns(filename, columns))
+        else:
+            return(write_columns(filename, columns, resizable=resizable))
 
-        # Loop over all temporary exposure HDF5-files
-        # TODO: Figure out how to avoid copying over all the data every time
-        for temp_files_list in temp_files:
-            # Determine number of files in this list
-            n_temp_list = len(temp_files_list)
+    # Close all exposure files
+    finally:
+        for reader in readers.values():
+            reader.close()
 
-            # Wrap in try-statement to ensure files are closed
-            try:
-                # Open all temporary exposure HDF5-files in this list
-                temp_df = vaex.open_many(temp_files_list)
-
-                # Add to master_df if it exists
-                if path.exists(ARGS.master_exp_file):
-                    # Open the master exposure file
-                    master_df = vaex.open(ARGS.master_exp_file)
-                    master_df = master_df.concat(temp_df)
-                    temp_files_list.append(ARGS.master_exp_file)
-                else:
-                    master_df = temp_df
 
-                # Export to HDF5
-                master_temp_file = path.join(ARGS.mld, 'temp.hdf5')
-                master_df.export_hdf5(master_temp_file)
+# This function performs a step that replaces the master exposure file
+def run_journaled_step(entry, export_func, objids, counts):
+    """
+    Performs the step described by the provided journal `entry`, in which
+    `export_func` exports the new master exposure file to the provided path,
+    and which changes the provided `objids` by `counts`. The 'rows' of the
+    `entry` (if any) are the new row ranges of the exposures it changes.
+    If the 'op' of the `entry` is 'append', `export_func` is instead given
+    the path to the master exposure file itself, to which it appends the
+    rows that had none of its 'n_rows' rows before.
+
+    The intent of the step is recorded in the journal before it is performed,
+    and its completion once the new master exposure file is on disk, after
+    which it is committed. An interrupted update can therefore always be
+    rolled forward by :func:`~recover_journal`.
+    Note that an append modifies the master exposure file in place, so it
+    can only be undone if the update was not interrupted while the
+    HDF5-library was writing the metadata of the file.
 
-            # Close all temporary HDF5-files
-            finally:
-                master_df.close_files()
+    """
 
-            # Remove all temporary files
-            for temp_file in temp_files_list:
-                os.remove(temp_file)
+    # Determine the sequence number of this step
+    with h5py.File(ARGS.master_file, 'r') as m_file:
+        entry['seq'] = int(m_file.attrs.get('journal_seq', 0))+1
+
+    # Record the intent of this step
+    write_journal_counts(ARGS.mld, objids, counts)
+    entry['state'] = 'begin'
+    write_journal(ARGS.mld, entry)
+
+    # Perform the step and record that its result is on disk
+    if(entry['op'] == 'append'):
+        exp_file = ARGS.master_exp_file
+    else:
+        exp_file = path.join(ARGS.mld, 'temp.hdf5')
+    export_func(exp_file)
+    fsync_file(exp_file)
+    entry['state'] = 'exported'
+    write_journal(ARGS.mld, entry)
 
-            # Rename master_temp_file to master exposure file name
-            os.rename(master_temp_file, ARGS.master_exp_file)
+    # Commit the step
+    commit_journaled_step(entry)
 
-            # Update tqdm iterator
-            temp_iter.update(n_temp_list)
 
-        # Close the tqdm iterator
-        temp_iter.close()
+# This function commits a step whose result is on disk
+def commit_journaled_step(entry):
+    # Move the new master exposure file into place if not done yet
+    master_temp_file = path.join(ARGS.mld, 'temp.hdf5')
+    if path.exists(master_temp_file):
+        os.replace(master_temp_file, ARGS.master_exp_file)
 
-        # Determine all objids that are known
-        print("\nDetermining all objects in the database.")
+    # Remove all temporary files that were merged
+    for filename in entry['files']:
         try:
-            master_df = vaex.open(ARGS.master_exp_file)
-            objids, counts = np.unique(master_df['objid'].values,
-                                       return_counts=True)
-        finally:
-            master_df.close()
+            os.remove(path.join(ARGS.mld, filename))
+        except FileNotFoundError:
+            pass
 
-        # Open master file
-        with h5py.File(ARGS.master_file, 'r+') as m_file:
-            # Obtain previously known objids
-            n_objids_known = m_file.attrs.setdefault('n_objids', 0)
-            objids_dset = m_file.require_dataset('objids',
-                                                 shape=(n_objids_known,),
-                                                 dtype=[('objid', int),
-                                                        ('count', int)],
-                                                 maxshape=(None,))
-
-            # Save currently known objids
-            n_objids = len(objids)
-            objids_dset.resize(n_objids, axis=0)
-            objids_dset['objid'] = objids
-            objids_dset['count'] = counts
-            m_file.attrs['n_objids'] = n_objids
-
-            # Obtain the total number of exposures now
-            n_expnums = m_file.attrs['n_expnums']
+    # Import invalidate_blooms
+    from mldatabase.blooms import invalidate_blooms
 
-        # Print that processing is finished
-        print(f"The database now contains {n_expnums:,} exposures with "
-              f"{n_objids:,} objects.")
+    # Update the objid counts if not done yet
+    with h5py.File(ARGS.master_file, 'r+') as m_file:
+        if(entry['seq'] > m_file.attrs.get('journal_seq', 0)):
+            update_objid_counts(m_file, *read_journal_counts(ARGS.mld))
+            invalidate_blooms(m_file, entry.get('rows', []))
+            update_row_index(m_file, entry.get('rows', []))
+            m_file.attrs['db_version'] = entry['version']
+            m_file.attrs['journal_seq'] = entry['seq']
 
-    # If no new exposure files are found, database is already up-to-date
-    else:
-        print("Database is already up-to-date.")
+    # Clear the journal
+    clear_journal(ARGS.mld)
+
+
+# This function rolls forward from the journaled step of an update
+def recover_journal():
+    """
+    Rolls the database forward from the step recorded in its journal, if the
+    previous update was interrupted while performing it. A step whose result
+    is on disk is committed, while any other step is undone.
+
+    Returns
+    -------
+    expnums : list of int
+        The expnums of all outdated exposures whose rows still must be
+        removed from the master exposure file.
+
+    """
+
+    # Read the journal entry
+    entry = read_journal(ARGS.mld)
+
+    # If there is none, the previous update was not interrupted
+    if entry is None:
+        return([])
+
+    # If the result of the step is on disk, commit it
+    print("Recovering from interrupted previous update.")
+    if(entry['state'] == 'exported'):
+        commit_journaled_step(entry)
+        return([])
+
+    # Else, remove whatever was exported of it
+    master_temp_file = path.join(ARGS.mld, 'temp.hdf5')
+    if path.exists(master_temp_file):
+        os.remove(master_temp_file)
+
+    # If rows were being appended, remove whatever was appended of them
+    if(entry['op'] == 'append'):
+        truncate_columns(ARGS.master_exp_file, entry['n_rows'])
+
+    # If outdated exposures were being removed, they still must be removed
+    if(entry['op'] == 'outdated'):
+        return(entry['expnums'])
+
+    # Else, the temporary files of the step will simply be merged again
+    clear_journal(ARGS.mld)
+    return([])
+
+
+# This function counts all objids in the master or temporary files
+def count_objids(expnums=None, files=None):
+    """
+    Counts the objids of all rows in the provided temporary HDF5-`files`, or
+    of all rows in the master exposure file if *None*. If `expnums` is given,
+    only the rows of these exposures in the master exposure file are counted,
+    which are obtained from its row index.
+
+    Returns
+    -------
+    objids : :obj:`~numpy.ndarray` object
+        The sorted unique objids in the rows.
+    counts : :obj:`~numpy.ndarray` object
+        The number of rows of every objid.
+
+    """
+
+    # If no files were given, use the master exposure file if it exists
+    if files is None:
+        files = [ARGS.master_exp_file]*path.exists(ARGS.master_exp_file)
+
+    # Loop over all files
+    objids = np.empty(0, dtype=int)
+    counts = np.empty(0, dtype=int)
+    for filename in files:
+        with h5py.File(filename, 'r') as file:
+            # Determine how many objids can be counted at once
+            dset = file[VAEX_COLUMN.format('objid')]
+            n_rows = dset.shape[0]
+            if ARGS.max_memory is None:
+                chunk_size = max(1, n_rows)
+            else:
+                chunk_size = max(1, ARGS.max_memory//(4*8))
+
+            # Determine the rows that must be counted
+            if expnums is None:
+                row_slices = [slice(0, n_rows)]
+            else:
+                row_slices = find_row_slices(expnums)
+
+            # Count all objids chunk by chunk
+            for row_slice in row_slices:
+                for start in range(row_slice.start, row_slice.stop,
+                                   chunk_size):
+                    stop = min(start+chunk_size, row_slice.stop)
+                    objids, counts = merge_counts(
+                        objids, counts,
+                        *np.unique(dset[start:stop], return_counts=True))
+
+    # Return objids and counts
+    return(objids, counts)
+
+
+# This function changes the objid counts in the master file
+def update_objid_counts(m_file, objids, counts):
+    """
+    Adds the provided `counts` of the provided `objids` to the 'objids'
+    dataset of the opened master file `m_file`, removing all objids whose
+    count drops to zero.
+
+    """
+
+    # Obtain previously known objids
+    n_objids_known = m_file.attrs.setdefault('n_objids', 0)
+    objids_dset = m_file.require_dataset('objids',
+                                         shape=(n_objids_known,),
+                                         dtype=[('objid', int),
+                                                ('count', int)],
+                                         maxshape=(None,))
+
+    # Add the counts to them
+    known = objids_dset[()]
+    objids, counts = merge_counts(known['objid'], known['count'], objids,
+                                  counts)
+    objids, counts = objids[counts > 0], counts[counts > 0]
+
+    # Save currently known objids
+    n_objids = len(objids)
+    objids_dset.resize(n_objids, axis=0)
+    objids_dset['objid'] = objids
+    objids_dset['count'] = counts
+    m_file.attrs['n_objids'] = n_objids
+
+
+# This function checks if the objid counts match the master exposure file
+def objid_counts_match(m_file):
+    # Obtain the number of rows in the master exposure file
+    n_rows = get_n_rows(ARGS.master_exp_file)
+
+    # Obtain the number of rows that were counted
+    n_counted = m_file['objids']['count'].sum() if 'objids' in m_file else 0
+
+    # Return whether they match
+    return(n_rows == n_counted)
+
+
+# This function returns the number of rows in an exposure HDF5-file
+def get_n_rows(filename):
+    # If the file does not exist, it has no rows
+    if not path.exists(filename):
+        return(0)
+
+    # Else, obtain the length of its objid column
+    with h5py.File(filename, 'r') as file:
+        return(file[VAEX_COLUMN.format('objid')].shape[0])
+
+
+# This function returns the expnum of a temporary exposure file
+def get_temp_expnum(temp_file):
+    prefix, suffix = TEMP_EXP_FILE.split('{}')
+    return(int(path.basename(temp_file)[len(prefix):-len(suffix)]))
+
+
+# This function reads the exposure record of a temporary exposure file
+def read_temp_record(temp_file):
+    """
+    Returns the exposure record that was stored in the temporary exposure
+    HDF5-file `temp_file` when it was exported by :func:`~export_exp_files`,
+    or *None* if it has none (as it was exported by an older version).
+
+    """
+
+    with h5py.File(temp_file, 'r') as file:
+        if 'record' in file:
+            return(file['record'][0])
+
+
+# This function checks if the row index covers the master exposure file
+def row_index_match(m_file):
+    """
+    Returns whether the row ranges of the exposures in the 'expnums' dataset
+    of the opened master file `m_file` cover all rows in the master exposure
+    file exactly once.
+
+    """
+
+    # Obtain the row ranges of all exposures that have rows
+    expnums = m_file['expnums'][()]
+    expnums = np.sort(expnums[expnums['row_start'] >= 0],
+                      order=['row_start', 'row_stop'])
+    starts = expnums['row_start']
+    stops = expnums['row_stop']
+
+    # Check that the ranges follow each other up to the last row
+    n_rows = get_n_rows(ARGS.master_exp_file)
+    if not starts.size:
+        return(n_rows == 0)
+    return(starts[0] == 0 and stops[-1] == n_rows and
+           (starts[1:] == stops[:-1]).all())
+
+
+# This function determines the row ranges of all exposures from the data
+def index_exposure_rows(m_file):
+    """
+    Determines the rows of every exposure in the master exposure file from
+    its 'expnum' column and saves them in the 'expnums' dataset of the opened
+    master file `m_file`.
+
+    """
+
+    # Determine where every run of rows of the same exposure starts
+    starts = [np.empty(0, dtype=int)]
+    run_expnums = [np.empty(0, dtype=int)]
+    n_rows = get_n_rows(ARGS.master_exp_file)
+    if n_rows:
+        with h5py.File(ARGS.master_exp_file, 'r') as file:
+            # Determine how many expnums can be read at once
+            dset = file[VAEX_COLUMN.format('expnum')]
+            if ARGS.max_memory is None:
+                chunk_size = n_rows
+            else:
+                chunk_size = max(1, ARGS.max_memory//(2*8))
+
+            # Find all runs chunk by chunk
+            prev_value = None
+            for start in range(0, n_rows, chunk_size):
+                values = dset[start:min(start+chunk_size, n_rows)]
+                first = np.r_[values[0] != prev_value,
+                              values[1:] != values[:-1]]
+                starts.append(np.flatnonzero(first)+start)
+                run_expnums.append(values[first])
+                prev_value = values[-1]
+
+    # Every run stops where the next one starts
+    starts = np.concatenate(starts)
+    stops = np.r_[starts[1:], n_rows].astype(int)
+
+    # Replace all row ranges with these
+    expnums = m_file['expnums'][()]
+    expnums['row_start'] = expnums['row_stop'] = -1
+    m_file['expnums'][...] = expnums
+    update_row_index(m_file, np.column_stack(
+        [np.concatenate(run_expnums), starts, stops]))
+
+
+# This function saves new row ranges of exposures in the master file
+def update_row_index(m_file, rows):
+    """
+    Saves the provided `rows`, which contains the expnum, first row and
+    stop row of exposures, in the 'expnums' dataset of the opened master
+    file `m_file`. Exposures without a record are skipped.
+
+    """
+
+    # Convert rows to an array
+    rows = np.asarray(rows, dtype=int).reshape(-1, 3)
+    expnums_dset = m_file['expnums']
+    if not rows.size or not expnums_dset.size:
+        return
+
+    # Determine the records of all exposures
+    expnums = expnums_dset[()]
+    sorter = np.argsort(expnums['expnum'])
+    index = sorter[np.searchsorted(expnums['expnum'], rows[:, 0],
+                                   sorter=sorter).clip(max=len(sorter)-1)]
+    mask = expnums['expnum'][index] == rows[:, 0]
+
+    # Save their new row ranges
+    expnums['row_start'][index[mask]] = rows[mask, 1]
+    expnums['row_stop'][index[mask]] = rows[mask, 2]
+    expnums_dset[...] = expnums
+
+
+# This function determines the row ranges after removing exposures
+def get_removed_row_ranges(expnums, expnums_removed):
+    """
+    Determines the row ranges that the exposures in the provided `expnums`
+    array occupy after the rows of all exposures in `expnums_removed` are
+    removed from the master exposure file.
+
+    Returns
+    -------
+    rows : list of list of int
+        The expnum, first row and stop row of every exposure whose row range
+        changes, where removed exposures have a range of -1.
+
+    """
+
+    # Obtain all exposures that have rows, sorted on their rows
+    expnums = np.sort(expnums[expnums['row_start'] >= 0],
+                      order=['row_start', 'row_stop'])
+    removed = np.isin(expnums['expnum'], expnums_removed)
+
+    # Determine the number of rows that are removed before every exposure
+    n_removed = (expnums['row_stop']-expnums['row_start'])*removed
+    shifts = np.cumsum(n_removed)-n_removed
+
+    # Determine the new row ranges
+    starts = expnums['row_start']-shifts
+    stops = expnums['row_stop']-shifts
+    starts[removed] = stops[removed] = -1
+
+    # Return the row ranges of all exposures that change
+    changed = removed | (shifts > 0)
+    return(np.column_stack([expnums['expnum'][changed], starts[changed],
+                            stops[changed]]).tolist())
 
 
 # This function processes an exposure file
-def process_exp_files(expnum, exp_files):
+def process_exp_files(expnum, exp_files, report=False):
+    # Process the exposure files
+    exp_file_hdf5, record = export_exp_files(expnum, exp_files)
+
+    # Save that this exposure has been processed
+    with ARGS.profiler.stage('process.metadata', rows=1):
+        # If reporting, write a report for the coordinator
+        if report:
+            write_report(ARGS.mld, record)
+
+        # Else, save the record in the master file
+        else:
+            with h5py.File(ARGS.master_file, 'r+') as m_file:
+                save_exposure_record(m_file, record)
+
+    # Return exp_file_hdf5
+    return(exp_file_hdf5)
+
+
+# This function exports the exposure files to a temporary HDF5-file
+def export_exp_files(expnum, exp_files):
+    """
+    Reads and checks the provided `exp_files` of exposure `expnum`, and exports
+    them to its temporary HDF5-file through a partial file, such that an
+    interrupted export never leaves an incomplete temporary HDF5-file behind.
+    The record of the exposure is stored in the temporary HDF5-file as well,
+    such that it can always be registered (see :func:`~read_temp_record`),
+    even if the process is interrupted before registering or reporting it.
+
+    Returns
+    -------
+    exp_file_hdf5 : str
+        The path to the temporary HDF5-file.
+    record : :obj:`~numpy.void` object
+        The record of this exposure for the 'expnums' dataset.
+
+    """
+
     # Import vaex
     import vaex
 
+    # Obtain the profiler of this update
+    profiler = ARGS.profiler
+
     # Unpack exp_files
     exp_file, xtr_file = exp_files
 
     # Read in the exp_file
-    exp_data = vaex.from_csv(exp_file, skipinitialspace=True, header=None,
-                             names=EXP_HEADER, squeeze=True, dtype=EXP_HEADER,
-                             copy_index=False)
+    with profiler.stage('process.read_exp', bytes_read=path.getsize(
+            exp_file)) as counters:
+        exp_data = vaex.from_csv(exp_file, skipinitialspace=True, header=None,
+                                 names=EXP_HEADER, squeeze=True,
+                                 dtype=EXP_HEADER, copy_index=False)
+        counters['rows'] = len(exp_data)
 
     # Read in the xtr_file
-    xtr_data = pd.read_csv(xtr_file, skipinitialspace=True, header=None,
-                           names=XTR_HEADER, squeeze=True, dtype=XTR_HEADER,
-                           usecols=range(len(XTR_HEADER)-1))
-    xtr_data = xtr_data.to_numpy()[0]
+    with profiler.stage('process.read_xtr', bytes_read=path.getsize(
+            xtr_file), rows=1):
+        xtr_data = pd.read_csv(xtr_file, skipinitialspace=True, header=None,
+                               names=XTR_HEADER, squeeze=True,
+                               dtype=XTR_HEADER,
+                               usecols=range(len(XTR_HEADER)-1))
+        xtr_data = xtr_data.to_numpy()[0]
 
     # Check if the 'expnum' column contains solely expnum
-    if not (exp_data['expnum'] == expnum).evaluate().all():
-        # If not, raise error and exit
-        raise_error(f"Exposure file {exp_file!r} contains multiple exposures!")
+    with profiler.stage('process.check', rows=len(exp_data)):
+        if not (exp_data['expnum'] == expnum).evaluate().all():
+            # If not, raise error and exit
+            raise_error(f"Exposure file {exp_file!r} contains multiple "
+                        f"exposures!")
+
+    # Compute the quality statistics of this exposure
+    with profiler.stage('process.stats', rows=len(exp_data)):
+        stats = get_exposure_stats(exp_data)
+
+    # Create the record of this exposure
+    # Its rows are unknown until it has been merged into the database
+    record = np.array([(*xtr_data, path.getmtime(exp_file), *stats, -1, -1)],
+                      dtype=EXPNUMS_DTYPE)[0]
 
     # Export vaex DataFrame to HDF5
     exp_file_hdf5 = path.join(ARGS.mld, TEMP_EXP_FILE.format(expnum))
-    exp_data.export_hdf5(exp_file_hdf5)
+    with profiler.stage('process.export', rows=len(exp_data)) as counters:
+        # Export to a partial file that is moved into place
+        part_file = path.join(ARGS.mld, f".part_{get_worker_id()}_"
+                                         f"{path.basename(exp_file_hdf5)}")
+        write_columns(part_file, {name: [exp_data.evaluate(name)]
+                                  for name in exp_data.get_column_names()})
 
-    # Open master file
-    with h5py.File(ARGS.master_file, 'r+') as m_file:
-        # Check if this exposure has been processed before
-        expnums = m_file['expnums']['expnum']
-        expnums = expnums if expnums.size else expnums['expnum']
-        index = np.nonzero(expnums == expnum)[0]
+        # Store the record of this exposure with its rows
+        with h5py.File(part_file, 'r+') as file:
+            file.create_dataset('record', data=np.array([record]))
+        os.replace(part_file, exp_file_hdf5)
+        counters['bytes_written'] = path.getsize(exp_file_hdf5)
 
-        # Save that this exposure has been processed
-        if index.size:
-            m_file['expnums'][index[0]] = (*xtr_data, path.getmtime(exp_file))
+    # Return exp_file_hdf5 and record
+    return(exp_file_hdf5, record)
+
+
+# This function initializes a process that exports exposure files
+def init_export_process(args):
+    # Leave handling interrupts to the main process, which terminates these
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # Use the provided arguments, profiling if the update is profiled
+    set_args(args)
+    ARGS.profiler = UpdateProfiler(args.profile)
+
+
+# This function exports exposure files in a separate process
+def export_exp_files_task(task):
+    # Export the exposure files
+    result = export_exp_files(*task)
+
+    # Return the result and the profiled stages of this exposure
+    return(result, ARGS.profiler.pop_stages())
+
+
+# This function computes the quality statistics of an exposure
+def get_exposure_stats(exp_data):
+    # Obtain the columns that are required
+    mag = exp_data.evaluate('mag')
+    magerr = exp_data.evaluate('magerr')
+    contam = exp_data.evaluate('contam')
+    fitsky = exp_data.evaluate('fitsky')
+
+    # If the exposure is empty, all statistics are unknown
+    if not len(mag):
+        return((0, np.nan, np.nan, np.nan, np.nan))
+
+    # Determine which detections are contaminated, ignoring unknown values
+    contaminated = np.where(np.isfinite(contam), contam > 0, np.nan)
+
+    # Compute all statistics in the order of EXP_STATS_DTYPE
+    stats = (len(mag),
+             np.nanmedian(mag),
+             np.nanmedian(magerr),
+             np.nanmean(contaminated),
+             np.nanmedian(fitsky))
+
+    # Return stats
+    return(stats)
+
+
+# This function makes sure the 'expnums' dataset has the current dtype
+def migrate_expnums(m_file):
+    """
+    Converts the 'expnums' dataset in the opened master file `m_file` to
+    `EXPNUMS_DTYPE` if it was created by an older version of MLDatabase.
+
+    Fields that did not exist yet are set to -1 for integers and NaN for
+    floats, which marks their values as unknown.
+
+    """
+
+    # If the dataset does not exist yet or is up-to-date, return
+    if('expnums' not in m_file or
+       m_file['expnums'].dtype == np.dtype(EXPNUMS_DTYPE)):
+        return
+
+    # Obtain the old data
+    old_expnums = m_file['expnums'][()]
+
+    # Create the new data, with all unknown values marked
+    expnums = np.empty(old_expnums.shape, dtype=EXPNUMS_DTYPE)
+    for name, dtype in EXPNUMS_DTYPE:
+        if name in old_expnums.dtype.names:
+            expnums[name] = old_expnums[name]
         else:
-            m_file['expnums'].resize(m_file.attrs['n_expnums']+1, axis=0)
-            m_file['expnums'][-1] = (*xtr_data, path.getmtime(exp_file))
-            m_file.attrs['n_expnums'] += 1
+            expnums[name] = -1 if dtype is int else np.nan
 
-    # Return exp_file_hdf5
-    return(exp_file_hdf5)
+    # Replace the dataset
+    del m_file['expnums']
+    m_file.create_dataset('expnums', data=expnums, maxshape=(None,))
+
+
+# This function saves the record of a processed exposure in the master file
+def save_exposure_record(m_file, record):
+    """
+    Saves the provided exposure `record` in the 'expnums' dataset of the
+    opened master file `m_file`, replacing the record of the same exposure if
+    it already exists. The rows of a replaced record are kept, as they remain
+    in the database until they are removed.
+
+    Returns
+    -------
+    replaced : bool
+        Whether a previous record of this exposure was replaced.
+
+    """
+
+    # Check if this exposure has been processed before
+    expnums_dset = m_file['expnums']
+    index = np.nonzero(expnums_dset[()]['expnum'] == record['expnum'])[0]
+
+    # Save that this exposure has been processed
+    if index.size:
+        record = record.copy()
+        for name in ('row_start', 'row_stop'):
+            record[name] = expnums_dset[index[0]][name]
+        expnums_dset[index[0]] = record
+    else:
+        expnums_dset.resize(m_file.attrs['n_expnums']+1, axis=0)
+        expnums_dset[-1] = record
+        m_file.attrs['n_expnums'] += 1
+
+    # Return whether the record was replaced
+    return(bool(index.size))
+
+
+# This function logs the exposures that change in a database version
+def log_changes(m_file, version, expnums, expnums_replaced):
+    """
+    Logs in the 'changelog' dataset of the opened master file `m_file` that
+    the provided `expnums` are changed in database `version`, where all
+    exposures in `expnums_replaced` replace previous rows.
+
+    Changes are logged before they are made, and only become visible once
+    `version` has become the version of the database, which happens as soon
+    as the first step of an update is committed. The exposures of steps that
+    were interrupted are logged again in the version of the next update.
+
+    """
+
+    # Obtain the changelog, creating it if it does not exist yet
+    if 'changelog' not in m_file:
+        m_file.create_dataset('changelog', shape=(0,), dtype=CHANGELOG_DTYPE,
+                              maxshape=(None,))
+    log_dset = m_file['changelog']
+
+    # Remove all exposures that were already logged in this version
+    changes = log_dset[()]
+    expnums = np.setdiff1d(expnums, changes['expnum'][
+        changes['version'] == version])
+
+    # Add all remaining exposures to the changelog
+    expnums_replaced = set(expnums_replaced)
+    n_changes = len(changes)
+    log_dset.resize(n_changes+len(expnums), axis=0)
+    if expnums.size:
+        log_dset[n_changes:] = np.array(
+            [(version, expnum, expnum in expnums_replaced)
+             for expnum in expnums.tolist()], dtype=CHANGELOG_DTYPE)
+
+
+# This function logs the objids whose rows are removed in a database version
+def log_removed_objids(m_file, version, objids):
+    """
+    Logs in the 'removed_objids' dataset of the opened master file `m_file`
+    that rows of the provided `objids` are removed in database `version`.
+
+    Like :func:`~log_changes`, the objids are logged before their rows are
+    removed, and only become visible once `version` has become the version
+    of the database.
+
+    """
+
+    # Obtain the log, creating it if it does not exist yet
+    if 'removed_objids' not in m_file:
+        m_file.create_dataset('removed_objids', shape=(0,),
+                              dtype=REMOVED_OBJIDS_DTYPE, maxshape=(None,))
+    log_dset = m_file['removed_objids']
+
+    # Remove all objids that were already logged in this version
+    removed = log_dset[()]
+    objids = np.setdiff1d(objids, removed['objid'][
+        removed['version'] == version])
+
+    # Add all remaining objids to the log
+    n_removed = len(removed)
+    log_dset.resize(n_removed+len(objids), axis=0)
+    if objids.size:
+        log_dset[n_removed:] = np.rec.fromarrays(
+            [np.full(len(objids), version), objids],
+            dtype=REMOVED_OBJIDS_DTYPE)
 
 
 # This function checks if the database exists and proceeds accordingly
@@ -771,43 +3042,230 @@ def raise_error(message):
         raise OSError(message)
 
 
-# This function creates a generator that returns dynamically sized slices
-def dyn_range(n, step=100):
+# This function divides temporary exposure files up into memory-sized batches
+def iter_merge_batches(temp_files, max_memory=None, master_exp_file=None,
+                       max_delay=None):
     """
-    Generator that returns slices of range `step` for indexing an object of
-    length `n`. The last slice has a range of up to `step*1.5`.
+    Generator that divides the provided `temp_files` up into batches that are
+    merged into the master exposure file together, providing every batch as
+    soon as it is complete.
+
+    `temp_files` can contain *None* to signal that no further file is
+    available at that moment (as provided by :func:`~iter_processed_files`).
+    If `max_delay` is given, the current batch is then provided even if it is
+    not complete, once its first file has been waiting for at least
+    `max_delay` seconds. This allows for batches to be merged while the
+    exposures of the next batch are still being processed.
+
+    If `max_memory` is given, the estimated memory usage of every batch,
+    including the chunks of the master exposure file it is merged with, does
+    not exceed it. The memory usage of an exposure file is estimated as the
+    maximum of its file size and the in-memory size of its rows. As the
+    master exposure file is streamed chunk by chunk during a merge, solely
+    the chunks that are held in memory at once (see
+    :func:`~mldatabase._writer.get_working_set`) are counted for it. A file
+    that does not fit within `max_memory` on its own is put into a batch of
+    its own.
 
     Parameters
     ----------
-    n : int
-        The length of the object the slices will be used for.
+    temp_files : iterable of str
+        Iterable with the paths to all temporary exposure HDF5-files.
 
     Optional
     --------
-    step : int. Default: 100
-        The step size of each slice.
+    max_memory : int or None. Default: None
+        The maximum number of bytes a single batch can use. If *None*,
+        batches of :attr:`~MERGE_BATCH_SIZE` files are used instead.
+    master_exp_file : str or None. Default: None
+        The path to the master exposure HDF5-file that every batch is merged
+        with. If *None*, the memory usage of its chunks is not counted.
+    max_delay : float or None. Default: None
+        The number of seconds after which a batch is provided once no further
+        file is available. If *None*, batches are only provided once they
+        are complete.
+
+    Yields
+    ------
+    batch : list of str
+        List with a batch of temporary exposure HDF5-files.
 
     """
 
-    # Calculate step_max
-    step_max = int(step*1.5)
+    # Initialize the current batch
+    batch = []
+    batch_nbytes = 0
+    batch_start = None
+
+    # Loop over all temporary files
+    for temp_file in temp_files:
+        # If no further file is available, provide the batch if it waited
+        # long enough
+        if temp_file is None:
+            if(batch and max_delay is not None and
+               time.monotonic()-batch_start >= max_delay):
+                yield(batch)
+                batch = []
+            continue
+
+        # If no memory budget is used, every file counts as one
+        if max_memory is None:
+            nbytes = 1
+            max_nbytes = MERGE_BATCH_SIZE
+
+        # Else, estimate the memory usage of this file
+        else:
+            nbytes = estimate_nbytes(temp_file)
+            max_nbytes = max_memory
+
+        # If this file does not fit in the current batch, provide the batch
+        if batch and (batch_nbytes+nbytes > max_nbytes):
+            yield(batch)
+            batch = []
+
+        # If a new batch is started, count the chunks of the master exposure
+        # file that are held in memory at once first
+        if not batch:
+            batch_nbytes = 0
+            batch_start = time.monotonic()
+            if(max_memory is not None and master_exp_file is not None and
+               path.exists(master_exp_file)):
+                batch_nbytes = min(estimate_nbytes(master_exp_file),
+                                   get_working_set(EXP_HEADER.values()))
+
+            # If this file does not fit within the budget on its own, warn
+            if(batch_nbytes+nbytes > max_nbytes):
+                print(f"WARNING: Processed exposure file {temp_file!r} "
+                      f"requires an estimated {format_size(nbytes)}, which "
+                      f"(together with the {format_size(batch_nbytes)} used "
+                      f"for merging it with the database) exceeds the memory "
+                      f"budget of {format_size(max_memory)}. It will be "
+                      f"merged on its own.")
+
+        # Add this file to the current batch
+        batch.append(temp_file)
+        batch_nbytes += nbytes
+
+    # Provide the last batch
+    if batch:
+        yield(batch)
+
+
+# This function estimates the memory usage of an exposure file
+def estimate_nbytes(exp_file):
+    """
+    Returns the estimated number of bytes that the exposure HDF5-file
+    `exp_file` uses in memory, which is the maximum of its file size and the
+    in-memory size of its rows.
+
+    """
+
+    # Determine the number of bytes a single row takes in memory
+    row_nbytes = sum(np.dtype(dtype).itemsize for dtype in EXP_HEADER.values())
+
+    # Determine the number of rows in this file
+    with h5py.File(exp_file, 'r') as file:
+        n_rows = file[VAEX_COLUMN.format('objid')].shape[0]
+
+    # Return the estimate
+    return(max(path.getsize(exp_file), n_rows*row_nbytes))
 
-    # Initialize upper limit
-    b = 0
 
-    # Keep generating new slices until n has been reached
-    while(b < n):
-        # Set lower limit to previous upper limit
-        a = b
+# This function determines how many exposures can be processed in advance
+def get_queue_size(exp_dict, max_memory=None):
+    """
+    Returns the number of processed exposures of the provided `exp_dict` that
+    can wait to be merged at once, such that they fit within `max_memory`.
+
+    The memory usage of an exposure is estimated as the size of its exposure
+    file, which is larger than the in-memory size of its rows. If
+    `max_memory` is *None*, :attr:`~MERGE_BATCH_SIZE` is returned.
 
-        # Increase upper limit by step except if less than step_max remain
-        b += step_max if(n-b <= step_max) else step
+    """
 
-        # Make sure upper limit is not higher than n
-        b = min(b, n)
+    # If no memory budget is used, use the batch size
+    if max_memory is None or not exp_dict:
+        return(MERGE_BATCH_SIZE)
 
-        # Return the next slice
-        yield(slice(a, b))
+    # Else, determine how many exposures of average size fit in the budget
+    nbytes = np.mean([path.getsize(exp_files[0])
+                      for exp_files in exp_dict.values()])
+    return(max(1, int(max_memory//max(nbytes, 1))))
+
+
+# This function merges two sorted sets of objids with their counts
+def merge_counts(objids1, counts1, objids2, counts2):
+    """
+    Merges the sorted unique `objids1` and `objids2` together, adding up their
+    corresponding `counts1` and `counts2`.
+
+    Parameters
+    ----------
+    objids1, objids2 : :obj:`~numpy.ndarray` object
+        The sorted unique objids to merge.
+    counts1, counts2 : :obj:`~numpy.ndarray` object
+        The counts that belong to `objids1` and `objids2`.
+
+    Returns
+    -------
+    objids : :obj:`~numpy.ndarray` object
+        The sorted unique objids in both `objids1` and `objids2`.
+    counts : :obj:`~numpy.ndarray` object
+        The summed counts that belong to `objids`.
+
+    """
+
+    # Combine both sets and sort them with a merge sort
+    objids = np.concatenate([objids1, objids2])
+    counts = np.concatenate([counts1, counts2])
+    index = np.argsort(objids, kind='mergesort')
+    objids = objids[index]
+    counts = counts[index]
+
+    # If there are no objids, return them
+    if not objids.size:
+        return(objids, counts)
+
+    # Determine where every unique objid starts
+    starts = np.flatnonzero(np.r_[True, objids[1:] != objids[:-1]])
+
+    # Return the unique objids and their summed counts
+    return(objids[starts], np.add.reduceat(counts, starts))
+
+
+# This function parses a size string into a number of bytes
+def parse_size(size):
+    """
+    Parses the provided `size` string (e.g., '512MiB', '4 GiB' or '1e9') into
+    a number of bytes. All suffixes are interpreted as binary multiples.
+
+    """
+
+    # Match the size string
+    match = re.fullmatch(r"\s*(?P<value>\d+(?:\.\d*)?(?:e\d+)?)\s*"
+                         r"(?:(?P<prefix>[KMGTPEZY])(?:i?B)?|B|bytes)?\s*",
+                         size, re.I)
+
+    # If the size string is not valid, raise error
+    if match is None:
+        raise argparse.ArgumentTypeError(f"Invalid size {size!r}!")
+
+    # Determine the multiplier of the prefix
+    prefix = match['prefix']
+    order = SIZE_SUFFIXES.index(f"{prefix.upper()}iB") if prefix else 0
+
+    # Return the number of bytes
+    return(int(float(match['value'])*(1 << (order*10))))
+
+
+# This function formats a number of bytes as a size string
+def format_size(nbytes):
+    # Determine the order of the size
+    size_order = int(np.log2(nbytes)//10) if nbytes else 0
+    size_val = nbytes/(1 << (size_order*10))
+
+    # Return the size string
+    return(f"{size_val:,.1f} {SIZE_SUFFIXES[size_order]}")
 
 
 # %% MAIN FUNCTION
@@ -859,6 +3317,45 @@ def main():
         type=int,
         dest='n_expnums')
 
+    # Add optional 'jobs' argument
+    parent_parser.add_argument(
+        '-j', '--jobs',
+        help="Number of processes used for processing exposures",
+        metavar='N',
+        action='store',
+        default=1,
+        type=int,
+        dest='jobs')
+
+    # Add optional 'profile' argument
+    parent_parser.add_argument(
+        '--profile',
+        help=("Record the wall time, CPU time, throughput and peak memory "
+              "usage of every update stage and write them to a JSON-file in "
+              f"the {MLD_NAME!r} directory"),
+        action='store_true',
+        dest='profile')
+
+    # Add optional 'pyramid' argument
+    parent_parser.add_argument(
+        '--pyramid',
+        help=("Build a pyramid of binned light curves for fast plotting after "
+              "the update. Once built, it is rebuilt after every update"),
+        action='store_true',
+        dest='pyramid')
+
+    # Add optional 'max_memory' argument
+    parent_parser.add_argument(
+        '--max-memory',
+        help=("Memory budget for updating the database (e.g., '4GiB'). If "
+              "given, processed exposures are merged in batches that fit "
+              "within this budget instead of in batches of 100"),
+        metavar='SIZE',
+        action='store',
+        default=None,
+        type=parse_size,
+        dest='max_memory')
+
     # INIT COMMAND
     # Add init subparser
     init_parser = subparsers.add_parser(
@@ -871,6 +3368,157 @@ def main():
     # Set defaults for init_parser
     init_parser.set_defaults(func=cli_init)
 
+    # EXPORT COMMAND
+    # Add export subparser
+    export_parser = subparsers.add_parser(
+        'export',
+        description=("Stream (a selection of) an existing micro-lensing "
+                     "database in DIR to an Arrow IPC or Parquet file"),
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        add_help=True)
+
+    # Add 'output' argument
+    export_parser.add_argument(
+        'output',
+        help=("File to export to. Its extension determines the format "
+              "('.arrow', '.feather' or '.ipc' for Arrow IPC; '.parquet' for "
+              "Parquet). A directory if --partitions is given"),
+        metavar='OUTPUT',
+        action='store',
+        type=str)
+
+    # Add optional 'columns' argument
+    export_parser.add_argument(
+        '-c', '--columns',
+        help="Columns to export. All columns are exported if not given",
+        metavar='COLUMN',
+        action='store',
+        nargs='+',
+        default=None,
+        choices=list(EXP_HEADER),
+        dest='columns')
+
+    # Add optional 'format' argument
+    export_parser.add_argument(
+        '--format',
+        help="Format to export to, overriding the extension of OUTPUT",
+        action='store',
+        default=None,
+        choices=['ipc', 'parquet'],
+        dest='format')
+
+    # Add optional 'expnums' argument
+    export_parser.add_argument(
+        '--expnums',
+        help="Only export the rows of these exposures",
+        metavar='EXPNUM',
+        action='store',
+        nargs='+',
+        default=None,
+        type=int,
+        dest='expnums')
+
+    # Add optional 'objid_range' argument
+    export_parser.add_argument(
+        '--objid-range',
+        help="Only export the rows with an objid in this inclusive range",
+        metavar=('MIN', 'MAX'),
+        action='store',
+        nargs=2,
+        default=None,
+        type=int,
+        dest='objid_range')
+
+    # Add optional 'hjd_range' argument
+    export_parser.add_argument(
+        '--hjd-range',
+        help="Only export the rows with an hjd in this inclusive range",
+        metavar=('MIN', 'MAX'),
+        action='store',
+        nargs=2,
+        default=None,
+        type=float,
+        dest='hjd_range')
+
+    # Add optional 'batch_size' argument
+    export_parser.add_argument(
+        '--batch-size',
+        help="Number of rows in a single record batch",
+        metavar='N',
+        action='store',
+        default=1_000_000,
+        type=int,
+        dest='batch_size')
+
+    # Add optional 'partitions' argument
+    export_parser.add_argument(
+        '--partitions',
+        help=("Partition the rows in N objid ranges of roughly equal size, "
+              "which are exported to separate files in OUTPUT"),
+        metavar='N',
+        action='store',
+        default=None,
+        type=int,
+        dest='partitions')
+
+    # Set defaults for export_parser
+    export_parser.set_defaults(func=cli_export)
+
+    # FEDERATE COMMAND
+    # Add federate subparser
+    federate_parser = subparsers.add_parser(
+        'federate',
+        description=("Combine the existing micro-lensing databases in "
+                     "multiple DIRs and show their combined status, or the "
+                     "light curves of objects in all of them"),
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        add_help=True)
+
+    # Add 'dirs' argument
+    federate_parser.add_argument(
+        'dirs',
+        help="Micro-lensing database directories to combine",
+        metavar='DIR',
+        action='store',
+        nargs='+',
+        type=str)
+
+    # Add optional 'objids' argument
+    federate_parser.add_argument(
+        '--objids',
+        help="Show the light curves of these objects instead",
+        metavar='OBJID',
+        action='store',
+        nargs='+',
+        default=None,
+        type=int,
+        dest='objids')
+
+    # Add optional 'columns' argument
+    federate_parser.add_argument(
+        '-c', '--columns',
+        help="Columns of the light curves to show. All if not given",
+        metavar='COLUMN',
+        action='store',
+        nargs='+',
+        default=None,
+        choices=list(EXP_HEADER),
+        dest='columns')
+
+    # Add optional 'threads' argument
+    federate_parser.add_argument(
+        '-t', '--threads',
+        help=("Number of databases that are worked on in parallel. All of "
+              "them if not given"),
+        metavar='N',
+        action='store',
+        default=None,
+        type=int,
+        dest='threads')
+
+    # Set defaults for federate_parser
+    federate_parser.set_defaults(func=cli_federate)
+
     # IPYTHON COMMAND
     # Add IPython subparser
     ipython_parser = subparsers.add_parser(
@@ -887,6 +3535,29 @@ def main():
         action='store_true',
         dest='counter')
 
+    # Add optional 'cache_dir' argument
+    ipython_parser.add_argument(
+        '--cache-dir',
+        help=(f"Directory on a node-local disk in which a copy of the "
+              f"database is cached. If not given, ${CACHE_DIR_ENV} is used "
+              f"if set"),
+        metavar='CACHE_DIR',
+        action='store',
+        default=None,
+        type=str,
+        dest='cache_dir')
+
+    # Add optional 'cache_size' argument
+    ipython_parser.add_argument(
+        '--cache-size',
+        help=(f"Maximum size of the cache (e.g., '100GiB'). If not given, "
+              f"${CACHE_SIZE_ENV} is used if set"),
+        metavar='SIZE',
+        action='store',
+        default=None,
+        type=parse_size,
+        dest='cache_size')
+
     # Set defaults for ipython_parser
     ipython_parser.set_defaults(func=cli_ipython)
 
@@ -923,12 +3594,208 @@ def main():
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
         add_help=True)
 
+    # Add optional 'watch' argument
+    update_parser.add_argument(
+        '--watch',
+        help=("Keep running and continuously add new exposures to the "
+              "database in micro-batches as they arrive in DIR. Uses inotify "
+              "if the 'inotify_simple' package is installed and polling "
+              "otherwise"),
+        action='store_true',
+        dest='watch')
+
+    # Add optional 'interval' argument
+    update_parser.add_argument(
+        '--interval',
+        help="Number of seconds between scans of DIR when watching",
+        metavar='SECONDS',
+        action='store',
+        default=10.0,
+        type=float,
+        dest='interval')
+
+    # Add optional 'settle' argument
+    update_parser.add_argument(
+        '--settle',
+        help=("Number of seconds the files of an exposure must be unchanged "
+              "before it is considered complete when watching"),
+        metavar='SECONDS',
+        action='store',
+        default=30.0,
+        type=float,
+        dest='settle')
+
+    # Add optional 'latency' argument
+    update_parser.add_argument(
+        '--latency',
+        help=("Target number of seconds between an exposure being complete "
+              "and it being available in the database when watching"),
+        metavar='SECONDS',
+        action='store',
+        default=300.0,
+        type=float,
+        dest='latency')
+
+    # Add optional 'batch_size' argument
+    update_parser.add_argument(
+        '--batch-size',
+        help=("Maximum number of exposures that are added to the database at "
+              "once when watching"),
+        metavar='N',
+        action='store',
+        default=100,
+        type=int,
+        dest='batch_size')
+
+    # Add optional 'coordinate' argument
+    update_parser.add_argument(
+        '--coordinate',
+        help=("Keep running and merge all exposures that are processed by "
+              "'worker' processes (on this or other nodes) every --interval "
+              "seconds, until all workers have finished"),
+        action='store_true',
+        dest='coordinate')
+
+    # Add optional 'stale' argument
+    update_parser.add_argument(
+        '--stale',
+        help=("Number of seconds after which claims of workers that show no "
+              "sign of life are expired when coordinating"),
+        metavar='SECONDS',
+        action='store',
+        default=600.0,
+        type=float,
+        dest='stale')
+
     # Set defaults for update_parser
     update_parser.set_defaults(func=cli_update)
 
-    # Parse the arguments
-    global ARGS
-    ARGS = parser.parse_args()
+    # WORKER COMMAND
+    # Add worker subparser
+    worker_parser = subparsers.add_parser(
+        'worker',
+        description=("Process exposures in DIR for an 'update --coordinate' "
+                     "process. Any number of workers can be started on any "
+                     "number of nodes that share DIR"),
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        add_help=True)
+
+    # Add optional 'nexpnums' argument
+    worker_parser.add_argument(
+        '-n', '--n_expnums',
+        help="Number of exposures to use",
+        metavar='N',
+        action='store',
+        default=None,
+        type=int,
+        dest='n_expnums')
+
+    # Add optional 'max_expnums' argument
+    worker_parser.add_argument(
+        '-m', '--max_expnums',
+        help="Maximum number of exposures this worker processes",
+        metavar='M',
+        action='store',
+        default=None,
+        type=int,
+        dest='max_expnums')
+
+    # Add optional 'stale' argument
+    worker_parser.add_argument(
+        '--stale',
+        help=("Number of seconds after which claims of other workers that "
+              "show no sign of life are taken over"),
+        metavar='SECONDS',
+        action='store',
+        default=600.0,
+        type=float,
+        dest='stale')
+
+    # Set defaults for worker_parser
+    worker_parser.set_defaults(func=cli_worker)
+
+    # XMATCH COMMAND
+    # Add xmatch subparser
+    xmatch_parser = subparsers.add_parser(
+        'xmatch',
+        description=("Cross-match a catalog of positions against the mean "
+                     "positions of all objects in an existing micro-lensing "
+                     "database in DIR"),
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        add_help=True)
+
+    # Add 'catalog' argument
+    xmatch_parser.add_argument(
+        'catalog',
+        help="CSV-file with the positions (in degrees) of the catalog",
+        metavar='CATALOG',
+        action='store',
+        type=str)
+
+    # Add optional 'radius' argument
+    xmatch_parser.add_argument(
+        '-r', '--radius',
+        help="Match radius in arcseconds",
+        metavar='ARCSEC',
+        action='store',
+        default=1.0,
+        type=float,
+        dest='radius')
+
+    # Add optional 'all' argument
+    xmatch_parser.add_argument(
+        '--all',
+        help=("Return all objects within the match radius of every source "
+              "instead of solely the nearest one"),
+        action='store_true',
+        dest='all')
+
+    # Add optional 'output' argument
+    xmatch_parser.add_argument(
+        '-o', '--output',
+        help="CSV-file to write the matches to. They are printed if not given",
+        metavar='OUTPUT',
+        action='store',
+        default=None,
+        type=str,
+        dest='output')
+
+    # Add optional 'ra_col' argument
+    xmatch_parser.add_argument(
+        '--ra-col',
+        help="Name of the column in CATALOG that holds the right ascension",
+        metavar='NAME',
+        action='store',
+        default='ra',
+        type=str,
+        dest='ra_col')
+
+    # Add optional 'decl_col' argument
+    xmatch_parser.add_argument(
+        '--decl-col',
+        help="Name of the column in CATALOG that holds the declination",
+        metavar='NAME',
+        action='store',
+        default='decl',
+        type=str,
+        dest='decl_col')
+
+    # Add optional 'threads' argument
+    xmatch_parser.add_argument(
+        '-t', '--threads',
+        help=("Number of partitions of CATALOG that are matched in "
+              "parallel. The number of CPUs if not given"),
+        metavar='N',
+        action='store',
+        default=None,
+        type=int,
+        dest='threads')
+
+    # Set defaults for xmatch_parser
+    xmatch_parser.set_defaults(func=cli_xmatch)
+
+    # Parse the arguments and use them as the arguments of this thread
+    set_args(parser.parse_args())
 
     # Make sure provided dir is an absolute path
     ARGS.dir = path.abspath(ARGS.dir)
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+
+"""
+Cache
+=====
+Provides the node-local cache of database files, which keeps copies of the
+files of databases that live on a network filesystem on a local disk.
+Copies are shared between all processes on a node, validated against the
+version of the database they were copied from, and evicted in
+least-recently-used order once the cache grows too large.
+
+"""
+
+
+# %% IMPORTS
+# Built-in imports
+from contextlib import contextmanager
+from glob import glob
+import hashlib
+import os
+from os import path
+import shutil
+
+# Package imports
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# MLDatabase imports
+from mldatabase._globals import CACHE_DIR_ENV
+
+# All declaration
+__all__ = ['cached_file', 'clear_cache']
+
+
+# %% FUNCTION DEFINITIONS
+# This function provides a cached copy of a file
+@contextmanager
+def cached_file(filename, version, cache_dir, cache_size=None):
+    """
+    Context manager that yields the path to a copy of the provided
+    `filename` in the provided `cache_dir`, copying it there if the cache has
+    no copy of this `version` of it yet. The copy is protected from eviction
+    until the context manager exits.
+
+    If `cache_dir` is *None*, file locking is not available or the file
+    cannot be cached within `cache_size` bytes (or the free space in
+    `cache_dir`), `filename` itself is yielded instead. The same happens if
+    another process is copying the file into the cache at that moment, such
+    that no process ever waits for a copy to finish.
+
+    """
+
+    # If no cache can be used, use the file itself
+    if cache_dir is None or fcntl is None:
+        yield filename
+        return
+
+    # Determine the cache entry of this version of the file
+    os.makedirs(cache_dir, exist_ok=True)
+    stat = os.stat(filename)
+    key = hashlib.sha1(f"{path.realpath(filename)}:{version}:{stat.st_size}:"
+                       f"{stat.st_mtime_ns}".encode()).hexdigest()[:20]
+    entry = path.join(cache_dir, key)
+    cache_file = path.join(entry, path.basename(filename))
+
+    # Mark the entry as used, which protects its copy from eviction
+    # If another process is copying the file into it, use the file itself
+    lock_name = f"{entry}.lock"
+    try:
+        use_file = lock_entry(lock_name, fcntl.LOCK_SH | fcntl.LOCK_NB)
+    except BlockingIOError:
+        use_file = None
+    try:
+        # If the entry has no copy yet, try to become the process that copies
+        # the file into it
+        if use_file is not None and not path.exists(cache_file):
+            use_file.close()
+            try:
+                use_file = lock_entry(lock_name, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                use_file = None
+
+            # If another process is using this entry, use the file itself
+            # Else, copy the file into the cache if it is not there yet
+            if use_file is not None and not path.exists(cache_file):
+                # Remove partial copies of processes that were killed
+                for part_file in glob(f"{cache_file}.part*"):
+                    os.remove(part_file)
+
+                # Copy the file if it fits
+                if make_room(cache_dir, stat.st_size, cache_size, key):
+                    os.makedirs(entry, exist_ok=True)
+                    part_file = f"{cache_file}.part{os.getpid()}"
+                    shutil.copyfile(filename, part_file)
+                    os.replace(part_file, cache_file)
+
+            # Allow other processes to use the entry as well
+            if use_file is not None:
+                fcntl.flock(use_file, fcntl.LOCK_SH)
+
+        # Use the copy if there is one
+        if use_file is not None and path.exists(cache_file):
+            os.utime(entry)
+        else:
+            cache_file = filename
+
+        # Yield the file that must be used
+        yield cache_file
+
+    # Release the entry
+    finally:
+        if use_file is not None:
+            use_file.close()
+
+
+# This function removes all unused entries from a cache
+def clear_cache(cache_dir=None):
+    """
+    Removes all copies in the provided node-local `cache_dir` that are not
+    currently in use by any process.
+
+    Optional
+    --------
+    cache_dir : str or None. Default: None
+        The path to the cache directory. If *None*, the directory in the
+        'MLDATABASE_CACHE_DIR' environment variable is used, if any.
+
+    """
+
+    # Obtain the cache directory
+    if cache_dir is None:
+        cache_dir = os.environ.get(CACHE_DIR_ENV)
+
+    # Remove all entries that are not in use
+    if cache_dir is not None and path.exists(cache_dir) and fcntl is not None:
+        make_room(cache_dir, 0, 0, None)
+
+
+# This function evicts entries from a cache until a file fits in it
+def make_room(cache_dir, size, cache_size, key):
+    """
+    Evicts the least-recently-used entries (except the one with `key`) from
+    the provided `cache_dir` until a file of `size` bytes fits within
+    `cache_size` bytes and the free space on its disk. Entries that are in
+    use by any process are never evicted.
+
+    Returns
+    -------
+    fits : bool
+        Whether a file of `size` bytes fits in the cache now.
+
+    """
+
+    # Make sure that only a single process evicts entries at once
+    with use_lock(open_lock_file(path.join(cache_dir, '.cache.lock')),
+                  fcntl.LOCK_EX):
+        # Obtain all entries, sorted on when they were last used
+        entries = [entry for entry in glob(path.join(cache_dir, '*'))
+                   if path.isdir(entry) and path.basename(entry) != key]
+        entries.sort(key=path.getmtime)
+        sizes = {entry: sum(map(path.getsize, glob(path.join(entry, '*'))))
+                 for entry in entries}
+
+        # Determine how many bytes must be freed
+        cache_size = float('inf') if cache_size is None else cache_size
+        free = shutil.disk_usage(cache_dir).free
+        excess = max(sum(sizes.values())+size-cache_size, size-free)
+
+        # If the file cannot fit at all, do not evict anything
+        if(size > min(cache_size, free+sum(sizes.values()))):
+            return(False)
+
+        # Evict the least recently used entries until enough has been freed
+        for entry in entries:
+            if(excess <= 0):
+                break
+
+            # Remove it with its lock file, unless another process uses it
+            if remove_entry(entry):
+                excess -= sizes[entry]
+
+        # Remove the lock files of all entries that have no copy
+        for lock_name in glob(path.join(cache_dir, '*.lock')):
+            entry = lock_name[:-len('.lock')]
+            if(path.basename(entry) != key and not path.exists(entry)):
+                remove_entry(entry)
+
+    # Return whether the file fits now
+    return(excess <= 0)
+
+
+# This function removes an entry from a cache if it is not in use
+def remove_entry(entry):
+    """
+    Removes the provided cache `entry` and its lock file, unless it is in use
+    by any process.
+
+    Returns
+    -------
+    removed : bool
+        Whether the entry was removed.
+
+    """
+
+    # Skip this entry if another process is using it
+    lock_name = f"{entry}.lock"
+    try:
+        lock_file = lock_entry(lock_name, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return(False)
+
+    # Remove it, removing its lock file while it is still locked
+    with use_lock(lock_file, None):
+        shutil.rmtree(entry, ignore_errors=True)
+        os.remove(lock_name)
+    return(True)
+
+
+# This function locks the lock file of a cache entry
+def lock_entry(lock_name, operation):
+    """
+    Opens the lock file `lock_name` and locks it with the provided
+    `operation`, raising a :class:`BlockingIOError` if it is nonblocking and
+    the lock is held by another process.
+
+    As lock files are removed when their entries are evicted, the lock file
+    is opened again if it was removed or replaced before it was locked, such
+    that the returned lock is always held on the current lock file.
+
+    """
+
+    while True:
+        # Open and lock the lock file
+        lock_file = open_lock_file(lock_name)
+        try:
+            fcntl.flock(lock_file, operation)
+            inode = os.stat(lock_name).st_ino
+        except FileNotFoundError:
+            inode = None
+        except BaseException:
+            lock_file.close()
+            raise
+
+        # Return it if it is still the current lock file
+        if(inode == os.fstat(lock_file.fileno()).st_ino):
+            return(lock_file)
+        lock_file.close()
+
+
+# This function opens a lock file
+def open_lock_file(filename):
+    return(open(filename, 'a+b'))
+
+
+# This function holds a lock on an opened lock file and closes it afterward
+@contextmanager
+def use_lock(lock_file, operation):
+    try:
+        if operation is not None:
+            fcntl.flock(lock_file, operation)
+        yield lock_file
+    finally:
+        lock_file.close()
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+
+"""
+Coordination
+============
+Provides the claim-files, heartbeats and processing reports that are used for
+coordinating multiple worker processes (on one or more nodes) that process
+exposures for the same micro-lensing database through a shared filesystem.
+
+"""
+
+
+# %% IMPORTS
+# Built-in imports
+from glob import glob
+import os
+from os import path
+import re
+import socket
+from threading import Event, Thread
+import time
+
+# Package imports
+import numpy as np
+
+# MLDatabase imports
+from mldatabase._globals import CLAIMS_DIR, REPORTS_DIR
+
+# All declaration
+__all__ = ['Heartbeat', 'claim_exposure', 'expire_stale_files',
+           'get_active_claims', 'get_worker_id', 'read_reports',
+           'write_report']
+
+
+# %% CLASS DEFINITIONS
+# Define class that keeps files from becoming stale while it is running
+class Heartbeat(Thread):
+    """
+    Daemon thread that updates the last-modified times of the provided files
+    every `interval` seconds until it is stopped, which signals to other
+    processes that these files are still in use.
+
+    Parameters
+    ----------
+    files : list of str
+        The paths to all files that must be kept alive.
+    interval : float
+        The number of seconds between two consecutive heartbeats.
+
+    """
+
+    def __init__(self, files, interval):
+        # Call super constructor
+        super().__init__(daemon=True)
+
+        # Save provided files and interval
+        self.files = list(files)
+        self.interval = interval
+        self._stopped = Event()
+
+    # This function performs the heartbeats until the thread is stopped
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            for file in self.files:
+                try:
+                    os.utime(file)
+                except FileNotFoundError:
+                    pass
+
+    # This function stops the heartbeats
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+# %% FUNCTION DEFINITIONS
+# This function returns an identifier that is unique for this process
+def get_worker_id():
+    # Combine hostname and PID, replacing all unsafe characters in hostname
+    hostname = re.sub(r"[^\w\-]", '-', socket.gethostname())
+    return(f"{hostname}_{os.getpid()}")
+
+
+# This function tries to claim an exposure for this process
+def claim_exposure(mld, expnum, stale):
+    """
+    Tries to atomically claim the exposure with the provided `expnum` in the
+    database directory `mld` for this process.
+
+    A claim of a different process that was not kept alive for `stale`
+    seconds, is expired and taken over.
+
+    Returns
+    -------
+    claim_file : str or None
+        The path to the claim-file if the claim was successful, or *None* if
+        the exposure was already claimed by a different process.
+
+    """
+
+    # Determine the path to the claim-file
+    claim_dir = path.join(mld, CLAIMS_DIR)
+    claim_file = path.join(claim_dir, f"exp{expnum}.claim")
+    os.makedirs(claim_dir, exist_ok=True)
+
+    # Try to claim the exposure twice, expiring a stale claim in between
+    for _ in range(2):
+        # Try to create the claim-file, which fails if it already exists
+        try:
+            fd = os.open(claim_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY,
+                         0o664)
+
+        # If it already exists, check if the claim is stale
+        except FileExistsError:
+            if not expire_claim(claim_file, stale):
+                return(None)
+
+        # If it did not exist, write who claimed it and return it
+        else:
+            with os.fdopen(fd, 'w') as file:
+                file.write(f"{get_worker_id()} {time.time()}\n")
+            return(claim_file)
+
+    # If the exposure could not be claimed twice, it was claimed by another
+    return(None)
+
+
+# This function expires a claim-file if it is stale
+def expire_claim(claim_file, stale):
+    # Check how long ago the claim-file was last modified
+    try:
+        age = time.time()-path.getmtime(claim_file)
+    except FileNotFoundError:
+        return(True)
+
+    # If the claim is not stale, it cannot be expired
+    if(age < stale):
+        return(False)
+
+    # Atomically move the claim-file, which only a single process can do
+    expired_file = f"{claim_file}.expired_{get_worker_id()}"
+    try:
+        os.rename(claim_file, expired_file)
+    except FileNotFoundError:
+        return(True)
+
+    # If a different process renewed the claim in the meantime, restore it
+    if(time.time()-path.getmtime(expired_file) < stale):
+        try:
+            os.link(expired_file, claim_file)
+        except FileExistsError:
+            pass
+        os.remove(expired_file)
+        return(False)
+
+    # Remove the expired claim-file
+    os.remove(expired_file)
+    return(True)
+
+
+# This function returns all exposures that are actively claimed
+def get_active_claims(mld, stale):
+    # Initialize empty list of claimed expnums
+    expnums = []
+
+    # Loop over all claim-files
+    for claim_file in glob(path.join(mld, CLAIMS_DIR, 'exp*.claim')):
+        # Check if this claim is still active
+        try:
+            if(time.time()-path.getmtime(claim_file) < stale):
+                expnums.append(int(path.basename(claim_file)[3:-6]))
+        except FileNotFoundError:
+            pass
+
+    # Return expnums
+    return(expnums)
+
+
+# This function removes all stale claims, partial files and worker locks
+def expire_stale_files(mld, stale):
+    # Expire all stale claims
+    for claim_file in glob(path.join(mld, CLAIMS_DIR, 'exp*.claim')):
+        expire_claim(claim_file, stale)
+
+    # Remove all stale partial files and lock-files of crashed workers
+    for file in [*glob(path.join(mld, '.part_*')),
+                 *glob(path.join(mld, REPORTS_DIR, '.*.tmp')),
+                 *glob(path.join(mld, '.mld_worker_*.lock'))]:
+        try:
+            if(time.time()-path.getmtime(file) >= stale):
+                os.remove(file)
+        except FileNotFoundError:
+            pass
+
+
+# This function writes the processing report of an exposure
+def write_report(mld, record):
+    """
+    Atomically writes the provided exposure `record` (with the dtype of the
+    'expnums' dataset) as a processing report to the database directory `mld`,
+    such that it can be registered in the master file by the coordinator.
+
+    """
+
+    # Determine the paths to the report and its temporary file
+    report_dir = path.join(mld, REPORTS_DIR)
+    expnum = record['expnum']
+    report_file = path.join(report_dir, f"exp{expnum}.npy")
+    tmp_file = path.join(report_dir, f".exp{expnum}_{get_worker_id()}.tmp")
+    os.makedirs(report_dir, exist_ok=True)
+
+    # Write the report to the temporary file and move it into place
+    with open(tmp_file, 'wb') as file:
+        np.save(file, np.array([record], dtype=record.dtype))
+    os.replace(tmp_file, report_file)
+
+
+# This function reads all processing reports
+def read_reports(mld):
+    """
+    Reads all processing reports in the database directory `mld`.
+
+    Returns
+    -------
+    reports : list of tuple
+        List containing the path to every report and the exposure record it
+        contains, sorted on expnum.
+
+    """
+
+    # Initialize empty list of reports
+    reports = []
+
+    # Read all reports
+    for report_file in glob(path.join(mld, REPORTS_DIR, 'exp*.npy')):
+        reports.append((report_file, np.load(report_file)[0]))
+
+    # Return reports sorted on expnum
+    return(sorted(reports, key=lambda x: x[1]['expnum']))
@@ -12,12 +12,19 @@ Globals
 from os import path
 
 # All declaration
-__all__ = ['DIR_PATH', 'EXIT_KEYWORDS', 'EXP_HEADER', 'EXP_REGEX',
-           'MASTER_EXP_FILE', 'MASTER_FILE', 'MLD_NAME', 'PKG_NAME',
-           'REQ_FILES', 'SIZE_SUFFIXES', 'TEMP_EXP_FILE', 'XTR_HEADER']
+__all__ = ['CACHE_DIR_ENV', 'CACHE_SIZE_ENV', 'CLAIMS_DIR', 'CLUSTERED_DIR',
+           'DIR_PATH', 'EXIT_KEYWORDS', 'EXP_HEADER', 'EXP_REGEX',
+           'JOURNAL_DIR', 'MASTER_EXP_FILE', 'MASTER_FILE', 'MLD_NAME',
+           'PKG_NAME', 'POSITIONS_FILE', 'PROFILE_DIR', 'PYRAMID_FILE',
+           'REPORTS_DIR', 'REQ_FILES', 'SIZE_SUFFIXES', 'TEMP_EXP_FILE',
+           'VAEX_COLUMN', 'XTR_HEADER']
 
 
 # %% PACKAGE GLOBALS
+CACHE_DIR_ENV = 'MLDATABASE_CACHE_DIR'              # Env var of cache folder
+CACHE_SIZE_ENV = 'MLDATABASE_CACHE_SIZE'            # Env var of cache size
+CLAIMS_DIR = 'claims'                               # Name of claims folder
+CLUSTERED_DIR = 'clustered'                         # Name of clustered folder
 DIR_PATH = path.abspath(path.dirname(__file__))     # Path to this directory
 EXP_HEADER = {                                      # Header of exposure file
     'objid': int,
@@ -39,10 +46,15 @@ EXP_HEADER = {                                      # Header of exposure file
 # Regex for finding exposure CSV-files
 EXP_REGEX = (r"(?P<exp_file>(?P<base>Exp(?=\d*[1-9])(?P<expnum>\d+))\.csv)."
              r"*?(?P<xtr_file>(?P=base)_(xtr|epochs)\.csv)")
+JOURNAL_DIR = 'journal'                             # Name of journal folder
 MASTER_FILE = 'master.hdf5'                         # Name of master hdf5-file
 MASTER_EXP_FILE = 'exp_master.hdf5'                 # Name of master exp file
 MLD_NAME = '.mldatabase'                            # Name of database folder
 PKG_NAME = 'MLDatabase'                             # Name of package
+POSITIONS_FILE = 'positions.hdf5'                   # Name of positions file
+PROFILE_DIR = 'profiles'                            # Name of profiles folder
+PYRAMID_FILE = 'pyramid.hdf5'                       # Name of pyramid file
+REPORTS_DIR = 'reports'                             # Name of reports folder
 REQ_FILES = ['Exp0.csv', 'Exp0_xtr.csv']            # Exposure files required
 SIZE_SUFFIXES = ['bytes',                           # File size suffixes
                  'KiB',
@@ -54,6 +66,7 @@ SIZE_SUFFIXES = ['bytes',                           # File size suffixes
                  'ZiB',
                  'YiB']
 TEMP_EXP_FILE = 'temp_exp{}.hdf5'                   # Name of temp exp file
+VAEX_COLUMN = 'table/columns/{}/data'               # Column in vaex HDF5-file
 XTR_HEADER = {                                      # Header of xtr/epochs file
     'expnum': int,
     'hjd': float,
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+"""
+Journal
+=======
+Provides the write-ahead journal that records the intent and completion of
+every step that modifies the master exposure file of a micro-lensing
+database, such that an interrupted update can be rolled forward.
+
+"""
+
+
+# %% IMPORTS
+# Built-in imports
+import json
+import os
+from os import path
+
+# Package imports
+import numpy as np
+
+# MLDatabase imports
+from mldatabase._globals import JOURNAL_DIR
+
+# All declaration
+__all__ = ['clear_journal', 'fsync_file', 'read_journal',
+           'read_journal_counts', 'write_journal', 'write_journal_counts']
+
+
+# %% FUNCTION DEFINITIONS
+# This function makes sure that the contents of a file are on disk
+def fsync_file(filename):
+    with open(filename, 'rb') as file:
+        os.fsync(file.fileno())
+
+
+# This function atomically writes a file and makes sure it is on disk
+def atomic_write(filename, write_func):
+    # Write to a temporary file first
+    tmp_file = f"{filename}.tmp"
+    with open(tmp_file, 'wb') as file:
+        write_func(file)
+        file.flush()
+        os.fsync(file.fileno())
+
+    # Move it into place
+    os.replace(tmp_file, filename)
+
+
+# This function reads the journal entry of a database
+def read_journal(mld):
+    """
+    Reads the journal entry of the database in `mld`.
+
+    Returns
+    -------
+    entry : dict or None
+        The journal entry of the step that was being performed, or *None* if
+        no step was being performed.
+
+    """
+
+    # Read the journal entry if it exists
+    try:
+        with open(path.join(mld, JOURNAL_DIR, 'journal.json'), 'r') as file:
+            return(json.load(file))
+    except FileNotFoundError:
+        return(None)
+
+
+# This function writes the journal entry of a database
+def write_journal(mld, entry):
+    """
+    Atomically writes the provided journal `entry` to the database in `mld`,
+    replacing the previous entry.
+
+    """
+
+    # Make sure the journal directory exists
+    os.makedirs(path.join(mld, JOURNAL_DIR), exist_ok=True)
+
+    # Write the entry
+    atomic_write(path.join(mld, JOURNAL_DIR, 'journal.json'),
+                 lambda file: file.write(json.dumps(entry).encode()))
+
+
+# This function clears the journal of a database
+def clear_journal(mld):
+    # Remove the journal entry and its counts, if they exist
+    for name in ('journal.json', 'counts.npy'):
+        try:
+            os.remove(path.join(mld, JOURNAL_DIR, name))
+        except FileNotFoundError:
+            pass
+
+
+# This function writes the objid counts that a journaled step changes
+def write_journal_counts(mld, objids, counts):
+    """
+    Atomically writes the provided `objids` and the `counts` by which the
+    journaled step of the database in `mld` changes them.
+
+    """
+
+    # Make sure the journal directory exists
+    os.makedirs(path.join(mld, JOURNAL_DIR), exist_ok=True)
+
+    # Write the objids and counts
+    data = np.empty(len(objids), dtype=[('objid', int), ('count', int)])
+    data['objid'] = objids
+    data['count'] = counts
+    atomic_write(path.join(mld, JOURNAL_DIR, 'counts.npy'),
+                 lambda file: np.save(file, data))
+
+
+# This function reads the objid counts that a journaled step changes
+def read_journal_counts(mld):
+    data = np.load(path.join(mld, JOURNAL_DIR, 'counts.npy'))
+    return(data['objid'], data['count'])
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+
+"""
+Writer
+======
+Provides the parallel writer of the HDF5-files of micro-lensing databases,
+which writes all columns (and the chunks within every column) concurrently
+in the layout that vaex uses, as well as the functions that grow and shrink
+the columns of files that were written with resizable columns.
+
+"""
+
+
+# %% IMPORTS
+# Built-in imports
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+# Package imports
+import h5py
+import numpy as np
+
+# MLDatabase imports
+from mldatabase._globals import VAEX_COLUMN
+
+# All declaration
+__all__ = ['append_columns', 'get_working_set', 'is_resizable',
+           'truncate_columns', 'write_columns']
+
+
+# %% GLOBALS
+# Number of rows of a column that are written at once by a single thread
+CHUNK_SIZE = 1_000_000
+
+# Number of rows in a single HDF5-chunk of a resizable column
+RESIZABLE_CHUNK_SIZE = 65_536
+
+
+# %% FUNCTION DEFINITIONS
+# This function estimates the memory that writing columns uses at once
+def get_working_set(dtypes, n_threads=None):
+    """
+    Returns the number of bytes that :func:`~write_columns` holds in memory
+    at once when writing columns with the provided `dtypes` with `n_threads`
+    threads, which is independent of the number of rows that are written.
+
+    As all segments are copied chunk by chunk, every thread (including the
+    calling thread) holds at most a single chunk of a single column in memory
+    at any given time.
+
+    """
+
+    # Determine the number of threads
+    n_threads = n_threads if n_threads else os.cpu_count()
+
+    # Return the size of the largest chunk for every thread
+    itemsize = max((np.dtype(dtype).itemsize for dtype in dtypes), default=0)
+    return((n_threads+1)*CHUNK_SIZE*itemsize)
+
+
+# This function writes columns to an HDF5-file in parallel
+def write_columns(filename, columns, n_threads=None, resizable=False):
+    """
+    Writes the provided `columns` to a new HDF5-file `filename` in the layout
+    that vaex uses for its HDF5-files, with every column stored contiguously.
+
+    The layout of the file is created first with h5py, after which all
+    columns are written in chunks through memory maps of their datasets.
+    Chunks of segments that are NumPy arrays (like memory maps) are copied by
+    `n_threads` threads, which never call the HDF5-library (which serializes
+    all calls with a global lock), such that they are converted and written
+    truly concurrently. Chunks of all other segments (like h5py datasets)
+    are read by the calling thread instead, at the same time.
+
+    If `resizable` is *True*, every column is instead stored in HDF5-chunks
+    of :attr:`~RESIZABLE_CHUNK_SIZE` rows without a maximum length, such that
+    rows can be appended to it in place with :func:`~append_columns`. As
+    such columns cannot be mapped into memory, they are written by the
+    calling thread.
+
+    Parameters
+    ----------
+    filename : str
+        The path to the HDF5-file that must be written.
+    columns : dict of list
+        For every column name, the list of segments that make up the column
+        when concatenated. Segments can be anything that provides
+        :obj:`~numpy.ndarray` objects when sliced, like memory maps or h5py
+        datasets.
+
+    Optional
+    --------
+    n_threads : int or None. Default: None
+        The number of threads that write chunks concurrently. If *None*, the
+        number of CPUs is used.
+    resizable : bool. Default: False
+        Whether every column must be stored resizable instead of contiguous.
+
+    Returns
+    -------
+    n_rows : int
+        The number of rows that were written.
+
+    """
+
+    # Determine the number of rows and dtype of every column
+    n_rows = get_n_rows(columns)
+    dtypes = {name: np.dtype(segments[0].dtype)
+              for name, segments in columns.items()}
+
+    # Create the layout of the file and allocate the storage of every column
+    offsets = {}
+    with h5py.File(filename, 'w') as file:
+        file.create_group('table').attrs['type'] = 'table'
+        file['table'].create_group('columns').attrs['column_order'] =\
+            ','.join(columns)
+        for name in columns:
+            # If the column must be resizable, write it right away
+            if resizable:
+                dset = file.create_dataset(
+                    VAEX_COLUMN.format(name), (n_rows,), dtypes[name],
+                    chunks=(RESIZABLE_CHUNK_SIZE,), maxshape=(None,))
+                write_segments(dset, 0, columns[name])
+                continue
+
+            # Else, allocate its storage
+            dset = file.create_dataset(VAEX_COLUMN.format(name), (n_rows,),
+                                       dtypes[name])
+            if n_rows:
+                dset[0] = dset[0]
+                offsets[name] = dset.id.get_offset()
+
+    # If there are no rows or all columns were written, the file is complete
+    if not n_rows or resizable:
+        return(n_rows)
+
+    # Map the storage of every column into memory
+    memmaps = {name: np.memmap(filename, dtypes[name], 'r+', offsets[name],
+                               (n_rows,))
+               for name in columns}
+
+    # Divide all segments of all columns into chunks
+    # Segments that are not NumPy arrays may have to be read with the
+    # HDF5-library, so their chunks are written by the calling thread
+    tasks = []
+    read_tasks = []
+    for name, segments in columns.items():
+        start = 0
+        for segment in segments:
+            for i in range(0, len(segment), CHUNK_SIZE):
+                j = min(i+CHUNK_SIZE, len(segment))
+                (tasks if isinstance(segment, np.ndarray) else
+                 read_tasks).append((name, start+i, segment, i, j))
+            start += len(segment)
+
+    # Define function that writes a single chunk
+    def write_chunk(task):
+        name, start, segment, i, j = task
+        memmaps[name][start:start+j-i] = segment[i:j]
+
+    # Write all chunks in parallel and flush them to the file
+    try:
+        n_threads = n_threads if n_threads else os.cpu_count()
+        with ThreadPoolExecutor(n_threads) as executor:
+            results = executor.map(write_chunk, tasks)
+            for task in read_tasks:
+                write_chunk(task)
+            list(results)
+        for memmap in memmaps.values():
+            memmap.flush()
+
+    # Release all memory maps
+    finally:
+        memmaps.clear()
+
+    # Return the number of rows
+    return(n_rows)
+
+
+# This function appends rows to the resizable columns of an HDF5-file
+def append_columns(filename, columns):
+    """
+    Appends the provided `columns` to the resizable columns of the existing
+    HDF5-file `filename`, which must have been written by
+    :func:`~write_columns` with `resizable` set to *True*.
+
+    Every column is grown in place and the new rows are written after its
+    existing rows, such that none of the existing rows are read or copied.
+    If appending is interrupted, the file can be restored to its previous
+    length with :func:`~truncate_columns`.
+
+    Parameters
+    ----------
+    filename : str
+        The path to the HDF5-file whose columns must be appended to.
+    columns : dict of list
+        For every column in `filename`, the list of segments that make up the
+        rows that must be appended when concatenated.
+
+    Returns
+    -------
+    n_rows : int
+        The number of rows that were appended.
+
+    """
+
+    # Determine the number of rows that are appended
+    n_rows = get_n_rows(columns)
+
+    # Open the file
+    with h5py.File(filename, 'r+') as file:
+        # Check that exactly its columns are appended to
+        group = file['table/columns']
+        if(set(group) != set(columns)):
+            raise ValueError("The appended columns must be exactly the "
+                             "columns of the file!")
+
+        # Grow every column and write the new rows after its existing rows
+        for name, segments in columns.items():
+            dset = group[name]['data']
+            start = dset.shape[0]
+            dset.resize((start+n_rows,))
+            write_segments(dset, start, segments)
+
+    # Return the number of rows
+    return(n_rows)
+
+
+# This function returns the number of rows in columns
+def get_n_rows(columns):
+    """
+    Returns the number of rows in the provided `columns`, which are lists of
+    segments, raising a :class:`~ValueError` if they do not all have the same
+    number of rows.
+
+    """
+
+    # Determine the number of rows of every column
+    n_rows = {sum(map(len, segments)) for segments in columns.values()}
+    if(len(n_rows) > 1):
+        raise ValueError("All columns must have the same number of rows!")
+
+    # Return it
+    return(n_rows.pop() if n_rows else 0)
+
+
+# This function checks if all columns of an HDF5-file are resizable
+def is_resizable(filename):
+    """
+    Returns whether all columns of the HDF5-file `filename` are resizable,
+    such that rows can be appended to them with :func:`~append_columns`.
+
+    """
+
+    with h5py.File(filename, 'r') as file:
+        group = file['table/columns']
+        return(all(group[name]['data'].maxshape == (None,) for name in group))
+
+
+# This function restores the resizable columns of an HDF5-file to a length
+def truncate_columns(filename, n_rows):
+    """
+    Shrinks all resizable columns of the HDF5-file `filename` that have more
+    than `n_rows` rows to `n_rows` rows, removing all rows that were appended
+    to them after that.
+
+    """
+
+    with h5py.File(filename, 'r+') as file:
+        group = file['table/columns']
+        for name in group:
+            dset = group[name]['data']
+            if(dset.shape[0] > n_rows):
+                dset.resize((n_rows,))
+
+
+# This function writes segments to a column in chunks
+def write_segments(dset, start, segments):
+    """
+    Writes the provided `segments` one after another to the h5py dataset
+    `dset`, starting at row `start`, in chunks of :attr:`~CHUNK_SIZE` rows.
+
+    """
+
+    for segment in segments:
+        for i in range(0, len(segment), CHUNK_SIZE):
+            j = min(i+CHUNK_SIZE, len(segment))
+            dset[start+i:start+j] = segment[i:j]
+        start += len(segment)
@@ -0,0 +1,430 @@
+# -*- coding: utf-8 -*-
+
+"""
+Blooms
+======
+Provides the Bloom filters of the objids in every block of rows of a
+micro-lensing database, which are stored in the master file and allow for
+sparse lookups of objects that solely read the blocks that may contain them.
+
+"""
+
+
+# %% IMPORTS
+# Built-in imports
+from os import path
+
+# Package imports
+import h5py
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+# MLDatabase imports
+from mldatabase import __main__ as mld_main
+from mldatabase._globals import (
+    EXP_HEADER, MASTER_EXP_FILE, MASTER_FILE, VAEX_COLUMN)
+from mldatabase.sketches import hash_objids
+
+# All declaration
+__all__ = ['get_light_curves', 'has_objids']
+
+
+# %% GLOBALS
+# Number of rows of the master exposure file covered by a single filter
+BLOCK_SIZE = 2**18
+
+# Number of 64-bit words in a single filter
+N_WORDS = 2**15
+
+# Number of words in a bucket, which holds all bits of a single objid
+BUCKET_SIZE = 8
+
+# Number of bits that are set in a bucket for every objid
+N_HASHES = 6
+
+# Number of filters that are stored together in a single HDF5-chunk
+CHUNK_HEIGHT = 128
+
+# Maximum number of buckets that are read separately in a single lookup
+MAX_BUCKETS = 256
+
+# Number of objids that are tested at once against entire filters
+OBJID_BATCH_SIZE = 4096
+
+
+# %% FUNCTION DEFINITIONS
+# This function returns the light curves of objids
+def get_light_curves(objids, exp_dir=None, *, columns=None):
+    """
+    Returns all rows of the provided `objids` in the existing micro-lensing
+    database in the provided `exp_dir`, sorted on objid and hjd.
+
+    The Bloom filters of the database are used to solely read the blocks of
+    rows that may contain any of the `objids`, which makes this much faster
+    than filtering the entire database for small numbers of objects.
+
+    Parameters
+    ----------
+    objids : int or array_like of int
+        The objids whose rows must be returned.
+
+    Optional
+    --------
+    exp_dir : str or None. Default: None
+        The relative or absolute path to the directory that contains an
+        existing micro-lensing database.
+        If *None*, the current working directory is used.
+    columns : list of str or None. Default: None
+        The columns to return. If *None*, all columns are returned.
+
+    Returns
+    -------
+    light_curves : :obj:`~pandas.DataFrame` object
+        The rows of all `objids`.
+
+    """
+
+    # Import ColumnReader
+    from mldatabase.reader import ColumnReader
+
+    # Determine the objids and columns that are required
+    objids = np.unique(np.asarray(objids, dtype=int))
+    if columns is None:
+        columns = list(EXP_HEADER)
+
+    # Obtain access to the database
+    chunks = []
+    with mld_main.Database(exp_dir).access() as mld:
+        # Determine the blocks that may contain any of the objids
+        exp_file = path.join(mld, MASTER_EXP_FILE)
+        n_rows = mld_main.get_n_rows(exp_file)
+        with h5py.File(path.join(mld, MASTER_FILE), 'r') as m_file:
+            blocks = np.flatnonzero(
+                query_blooms(m_file, objids, n_rows).any(axis=1))
+
+        # Read the rows of the objids from these blocks
+        if blocks.size:
+            reader = ColumnReader(exp_file)
+            try:
+                sources = {name: reader.get_source(name)
+                           for name in {'objid', *columns}}
+                for block in blocks.tolist():
+                    rows = slice(block*BLOCK_SIZE,
+                                 min((block+1)*BLOCK_SIZE, n_rows))
+                    index = np.flatnonzero(np.isin(sources['objid'][rows],
+                                                   objids))
+                    if index.size:
+                        chunks.append({name: sources[name][rows][index]
+                                       for name in columns})
+            finally:
+                reader.close()
+
+    # Combine all rows
+    data = pd.DataFrame({
+        name: np.concatenate([chunk[name] for chunk in chunks])
+        if chunks else np.empty(0, dtype=EXP_HEADER[name])
+        for name in columns})
+
+    # Sort them on objid and hjd if possible
+    order = [name for name in ('objid', 'hjd') if name in data]
+    if order:
+        data = data.sort_values(order, kind='mergesort', ignore_index=True)
+
+    # Return them
+    return(data)
+
+
+# This function checks which objids are in the database
+def has_objids(objids, exp_dir=None):
+    """
+    Returns whether each of the provided `objids` can be found in the
+    existing micro-lensing database in the provided `exp_dir`.
+
+    The Bloom filters of the database are consulted first, after which solely
+    the objids that may be in the database are looked up in the sorted
+    objids of the master file.
+
+    Parameters
+    ----------
+    objids : int or array_like of int
+        The objids to check.
+
+    Optional
+    --------
+    exp_dir : str or None. Default: None
+        The relative or absolute path to the directory that contains an
+        existing micro-lensing database.
+        If *None*, the current working directory is used.
+
+    Returns
+    -------
+    found : bool or :obj:`~numpy.ndarray` object
+        Whether every objid is in the database, with the shape of `objids`.
+
+    """
+
+    # Determine the distinct objids
+    objids = np.asarray(objids, dtype=int)
+    unique, inverse = np.unique(objids, return_inverse=True)
+
+    # Obtain access to the database
+    with mld_main.Database(exp_dir).access() as mld,\
+            h5py.File(path.join(mld, MASTER_FILE), 'r') as m_file:
+        # Determine which objids may be in the database
+        n_rows = mld_main.get_n_rows(path.join(mld, MASTER_EXP_FILE))
+        found = query_blooms(m_file, unique, n_rows).any(axis=0)
+
+        # Look these up in the sorted objids
+        if found.any() and 'objids' in m_file:
+            found[found] = search_objids(m_file['objids'], unique[found])
+        else:
+            found[:] = False
+
+    # Return whether every objid was found
+    found = found[inverse].reshape(objids.shape)
+    return(found if found.ndim else bool(found))
+
+
+# This function determines which blocks may contain objids
+def query_blooms(m_file, objids, n_rows):
+    """
+    Determines which blocks of the master exposure file with `n_rows` rows
+    may contain the provided `objids`, according to the Bloom filters in the
+    opened master file `m_file`. Blocks without an up-to-date filter may
+    contain any objid.
+
+    Returns
+    -------
+    maybe : :obj:`~numpy.ndarray` object
+        Whether every block may contain every objid, with a row per block
+        and a column per objid.
+
+    """
+
+    # Determine the number of blocks and which of them have a valid filter
+    n_blocks = -(-n_rows//BLOCK_SIZE)
+    n_valid = get_valid_blocks(m_file.get('blooms'), n_rows)
+
+    # Blocks without a valid filter may contain every objid
+    maybe = np.ones((n_blocks, len(objids)), dtype=bool)
+    if not n_valid or not len(objids):
+        return(maybe)
+    dset = m_file['blooms/bits']
+
+    # Determine the bucket and bits of every objid
+    buckets, bits = get_buckets(objids)
+    words, shifts = bits//64, (bits % 64).astype(np.uint64)
+
+    # Define function that tests objids against the words of their buckets
+    def test(bucket_words, index):
+        values = np.take_along_axis(bucket_words, words[None, index], axis=2)
+        return(((values >> shifts[index]) & np.uint64(1)).all(axis=2))
+
+    # If there are few buckets, solely read the buckets of the objids
+    unique = np.unique(buckets)
+    if(unique.size <= MAX_BUCKETS):
+        for bucket in unique.tolist():
+            index = np.flatnonzero(buckets == bucket)
+            bucket_words = dset[:n_valid, bucket*BUCKET_SIZE:
+                                (bucket+1)*BUCKET_SIZE]
+            maybe[:n_valid, index] = test(bucket_words[:, None], index)
+
+    # Else, read all filters chunk by chunk
+    else:
+        for start in range(0, n_valid, CHUNK_HEIGHT):
+            stop = min(start+CHUNK_HEIGHT, n_valid)
+            filters = dset[start:stop].reshape(stop-start, -1, BUCKET_SIZE)
+            for i in range(0, len(objids), OBJID_BATCH_SIZE):
+                index = np.arange(i, min(i+OBJID_BATCH_SIZE, len(objids)))
+                maybe[start:stop, index] = test(
+                    filters[:, buckets[index]], index)
+
+    # Return which blocks may contain which objids
+    return(maybe)
+
+
+# This function computes the Bloom filters of blocks that require them
+def update_blooms(m_file, master_exp_file, progress=True):
+    """
+    Computes the Bloom filters of all blocks of rows in the provided
+    `master_exp_file` that have no up-to-date filter yet, and saves them in
+    the opened master file `m_file`.
+
+    Returns
+    -------
+    n_blocks : int
+        The number of blocks whose filters were computed.
+
+    """
+
+    # Obtain the filters, creating them if they do not exist
+    group = require_blooms(m_file)
+    dset = group['bits']
+
+    # Determine the blocks that require a new filter
+    n_rows = mld_main.get_n_rows(master_exp_file)
+    n_blocks = -(-n_rows//BLOCK_SIZE)
+    first = get_valid_blocks(group, n_rows)
+    dset.resize(n_blocks, axis=0)
+    if(first == n_blocks):
+        group.attrs['n_rows'] = n_rows
+        return(0)
+
+    # Compute the filters of these blocks, writing whole chunks at once
+    with h5py.File(master_exp_file, 'r') as file:
+        objid_dset = file[VAEX_COLUMN.format('objid')]
+        pbar = tqdm(desc="Indexing objids", total=n_blocks-first,
+                    dynamic_ncols=True, disable=not progress)
+        start = first
+        while(start < n_blocks):
+            stop = min((start//CHUNK_HEIGHT+1)*CHUNK_HEIGHT, n_blocks)
+            dset[start:stop] = [
+                compute_bloom(objid_dset[block*BLOCK_SIZE:
+                                         (block+1)*BLOCK_SIZE])
+                for block in range(start, stop)]
+            pbar.update(stop-start)
+            start = stop
+        pbar.close()
+
+    # Save that all rows are covered by the filters now
+    group.attrs['n_rows'] = n_rows
+
+    # Return the number of blocks that were computed
+    return(n_blocks-first)
+
+
+# This function invalidates the filters of changed rows
+def invalidate_blooms(m_file, rows):
+    """
+    Invalidates the Bloom filters in the opened master file `m_file` of all
+    blocks that are changed by moving exposures to the provided `rows`, which
+    contains their expnum, first row and stop row (or -1 if removed). This
+    must be called before the row index is updated.
+
+    """
+
+    # If there are no filters, there is nothing to invalidate
+    group = m_file.get('blooms')
+    rows = np.asarray(rows, dtype=int).reshape(-1, 3)
+    if group is None or not rows.size:
+        return
+
+    # Determine the first row that is changed, before or after moving
+    records = m_file['expnums'][()]
+    starts = np.concatenate([
+        records['row_start'][np.isin(records['expnum'], rows[:, 0])],
+        rows[:, 1]])
+    starts = starts[starts >= 0]
+
+    # Solely the filters of the rows before it remain valid
+    if starts.size:
+        group.attrs['n_rows'] = min(group.attrs['n_rows'], starts.min())
+
+
+# This function obtains the Bloom filters group in the master file
+def require_blooms(m_file):
+    # Remove the filters if they were made with different parameters
+    group = m_file.get('blooms')
+    if group is not None and (
+            group.attrs.get('block_size') != BLOCK_SIZE or
+            group.attrs.get('n_hashes') != N_HASHES or
+            group['bits'].shape[1:] != (N_WORDS,)):
+        del m_file['blooms']
+        group = None
+
+    # Create the filters if they do not exist
+    if group is None:
+        group = m_file.create_group('blooms')
+        group.attrs['block_size'] = BLOCK_SIZE
+        group.attrs['n_hashes'] = N_HASHES
+        group.attrs['n_rows'] = 0
+        group.create_dataset('bits', shape=(0, N_WORDS), dtype='<u8',
+                             maxshape=(None, N_WORDS),
+                             chunks=(CHUNK_HEIGHT, BUCKET_SIZE))
+
+    # Return the group
+    return(group)
+
+
+# This function returns the number of blocks with a valid filter
+def get_valid_blocks(group, n_rows):
+    # If there are no filters, no block has a valid one
+    if group is None or group.attrs.get('block_size') != BLOCK_SIZE or\
+            group.attrs.get('n_hashes') != N_HASHES:
+        return(0)
+
+    # Every block whose rows are all covered has a valid filter
+    n_covered = min(int(group.attrs['n_rows']), n_rows)
+    n_valid = n_covered//BLOCK_SIZE
+    if(n_covered == n_rows):
+        n_valid = -(-n_rows//BLOCK_SIZE)
+    return(min(n_valid, len(group['bits'])))
+
+
+# This function computes the Bloom filter of objids
+def compute_bloom(objids):
+    # Determine the bucket and bits of every distinct objid
+    buckets, bits = get_buckets(np.unique(objids))
+
+    # Set these bits
+    index = (buckets[:, None]*(BUCKET_SIZE*64)+bits).ravel()
+    flags = np.zeros(N_WORDS*64, dtype=bool)
+    flags[index] = True
+    return(np.packbits(flags, bitorder='little').view('<u8'))
+
+
+# This function determines the bucket and bits of objids in a filter
+def get_buckets(objids):
+    """
+    Returns the bucket of every objid in the provided `objids`, and the
+    `N_HASHES` bits within the bucket that are set for it.
+
+    """
+
+    # Hash the objids twice, using the first for the bucket
+    hashes = hash_objids(objids)
+    n_buckets = N_WORDS//BUCKET_SIZE
+    buckets = (hashes % np.uint64(n_buckets)).astype(np.intp)
+
+    # Use consecutive groups of bits of the second for the bits
+    hashes = hash_objids(hashes)
+    bits_per_hash = int(np.log2(BUCKET_SIZE*64))
+    bits = np.stack([(hashes >> np.uint64(i*bits_per_hash)) &
+                     np.uint64(BUCKET_SIZE*64-1)
+                     for i in range(N_HASHES)], axis=1).astype(np.intp)
+    return(buckets, bits)
+
+
+# This function searches for objids in the sorted objids dataset
+def search_objids(dset, objids):
+    """
+    Returns whether each of the provided sorted `objids` can be found in the
+    sorted 'objids' dataset `dset` of the master file, using a binary search
+    that reads a single record per objid per step.
+
+    """
+
+    # Initialize the search ranges of all objids
+    lo = np.zeros(len(objids), dtype=int)
+    hi = np.full(len(objids), len(dset))
+
+    # Halve the search ranges until they are all empty
+    while (lo < hi).any():
+        active = lo < hi
+        mid = (lo+hi)//2
+        index = np.unique(mid[active])
+        values = dset[index.tolist()]['objid']
+        values = values[np.searchsorted(index, mid[active])]
+        below = values < objids[active]
+        lo[active] = np.where(below, mid[active]+1, lo[active])
+        hi[active] = np.where(below, hi[active], mid[active])
+
+    # Check if the objid is found at its insertion point
+    found = lo < len(dset)
+    if found.any():
+        index = np.unique(lo[found])
+        values = dset[index.tolist()]['objid']
+        found[found] = values[np.searchsorted(index, lo[found])] ==\
+            objids[found]
+    return(found)
@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+
+"""
+Cross-match
+===========
+Provides the functions for cross-matching external catalogs of positions
+against the mean positions of all objects in a micro-lensing database.
+
+"""
+
+
+# %% IMPORTS
+# Built-in imports
+from concurrent.futures import ThreadPoolExecutor
+import os
+from os import path
+
+# Package imports
+import h5py
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+# MLDatabase imports
+from mldatabase import __main__ as mld_main
+from mldatabase._coordination import get_worker_id
+from mldatabase._globals import MASTER_EXP_FILE, MASTER_FILE, POSITIONS_FILE
+from mldatabase.grouping import read_objid_counts
+from mldatabase.reader import ColumnReader
+
+# All declaration
+__all__ = ['get_mean_positions', 'xmatch']
+
+
+# %% GLOBALS
+# Number of catalog sources that are matched at once by a single thread
+PARTITION_SIZE = 100_000
+
+# Maximum number of candidate pairs that are compared at once by a thread
+MAX_PAIRS = 10_000_000
+
+# Offset between the sort keys of two consecutive declination zones
+ZONE_OFFSET = 1000.0
+
+
+# %% FUNCTION DEFINITIONS
+# This function returns the mean position of every object
+def get_mean_positions(exp_dir=None, *, progress=True):
+    """
+    Returns the mean position of every object in the existing micro-lensing
+    database in the provided `exp_dir`.
+
+    Mean positions are computed from all rows of an object (averaging their
+    unit vectors, such that objects at 'ra' = 0 are handled properly) with a
+    single pass over the database, and stored in the database directory. They
+    are only recomputed once the database has been updated.
+
+    Optional
+    --------
+    exp_dir : str or None. Default: None
+        The relative or absolute path to the directory that contains an
+        existing micro-lensing database.
+        If *None*, the current working directory is used.
+    progress : bool. Default: True
+        Whether to show a progress bar if the positions must be computed.
+
+    Returns
+    -------
+    positions : :obj:`~pandas.DataFrame` object
+        The 'objid', mean 'ra' and 'decl' and number of rows 'count' of every
+        object, sorted on objid.
+
+    """
+
+    # Obtain access to the database and read the positions
+    with mld_main.Database(exp_dir).access() as mld:
+        return(pd.DataFrame(read_positions(mld, progress)))
+
+
+# This function cross-matches a catalog against the database
+def xmatch(ra, decl, radius, exp_dir=None, *, nearest=True, n_threads=None,
+           progress=True):
+    """
+    Cross-matches the catalog of positions with the provided `ra` and `decl`
+    (in degrees) against the mean positions of all objects in the existing
+    micro-lensing database in the provided `exp_dir`, within the provided
+    `radius` (in arcseconds).
+
+    The mean positions of all objects are divided into declination zones
+    with a height of `radius`, which are sorted on 'ra'. Every source is then
+    only compared with the objects in its own and both neighbouring zones
+    that lie within its 'ra' window, with vectorized binary searches. The
+    catalog is matched in partitions, in parallel.
+
+    Parameters
+    ----------
+    ra, decl : array_like of float
+        The positions of all sources in the catalog in degrees.
+    radius : float
+        The match radius in arcseconds.
+
+    Optional
+    --------
+    exp_dir : str or None. Default: None
+        The relative or absolute path to the directory that contains an
+        existing micro-lensing database.
+        If *None*, the current working directory is used.
+    nearest : bool. Default: True
+        Whether to solely return the nearest object of every source, instead
+        of all objects within `radius`.
+    n_threads : int or None. Default: None
+        The number of partitions that are matched in parallel. If *None*,
+        the number of CPUs is used.
+    progress : bool. Default: True
+        Whether to show a progress bar.
+
+    Returns
+    -------
+    matches : :obj:`~pandas.DataFrame` object
+        The 'index' of the source in the catalog, the 'objid' and mean 'ra'
+        and 'decl' of the matched object and their separation 'sep' in
+        arcseconds for every match, sorted on index and separation.
+        Sources without any match are not included.
+
+    """
+
+    # Check the provided catalog and radius
+    ra = np.asarray(ra, dtype=float).ravel()
+    decl = np.asarray(decl, dtype=float).ravel()
+    if(ra.shape != decl.shape):
+        raise ValueError("Input arguments 'ra' and 'decl' must have the same "
+                         "length!")
+    if not (0 < radius < 3600):
+        raise ValueError("Input argument 'radius' must be between 0 and 3600 "
+                         "arcseconds!")
+
+    # Obtain access to the database and read the positions
+    with mld_main.Database(exp_dir).access() as mld:
+        positions = read_positions(mld, progress)
+
+    # Solely match sources with a valid position
+    valid = np.isfinite(ra) & np.isfinite(decl)
+
+    # Sort the objects on their zones and 'ra'
+    height = radius/3600
+    zones = make_zones(positions['ra'], positions['decl'], height,
+                       get_ra_windows(decl[valid], height))
+
+    # Divide the catalog into partitions of sources that are close in decl
+    order = np.flatnonzero(valid)
+    order = order[np.argsort(decl[order], kind='stable')]
+    partitions = [order[i:i+PARTITION_SIZE]
+                  for i in range(0, len(order), PARTITION_SIZE)]
+
+    # Define function that matches a single partition
+    def match(index):
+        return(match_partition(zones, index, ra[index], decl[index], height,
+                               nearest))
+
+    # Match all partitions in parallel
+    n_threads = n_threads if n_threads else os.cpu_count()
+    with ThreadPoolExecutor(n_threads) as executor:
+        results = list(tqdm(
+            executor.map(match, partitions), desc="Cross-matching sources",
+            total=len(partitions), dynamic_ncols=True,
+            disable=not progress))
+
+    # Combine the matches of all partitions
+    if results:
+        src, obj, sep = map(np.concatenate, zip(*results))
+    else:
+        src, obj, sep = np.empty(0, int), np.empty(0, int), np.empty(0)
+    order = np.lexsort((sep, src))
+    src, obj, sep = src[order], obj[order], sep[order]
+
+    # Return the matches
+    return(pd.DataFrame({'index': src,
+                         'objid': positions['objid'][obj],
+                         'ra': positions['ra'][obj],
+                         'decl': positions['decl'][obj],
+                         'sep': sep*3600}))
+
+
+# This function determines the 'ra' windows of positions
+def get_ra_windows(decl, height):
+    """
+    Returns the half-width of the 'ra' window in degrees that contains all
+    positions within `height` degrees of the provided `decl`, or 180 if it
+    contains the pole.
+
+    """
+
+    # Determine the largest absolute decl that is in range
+    decl_max = np.abs(decl)+height
+
+    # Determine the ra window, which covers everything near the poles
+    with np.errstate(divide='ignore', invalid='ignore'):
+        windows = height/np.cos(np.radians(np.minimum(decl_max, 90)))
+    return(np.where(decl_max < 89.999, np.minimum(windows, 180), 180))
+
+
+# This function sorts positions on their zones and 'ra'
+def make_zones(ra, decl, height, windows):
+    """
+    Sorts the provided positions on declination zones of `height` degrees
+    and 'ra' within every zone, adding copies of all positions within the
+    largest of the provided 'ra' `windows` of 'ra' = 0 or 360 at the other
+    side, such that windows never have to wrap around.
+
+    Returns
+    -------
+    zones : dict
+        The sort 'keys' of all positions (and their copies) and the 'index'
+        of the position of every key, as well as their 'ra' and 'decl'.
+
+    """
+
+    # Determine how far positions must be copied
+    pad = windows.max(initial=0)
+
+    # Solely use positions that are valid
+    index = np.flatnonzero(np.isfinite(ra) & np.isfinite(decl))
+    ra = np.mod(ra[index], 360)
+
+    # Add the copies at both sides
+    low = ra < pad
+    high = ra >= 360-pad
+    index = np.concatenate([index, index[low], index[high]])
+    ra = np.concatenate([ra, ra[low]+360, ra[high]-360])
+    decl = decl[index]
+
+    # Sort all positions on their keys
+    keys = get_zone_ids(decl, height)*ZONE_OFFSET+ra
+    order = np.argsort(keys)
+    return({'keys': keys[order], 'index': index[order], 'ra': ra[order],
+            'decl': decl[order]})
+
+
+# This function determines the declination zones of positions
+def get_zone_ids(decl, height):
+    return(np.floor((np.asarray(decl)+90)/height))
+
+
+# This function matches a partition of sources against the zones
+def match_partition(zones, index, ra, decl, height, nearest):
+    """
+    Matches the sources with the provided `index`, `ra` and `decl` against
+    all positions in the provided `zones`.
+
+    Returns
+    -------
+    src : :obj:`~numpy.ndarray` object
+        The index of the source of every match.
+    obj : :obj:`~numpy.ndarray` object
+        The index of the position of every match.
+    sep : :obj:`~numpy.ndarray` object
+        The separation of every match in degrees.
+
+    """
+
+    # Determine the windows of all sources
+    ra = np.mod(ra, 360)
+    windows = get_ra_windows(decl, height)
+    zone_ids = get_zone_ids(decl, height)
+
+    # Determine the candidates in the own and neighbouring zones
+    starts, stops = [], []
+    for offset in (-1, 0, 1):
+        keys = (zone_ids+offset)*ZONE_OFFSET+ra
+        starts.append(np.searchsorted(zones['keys'], keys-windows, 'left'))
+        stops.append(np.searchsorted(zones['keys'], keys+windows, 'right'))
+    starts = np.stack(starts, axis=1)
+    counts = np.stack(stops, axis=1)-starts
+
+    # Divide the sources into chunks with a limited number of candidates
+    totals = np.cumsum(counts.sum(axis=1))
+    bounds = np.searchsorted(
+        totals, np.arange(MAX_PAIRS, totals[-1], MAX_PAIRS), 'right')
+    bounds = np.unique(np.concatenate([[0], bounds, [len(index)]]))
+
+    # Match the sources in every chunk
+    src, obj, sep = [], [], []
+    for i, j in zip(bounds[:-1], bounds[1:]):
+        matches = match_candidates(zones, ra[i:j], decl[i:j], starts[i:j],
+                                   counts[i:j], height, nearest)
+        src.append(index[i:j][matches[0]])
+        obj.append(matches[1])
+        sep.append(matches[2])
+
+    # Return the matches, using the indices of the sources in the catalog
+    return(np.concatenate(src), np.concatenate(obj), np.concatenate(sep))
+
+
+# This function matches sources against their candidates
+def match_candidates(zones, ra, decl, starts, counts, height, nearest):
+    """
+    Matches the sources with the provided `ra` and `decl` against their
+    candidates, which are the positions in `zones` in the ranges given by
+    `starts` and `counts`.
+
+    Returns
+    -------
+    src : :obj:`~numpy.ndarray` object
+        The index of the source of every match.
+    obj : :obj:`~numpy.ndarray` object
+        The index of the position of every match.
+    sep : :obj:`~numpy.ndarray` object
+        The separation of every match in degrees.
+
+    """
+
+    # Expand the candidate ranges into pairs
+    starts, counts = starts.ravel(), counts.ravel()
+    src = np.repeat(np.arange(len(ra)).repeat(3), counts)
+    cand = np.arange(counts.sum())
+    cand += np.repeat(starts-np.cumsum(counts)+counts, counts)
+
+    # Calculate the separations of all pairs and keep those within range
+    sep = get_separations(ra[src], decl[src], zones['ra'][cand],
+                          zones['decl'][cand])
+    mask = sep <= height
+    src, obj, sep = src[mask], zones['index'][cand[mask]], sep[mask]
+
+    # Remove the pairs that match the same position twice through a copy
+    order = np.lexsort((sep, obj, src))
+    src, obj, sep = src[order], obj[order], sep[order]
+    unique = np.ones(len(src), dtype=bool)
+    unique[1:] = (src[1:] != src[:-1]) | (obj[1:] != obj[:-1])
+    src, obj, sep = src[unique], obj[unique], sep[unique]
+
+    # Keep solely the nearest position of every source if requested
+    if nearest:
+        order = np.lexsort((sep, src))
+        src, obj, sep = src[order], obj[order], sep[order]
+        first = np.ones(len(src), dtype=bool)
+        first[1:] = src[1:] != src[:-1]
+        src, obj, sep = src[first], obj[first], sep[first]
+
+    # Return the matches
+    return(src, obj, sep)
+
+
+# This function calculates the angular separations between positions
+def get_separations(ra1, decl1, ra2, decl2):
+    # Use the haversine formula, which is accurate for small separations
+    ra1, decl1, ra2, decl2 = map(np.radians, (ra1, decl1, ra2, decl2))
+    hav = (np.sin((decl2-decl1)/2)**2 +
+           np.cos(decl1)*np.cos(decl2)*np.sin((ra2-ra1)/2)**2)
+    return(np.degrees(2*np.arcsin(np.sqrt(np.clip(hav, 0, 1)))))
+
+
+# This function reads the mean positions of all objects in the database
+def read_positions(mld, progress=True):
+    """
+    Reads the mean positions of all objects in the database in `mld`,
+    computing them first if they do not exist or are outdated.
+
+    """
+
+    # Obtain the version of the database
+    with h5py.File(path.join(mld, MASTER_FILE), 'r') as m_file:
+        db_version = m_file.attrs.get('db_version', 0)
+
+    # Compute the positions if they are not up-to-date
+    positions_file = path.join(mld, POSITIONS_FILE)
+    if path.exists(positions_file):
+        with h5py.File(positions_file, 'r') as file:
+            outdated = (file.attrs['db_version'] != db_version)
+    else:
+        outdated = True
+    if outdated:
+        write_positions(mld, db_version, progress)
+
+    # Read the positions
+    with h5py.File(positions_file, 'r') as file:
+        return({name: file[name][()]
+                for name in ('objid', 'ra', 'decl', 'count')})
+
+
+# This function computes and writes the mean positions of all objects
+def write_positions(mld, db_version, progress):
+    # Obtain all objids
+    objids, counts = read_objid_counts(mld)
+    n_objids = len(objids)
+
+    # Sum the unit vectors of all rows of every objid
+    sums = np.zeros((3, n_objids))
+    n_valid = np.zeros(n_objids, dtype=int)
+    exp_file = path.join(mld, MASTER_EXP_FILE)
+    if path.exists(exp_file):
+        reader = ColumnReader(exp_file)
+        try:
+            pbar = tqdm(desc="Computing mean positions", total=len(reader),
+                        unit='rows', dynamic_ncols=True,
+                        disable=not progress)
+            for _, data in reader.iter_chunks(['objid', 'ra', 'decl']):
+                # Solely use rows with a valid position
+                valid = np.isfinite(data['ra']) & np.isfinite(data['decl'])
+                index = np.searchsorted(objids, data['objid'][valid])
+                ra = np.radians(data['ra'][valid])
+                decl = np.radians(data['decl'][valid])
+
+                # Add their unit vectors
+                for i, values in enumerate([np.cos(decl)*np.cos(ra),
+                                            np.cos(decl)*np.sin(ra),
+                                            np.sin(decl)]):
+                    sums[i] += np.bincount(index, values, n_objids)
+                n_valid += np.bincount(index, minlength=n_objids)
+                pbar.update(len(valid))
+            pbar.close()
+        finally:
+            reader.close()
+
+    # Convert the summed vectors to mean positions
+    with np.errstate(invalid='ignore'):
+        ra = np.mod(np.degrees(np.arctan2(sums[1], sums[0])), 360)
+        decl = np.degrees(np.arctan2(sums[2], np.hypot(sums[0], sums[1])))
+    ra[n_valid == 0] = decl[n_valid == 0] = np.nan
+
+    # Write the positions to a temporary file and move it into place
+    positions_file = path.join(mld, POSITIONS_FILE)
+    tmp_file = f"{positions_file}.{get_worker_id()}.tmp"
+    try:
+        with h5py.File(tmp_file, 'w') as file:
+            file.attrs['db_version'] = db_version
+            file.create_dataset('objid', data=objids)
+            file.create_dataset('ra', data=ra)
+            file.create_dataset('decl', data=decl)
+            file.create_dataset('count', data=counts)
+        os.replace(tmp_file, positions_file)
+
+    # Remove the temporary file if it still exists
+    finally:
+        if path.exists(tmp_file):
+            os.remove(tmp_file)
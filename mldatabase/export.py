@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+
+"""
+Export
+======
+Provides the function for streaming (a selection of) a micro-lensing database
+to Arrow IPC or Parquet files in fixed-size record batches.
+
+"""
+
+
+# %% IMPORTS
+# Built-in imports
+import os
+from os import path
+
+# Package imports
+import h5py
+import numpy as np
+
+# MLDatabase imports
+from mldatabase import __main__ as mld_main
+from mldatabase._globals import (
+    EXP_HEADER, MASTER_EXP_FILE, MASTER_FILE, VAEX_COLUMN)
+
+# All declaration
+__all__ = ['export_database']
+
+
+# %% GLOBALS
+# File extensions of all supported formats
+EXPORT_FORMATS = {
+    '.arrow': 'ipc',
+    '.feather': 'ipc',
+    '.ipc': 'ipc',
+    '.parquet': 'parquet'}
+
+
+# %% CLASS DEFINITIONS
+# Define class that writes record batches to all partitions
+class PartitionWriters(object):
+    """
+    Writes record batches to the Arrow IPC or Parquet files of all objid
+    partitions, buffering the rows of every partition until at least
+    `batch_size` rows are available. Partitions are only created once rows
+    are written to them. If `bounds` is *None*, all rows are written to the
+    single file `output` instead.
+
+    """
+
+    def __init__(self, output, fmt, schema, bounds, batch_size):
+        # Save provided arguments
+        self.output = output
+        self.fmt = fmt
+        self.schema = schema
+        self.bounds = bounds
+        self.batch_size = batch_size
+
+        # Initialize the writers and buffers of all partitions
+        self.writers = {}
+        self.buffers = {}
+
+    # This function returns the path to the file of a partition
+    def get_path(self, index):
+        # If no partitions are used, return output
+        if self.bounds is None:
+            return(self.output)
+
+        # Else, determine the objid range of this partition
+        ext = '.parquet' if(self.fmt == 'parquet') else '.arrow'
+        lower = self.bounds[index-1] if index else 0
+        if(index < len(self.bounds)):
+            name = f"objid_{lower}-{self.bounds[index]-1}{ext}"
+        else:
+            name = f"objid_{lower}-{ext}"
+        return(path.join(self.output, name))
+
+    # This function writes the provided rows to their partitions
+    def write(self, data):
+        # If no partitions are used, all rows belong to the first one
+        if self.bounds is None:
+            self.append(0, data)
+            return
+
+        # Else, determine the partition of every row
+        part = np.searchsorted(self.bounds, data['objid'], 'right')
+        order = np.argsort(part, kind='stable')
+        splits = np.searchsorted(part[order], np.arange(len(self.bounds)+1))
+
+        # Add the rows of every partition
+        for index, (a, b) in enumerate(zip(splits, [*splits[1:],
+                                                    len(order)])):
+            if(a < b):
+                self.append(index, {name: values[order[a:b]]
+                                    for name, values in data.items()})
+
+    # This function buffers rows of a partition and writes full batches
+    def append(self, index, data):
+        # Add the rows to the buffer of this partition
+        buffer = self.buffers.setdefault(index, [])
+        buffer.append(data)
+
+        # If the buffer contains enough rows, write them
+        if(sum(len(next(iter(data.values()))) for data in buffer) >=
+           self.batch_size):
+            self.flush(index)
+
+    # This function writes all buffered rows of a partition
+    def flush(self, index):
+        # Import pyarrow
+        import pyarrow as pa
+
+        # Obtain the buffer of this partition
+        buffer = self.buffers.pop(index, [])
+        if not buffer:
+            return
+
+        # Combine all buffered rows
+        if(len(buffer) == 1):
+            data = buffer[0]
+        else:
+            data = {name: np.concatenate([data[name] for data in buffer])
+                    for name in self.schema.names}
+
+        # Create the record batch, without copying numeric columns
+        batch = pa.record_batch([pa.array(data[name], type=field.type)
+                                 for name, field in zip(self.schema.names,
+                                                        self.schema)],
+                                schema=self.schema)
+
+        # Write the batch to the writer of this partition
+        self.get_writer(index).write_batch(batch)
+
+    # This function returns the writer of a partition
+    def get_writer(self, index):
+        # If this writer does not exist yet, create it
+        if index not in self.writers:
+            filename = self.get_path(index)
+            if(self.fmt == 'parquet'):
+                import pyarrow.parquet as pq
+                writer = pq.ParquetWriter(filename, self.schema)
+            else:
+                import pyarrow as pa
+                writer = pa.ipc.new_file(filename, self.schema)
+            self.writers[index] = writer
+
+        # Return the writer
+        return(self.writers[index])
+
+    # This function writes all remaining rows and closes all writers
+    def close(self):
+        # Write all remaining rows
+        for index in list(self.buffers):
+            self.flush(index)
+
+        # If nothing was written without partitions, write an empty file
+        if self.bounds is None and not self.writers:
+            self.get_writer(0)
+
+        # Close all writers
+        for writer in self.writers.values():
+            writer.close()
+        self.writers.clear()
+
+
+# %% FUNCTION DEFINITIONS
+# This function exports the database to Arrow IPC or Parquet
+def export_database(output, exp_dir=None, columns=None, *, fmt=None,
+                    expnums=None, objid_range=None, hjd_range=None,
+                    batch_size=1_000_000, n_partitions=None):
+    """
+    Streams the existing micro-lensing database in the provided `exp_dir` (or
+    a selection of it) to the provided `output` in the Arrow IPC or Parquet
+    format, in record batches of `batch_size` rows.
+
+    The database is read in chunks of `batch_size` rows, such that the memory
+    usage does not depend on the size of the database. If no rows are
+    filtered out, the numeric columns of every chunk are handed to Arrow
+    without being copied. If `expnums` is given, solely the rows of these
+    exposures are read, which are obtained from the row index of the
+    database.
+
+    This function requires the `pyarrow` package to be installed.
+
+    Parameters
+    ----------
+    output : str
+        The path to the file that the database must be exported to. If
+        `n_partitions` is given, the path to the directory that all
+        partitions must be exported to instead.
+
+    Optional
+    --------
+    exp_dir : str or None. Default: None
+        The relative or absolute path to the directory that contains an
+        existing micro-lensing database.
+        If *None*, the current working directory is used.
+        This argument is equivalent to the optional `-d`/`--dir` argument when
+        using the command-line interface.
+    columns : list of str or None. Default: None
+        The columns that must be exported. If *None*, all columns are
+        exported.
+    fmt : {'ipc'; 'parquet'} or None. Default: None
+        The format to export to. If *None*, it is determined from the
+        extension of `output` ('.arrow', '.feather' and '.ipc' for Arrow IPC;
+        '.parquet' for Parquet).
+    expnums : list of int or None. Default: None
+        If given, only the rows of these exposures are exported.
+    objid_range : tuple of int or None. Default: None
+        If given, only the rows with an objid in this (inclusive) range are
+        exported.
+    hjd_range : tuple of float or None. Default: None
+        If given, only the rows with an hjd in this (inclusive) range are
+        exported.
+    batch_size : int. Default: 1_000_000
+        The number of rows in a single record batch.
+    n_partitions : int or None. Default: None
+        If given, the rows are partitioned in `n_partitions` consecutive objid
+        ranges, which are all exported to a separate file in `output`. The
+        objid ranges are chosen such that all partitions contain roughly the
+        same number of rows.
+        As the rows of every partition are buffered until a full record batch
+        can be written, the memory usage scales with `n_partitions`.
+
+    Returns
+    -------
+    n_rows : int
+        The number of rows that were exported.
+
+    """
+
+    # Import pyarrow
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError("Exporting a database requires the 'pyarrow' "
+                          "package to be installed!")
+
+    # Determine the format
+    if fmt is None:
+        fmt = EXPORT_FORMATS.get(path.splitext(output)[1].lower())
+        if fmt is None:
+            raise ValueError(f"Format of output {output!r} cannot be "
+                             f"determined from its extension! Provide it "
+                             f"with the 'fmt' argument instead.")
+    elif fmt not in ('ipc', 'parquet'):
+        raise ValueError(f"Input argument 'fmt' is invalid ({fmt!r})!")
+
+    # Determine the columns that must be exported
+    if columns is None:
+        columns = list(EXP_HEADER)
+    for name in columns:
+        if name not in EXP_HEADER:
+            raise ValueError(f"Input argument 'columns' contains unknown "
+                             f"column {name!r}!")
+
+    # Determine the columns required for filtering
+    # The rows of the selected exposures are obtained from the row index
+    filters = [name for name, value in [('objid', objid_range),
+                                        ('hjd', hjd_range)]
+               if value is not None]
+
+    # Determine the columns that must be kept to partition the rows
+    kept = [*columns, 'objid'] if n_partitions is not None else columns
+
+    # Create the schema of the exported data
+    schema = pa.schema([(name, pa.from_numpy_dtype(np.dtype(EXP_HEADER[name])))
+                        for name in columns])
+
+    # Obtain access to the database
+    with mld_main.Database(exp_dir).access() as mld:
+        # Determine the rows that must be read
+        exp_file = path.join(mld, MASTER_EXP_FILE)
+        if not path.exists(exp_file):
+            row_slices = []
+        elif expnums is not None:
+            row_slices = mld_main.find_row_slices(np.unique(expnums))
+        else:
+            row_slices = [slice(0, mld_main.get_n_rows(exp_file))]
+
+        # Determine the objid at which every partition starts
+        if n_partitions is not None:
+            bounds = get_partition_bounds(mld, n_partitions)
+            os.makedirs(output, exist_ok=True)
+        else:
+            bounds = None
+
+        # Create a writer for every partition
+        writers = PartitionWriters(output, fmt, schema, bounds, batch_size)
+
+        # Wrap in try-statement to ensure all writers are closed
+        n_exported = 0
+        try:
+            # Read the rows chunk by chunk
+            for data in iter_chunks(exp_file, [*kept, *filters], row_slices,
+                                    batch_size):
+                # Determine which rows of this chunk must be exported
+                mask = np.ones(len(data['objid' if filters else kept[0]]),
+                               dtype=bool)
+                if objid_range is not None:
+                    mask &= (data['objid'] >= objid_range[0])
+                    mask &= (data['objid'] <= objid_range[1])
+                if hjd_range is not None:
+                    mask &= (data['hjd'] >= hjd_range[0])
+                    mask &= (data['hjd'] <= hjd_range[1])
+
+                # Filter the rows if required
+                if not mask.all():
+                    data = {name: data[name][mask]
+                            for name in dict.fromkeys(kept)}
+
+                # Write the rows to their partitions
+                writers.write(data)
+                n_exported += int(mask.sum())
+
+        # Close all writers
+        finally:
+            writers.close()
+
+    # Return the number of exported rows
+    return(n_exported)
+
+
+# This function reads the provided rows of columns in chunks
+def iter_chunks(exp_file, columns, row_slices, chunk_size):
+    """
+    Generator that reads the rows in all provided `row_slices` of the
+    provided `columns` of the exposure HDF5-file `exp_file`, in chunks of at
+    most `chunk_size` rows.
+
+    """
+
+    # If no rows must be read, the file is not opened
+    if not row_slices:
+        return
+
+    # Open the file and obtain the datasets of all columns
+    with h5py.File(exp_file, 'r') as file:
+        dsets = {name: file[VAEX_COLUMN.format(name)]
+                 for name in dict.fromkeys(columns)}
+
+        # Read all row slices chunk by chunk
+        for row_slice in row_slices:
+            for start in range(row_slice.start, row_slice.stop, chunk_size):
+                stop = min(start+chunk_size, row_slice.stop)
+                yield({name: dset[start:stop] for name, dset in dsets.items()})
+
+
+# This function determines the objids at which all partitions start
+def get_partition_bounds(mld, n_partitions):
+    # Obtain the objids and their counts from the master file
+    with h5py.File(path.join(mld, MASTER_FILE), 'r') as m_file:
+        if 'objids' not in m_file:
+            return(np.empty(0, dtype=int))
+        objids = m_file['objids'][()]
+
+    # If the database has no rows, there is nothing to divide
+    if not objids.size:
+        return(np.empty(0, dtype=int))
+
+    # Determine the objids that divide all rows into equal parts
+    cum_counts = np.cumsum(objids['count'])
+    index = np.searchsorted(
+        cum_counts, cum_counts[-1]*np.arange(1, n_partitions)/n_partitions,
+        'right')
+    bounds = np.unique(objids['objid'][index[index < len(objids)]])
+
+    # Return bounds
+    return(bounds)
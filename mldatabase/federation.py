@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+
+"""
+Federation
+==========
+Provides the class for querying multiple micro-lensing databases (for example,
+one per field or season) as a single logical database.
+
+"""
+
+
+# %% IMPORTS
+# Built-in imports
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+
+# Package imports
+import numpy as np
+import pandas as pd
+
+# MLDatabase imports
+from mldatabase import __main__ as mld_main
+
+# All declaration
+__all__ = ['Federation']
+
+
+# %% CLASS DEFINITIONS
+# Define class that presents multiple databases as a single one
+class Federation(object):
+    """
+    Presents the existing micro-lensing databases in all provided `exp_dirs`
+    as a single logical database.
+
+    All work is performed on every database in parallel (using one thread per
+    database by default), after which the results are merged.
+
+    Parameters
+    ----------
+    exp_dirs : list of str
+        The relative or absolute paths to the directories that contain the
+        micro-lensing databases to combine.
+
+    Optional
+    --------
+    n_threads : int or None. Default: None
+        The maximum number of databases that are worked on at the same time.
+        If *None*, all databases are worked on at the same time.
+
+    """
+
+    def __init__(self, exp_dirs, n_threads=None):
+        # Create a database for every unique directory
+        exp_dirs = dict.fromkeys(path.abspath(exp_dir) for exp_dir in exp_dirs)
+        if not exp_dirs:
+            raise ValueError("Input argument 'exp_dirs' cannot be empty!")
+        self.databases = [mld_main.Database(exp_dir) for exp_dir in exp_dirs]
+
+        # Check that all databases exist
+        for db in self.databases:
+            if not db.exists:
+                raise OSError(f"Provided DIR {db.dir!r} does not contain a "
+                              f"micro-lensing database!")
+
+        # Save the number of threads
+        self.n_threads = n_threads if n_threads else len(self.databases)
+
+    def __repr__(self):
+        return(f"{self.__class__.__name__}({self.dirs!r})")
+
+    def __len__(self):
+        return(len(self.databases))
+
+    def __iter__(self):
+        return(iter(self.databases))
+
+    # The directories of all databases
+    @property
+    def dirs(self):
+        return([db.dir for db in self.databases])
+
+    # This function calls a function on every database in parallel
+    def map(self, func):
+        """
+        Calls the provided `func` with every :obj:`~mldatabase.Database`
+        object in this federation in parallel.
+
+        Returns
+        -------
+        results : list
+            The results of all calls, in the order of :attr:`~dirs`.
+
+        """
+
+        # Call func on all databases using a thread pool
+        with ThreadPoolExecutor(min(self.n_threads, len(self))) as executor:
+            return(list(executor.map(func, self.databases)))
+
+    # This function calls a function on every opened database in parallel
+    def map_df(self, func):
+        """
+        Calls the provided `func` with every database in this federation in
+        parallel, opened as a :obj:`~vaex.dataframe.DataFrame` object.
+
+        Returns
+        -------
+        results : list
+            The results of all calls, in the order of :attr:`~dirs`.
+
+        """
+
+        # Define function that opens a database and calls func on it
+        def open_and_call(db):
+            with db.open() as df:
+                return(func(df))
+
+        # Call it on all databases
+        return(self.map(open_and_call))
+
+    # This function returns the merged objids and their counts
+    def objid_counts(self):
+        """
+        Returns the sorted objids in all databases and the total number of
+        times each of them can be found in them, as two arrays.
+
+        """
+
+        # Obtain the objids and counts of all databases
+        results = self.map(lambda db: db.objid_counts())
+
+        # Merge the results pairwise until a single one remains
+        while(len(results) > 1):
+            results = [mld_main.merge_counts(*results[i], *results[i+1])
+                       if(i+1 < len(results)) else results[i]
+                       for i in range(0, len(results), 2)]
+
+        # Return the merged objids and counts
+        return(results[0])
+
+    # This function returns the merged objid counter
+    def counter(self):
+        """
+        Returns a :obj:`~collections.Counter` object that stores the total
+        number of times each *objid* can be found in all databases.
+
+        """
+
+        # Obtain the merged objids and counts
+        objids, counts = self.objid_counts()
+
+        # Create counter
+        counter = Counter()
+        counter.update(dict(zip(objids, counts)))
+
+        # Return counter
+        return(counter)
+
+    # This function returns the number of rows in all databases
+    def count(self, selection=None):
+        """
+        Returns the total number of rows in all databases, or the number of
+        rows that satisfy the provided `selection` expression.
+
+        """
+
+        return(int(sum(self.map_df(
+            lambda df: len(df) if selection is None
+            else df.count(selection=selection)))))
+
+    # This function returns the sum of an expression over all databases
+    def sum(self, expression, selection=None):
+        """
+        Returns the sum of the provided `expression` over all rows in all
+        databases (that satisfy the provided `selection` expression).
+
+        """
+
+        return(sum(self.map_df(
+            lambda df: df.sum(expression, selection=selection))))
+
+    # This function returns the mean of an expression over all databases
+    def mean(self, expression, selection=None):
+        """
+        Returns the mean of the provided `expression` over all rows in all
+        databases (that satisfy the provided `selection` expression).
+
+        """
+
+        # Obtain the sum and count of every database
+        results = np.array(self.map_df(
+            lambda df: (df.sum(expression, selection=selection),
+                        df.count(expression, selection=selection))),
+            dtype=float)
+
+        # Combine them
+        total, count = results.sum(axis=0)
+        return(total/count if count else np.nan)
+
+    # This function returns the minimum and maximum of an expression
+    def minmax(self, expression, selection=None):
+        """
+        Returns the minimum and maximum of the provided `expression` over all
+        rows in all databases (that satisfy the provided `selection`
+        expression).
+
+        """
+
+        # Obtain the minimum and maximum of every database
+        results = np.array(self.map_df(
+            lambda df: df.minmax(expression, selection=selection)))
+
+        # Combine them
+        return(np.nanmin(results[:, 0]), np.nanmax(results[:, 1]))
+
+    # This function returns the light curve of an objid
+    def light_curve(self, objid, columns=None):
+        """
+        Returns all rows of the provided `objid` in all databases, sorted on
+        hjd.
+
+        Optional
+        --------
+        columns : list of str or None. Default: None
+            The columns to return. If *None*, all columns are returned.
+
+        Returns
+        -------
+        light_curve : :obj:`~pandas.DataFrame` object
+            The rows of `objid`, with an additional 'dir' column holding the
+            directory of the database every row was obtained from.
+
+        """
+
+        return(self.light_curves([objid], columns))
+
+    # This function returns the light curves of multiple objids
+    def light_curves(self, objids, columns=None):
+        """
+        Returns all rows of the provided `objids` in all databases, sorted on
+        objid and hjd.
+
+        See :meth:`~light_curve` for more information.
+
+        """
+
+        # Determine which objids must be fetched
+        objids = np.unique(objids)
+
+        # Fetch the rows from all databases, using their objid filters
+        frames = self.map(lambda db: db.light_curves(objids, columns))
+
+        # Combine them
+        for db, frame in zip(self.databases, frames):
+            frame['dir'] = db.dir
+        data = pd.concat(frames, ignore_index=True)
+
+        # Sort them on objid and hjd if possible
+        order = [name for name in ('objid', 'hjd') if name in data]
+        if order:
+            data = data.sort_values(order, kind='mergesort',
+                                    ignore_index=True)
+
+        # Return them
+        return(data)
@@ -0,0 +1,519 @@
+# -*- coding: utf-8 -*-
+
+"""
+Grouping
+========
+Provides the functions for streaming a micro-lensing database in batches of
+complete objid groups, and for applying custom functions to every object in
+the database in parallel.
+
+"""
+
+
+# %% IMPORTS
+# Built-in imports
+from glob import glob
+import json
+from multiprocessing import get_context
+import os
+from os import path
+
+# Package imports
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+import h5py
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+# MLDatabase imports
+from mldatabase import __main__ as mld_main
+from mldatabase._cache import open_lock_file, use_lock
+from mldatabase._coordination import get_worker_id
+from mldatabase._globals import (
+    CLUSTERED_DIR, EXP_HEADER, MASTER_EXP_FILE, MASTER_FILE, VAEX_COLUMN)
+
+# All declaration
+__all__ = ['apply_objid', 'iter_objid_batches']
+
+
+# %% GLOBALS
+# Default number of rows in a single batch
+BATCH_SIZE = 10_000_000
+
+# State of a worker process of apply_objid
+_WORKER = {}
+
+
+# %% FUNCTION DEFINITIONS
+# This function applies a function to every object in the database
+def apply_objid(func, exp_dir=None, columns=None, *, per_group=False,
+                batch_size=BATCH_SIZE, n_procs=None, checkpoint=None,
+                progress=True):
+    """
+    Applies the provided `func` to the data of every object (objid) in the
+    existing micro-lensing database in the provided `exp_dir`, using a pool
+    of `n_procs` processes, and returns all results in a table keyed by objid.
+
+    The database is streamed in batches of complete objid groups of roughly
+    `batch_size` rows. These batches are read from a copy of the database
+    that is clustered on objid, which is created with a single out-of-core
+    sort pass the first time it is required (and after every update). All
+    processes map this copy into memory, such that the data of every batch is
+    shared with the processes instead of being copied to them. Note that this
+    copy takes as much disk space as the requested columns in the database
+    itself.
+
+    Parameters
+    ----------
+    func : callable
+        The function that is applied. If `per_group` is *False*, it is called
+        as ``func(data, offsets)`` for every batch, where `data` is a dict of
+        column arrays sorted on objid and `offsets` contains the start of
+        every objid group in these arrays plus the total number of rows (such
+        that it can be used with, e.g., :func:`~numpy.add.reduceat`). It must
+        return an array or a dict of arrays with a value for every group.
+        If `per_group` is *True*, it is called as ``func(data)`` for every
+        object, and must return a scalar or a dict of scalars.
+        If more than one process is used, `func` must be picklable (i.e.,
+        defined at the top level of a module).
+
+    Optional
+    --------
+    exp_dir : str or None. Default: None
+        The relative or absolute path to the directory that contains an
+        existing micro-lensing database.
+        If *None*, the current working directory is used.
+        This argument is equivalent to the optional `-d`/`--dir` argument when
+        using the command-line interface.
+    columns : list of str or None. Default: None
+        The columns that are provided to `func`. If *None*, all columns are
+        provided. The 'objid' column is always provided.
+    per_group : bool. Default: False
+        Whether `func` is called for every object instead of for every batch.
+    batch_size : int. Default: 10_000_000
+        The number of rows in a single batch. Objects with more rows than this
+        are provided in a batch of their own.
+    n_procs : int or None. Default: None
+        The number of processes to use. If *None*, the number of CPUs is used.
+        If 1, `func` is applied in the current process.
+    checkpoint : str or None. Default: None
+        The path to a directory in which the results of every finished batch
+        are stored. If it already contains results of a previous call with
+        the same database and `batch_size`, this call resumes where it left
+        off.
+    progress : bool. Default: True
+        Whether to show a progress bar.
+
+    Returns
+    -------
+    results : :obj:`~pandas.DataFrame` object
+        The table containing all results, with objid as its index.
+
+    """
+
+    # Obtain access to the database
+    with mld_main.Database(exp_dir).access() as mld:
+        # Make sure the clustered copy of the database exists
+        columns = get_columns(columns)
+        paths = get_clustered_columns(mld, columns, batch_size, progress)
+
+        # Divide the database into batches of complete objid groups
+        objids, counts = read_objid_counts(mld)
+        bounds = get_batch_bounds(counts, batch_size)
+        row_bounds = np.concatenate([[0], np.cumsum(counts)])[bounds]
+
+        # Determine which batches were already finished
+        finished = {}
+        if checkpoint is not None:
+            finished = read_checkpoint(mld, checkpoint, batch_size,
+                                       len(bounds)-1)
+
+        # Create the tasks for all batches that are not finished
+        tasks = [(i, row_bounds[i], objids[bounds[i]:bounds[i+1]],
+                  counts[bounds[i]:bounds[i+1]])
+                 for i in range(len(bounds)-1) if i not in finished]
+
+        # Initialize the progress bar
+        n_rows_done = sum(row_bounds[i+1]-row_bounds[i] for i in finished)
+        pbar = tqdm(desc="Applying", total=int(counts.sum()),
+                    initial=int(n_rows_done), unit='rows', dynamic_ncols=True,
+                    disable=not progress)
+
+        # Determine the number of processes to use
+        if n_procs is None:
+            n_procs = os.cpu_count()
+        n_procs = max(1, min(n_procs, len(tasks)))
+
+        # Apply func to all batches
+        init_args = (func, per_group, paths)
+        pool = None
+        try:
+            # If one process is used, apply func in this process
+            if(n_procs == 1):
+                init_worker(*init_args)
+                results_iter = map(apply_batch, tasks)
+
+            # Else, apply func in a process pool
+            else:
+                pool = get_context().Pool(n_procs, init_worker, init_args)
+                results_iter = pool.imap_unordered(apply_batch, tasks)
+
+            # Collect all results
+            for i, n_rows, result in results_iter:
+                finished[i] = result
+                if checkpoint is not None:
+                    write_checkpoint(checkpoint, i, result)
+                pbar.update(n_rows)
+
+        # Close the process pool and progress bar
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            _WORKER.clear()
+            pbar.close()
+
+    # Combine all results
+    if finished:
+        results = pd.concat([finished[i] for i in sorted(finished)])
+    else:
+        results = pd.DataFrame(index=pd.Index([], name='objid'))
+
+    # Return results
+    return(results)
+
+
+# This function streams the database in batches of complete objid groups
+def iter_objid_batches(exp_dir=None, columns=None, *, batch_size=BATCH_SIZE,
+                       progress=False):
+    """
+    Generator that streams the existing micro-lensing database in the
+    provided `exp_dir` in batches of complete objid groups.
+
+    The batches are read from a copy of the database that is clustered on
+    objid, which is created with a single out-of-core sort pass the first
+    time it is required (and after every update).
+
+    Optional
+    --------
+    exp_dir : str or None. Default: None
+        The relative or absolute path to the directory that contains an
+        existing micro-lensing database.
+        If *None*, the current working directory is used.
+    columns : list of str or None. Default: None
+        The columns that are provided in every batch. If *None*, all columns
+        are provided. The 'objid' column is always provided.
+    batch_size : int. Default: 10_000_000
+        The number of rows in a single batch. Objects with more rows than this
+        are provided in a batch of their own.
+    progress : bool. Default: False
+        Whether to show a progress bar while the clustered copy is created.
+
+    Yields
+    ------
+    data : dict of :obj:`~numpy.ndarray` objects
+        The columns of a single batch, sorted on objid. These arrays are
+        read-only views of the clustered copy of the database.
+    offsets : :obj:`~numpy.ndarray` object
+        The start of every objid group in `data`, plus the total number of
+        rows in the batch.
+
+    """
+
+    # Obtain access to the database
+    with mld_main.Database(exp_dir).access() as mld:
+        # Make sure the clustered copy of the database exists
+        columns = get_columns(columns)
+        paths = get_clustered_columns(mld, columns, batch_size, progress)
+
+        # Divide the database into batches of complete objid groups
+        objids, counts = read_objid_counts(mld)
+        bounds = get_batch_bounds(counts, batch_size)
+        row_bounds = np.concatenate([[0], np.cumsum(counts)])
+
+        # Map all columns into memory
+        data = {name: np.load(file, mmap_mode='r')
+                for name, file in paths.items()}
+
+        # Yield all batches
+        for i in range(len(bounds)-1):
+            start, stop = row_bounds[bounds[i]], row_bounds[bounds[i+1]]
+            offsets = row_bounds[bounds[i]:bounds[i+1]+1]-start
+            yield({name: values[start:stop] for name, values in data.items()},
+                  offsets)
+
+
+# This function returns the columns that must be provided
+def get_columns(columns):
+    # If no columns were given, provide all columns
+    if columns is None:
+        return(list(EXP_HEADER))
+
+    # Check if all columns exist
+    for name in columns:
+        if name not in EXP_HEADER:
+            raise ValueError(f"Input argument 'columns' contains unknown "
+                             f"column {name!r}!")
+
+    # Make sure objid is the first column
+    return(['objid', *[name for name in columns if name != 'objid']])
+
+
+# This function reads the objids and their counts from the master file
+def read_objid_counts(mld):
+    # Open the master file and read the objids dataset
+    with h5py.File(path.join(mld, MASTER_FILE), 'r') as m_file:
+        objids = m_file['objids'][()]
+
+    # Return the objids and counts
+    return(objids['objid'], objids['count'])
+
+
+# This function divides all objids into batches of complete groups
+def get_batch_bounds(counts, batch_size):
+    # Determine the cumulative number of rows before every objid
+    cum_counts = np.concatenate([[0], np.cumsum(counts)])
+
+    # Determine the objid indices at which every batch starts
+    bounds = np.searchsorted(
+        cum_counts, np.arange(0, cum_counts[-1], batch_size), 'right')-1
+
+    # Make sure every batch contains at least one objid
+    bounds = np.unique(np.concatenate([bounds, [len(counts)]]))
+
+    # Return bounds
+    return(bounds)
+
+
+# This function returns the stamp of the current state of the database
+def get_database_stamp(mld):
+    stat = os.stat(path.join(mld, MASTER_EXP_FILE))
+    return({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+
+
+# This function makes sure the clustered copy of the provided columns exists
+def get_clustered_columns(mld, columns, batch_size, progress):
+    """
+    Makes sure that all provided `columns` of the database in `mld` exist in
+    its clustered copy, creating them if required, and returns the paths to
+    their files.
+
+    The clustered copy stores every column as a NumPy file sorted on objid
+    (keeping the original order of the rows of the same objid), which allows
+    for it to be mapped into memory by any number of processes. Columns are
+    created with a single pass over the database, in which all rows are
+    scattered into batches of objid ranges that fit within `batch_size` rows
+    (using the objid counts in the master file), followed by sorting every
+    batch in memory.
+
+    The clustered copy is checked and created while holding an exclusive lock
+    on its directory, such that processes that use the database at the same
+    time never create the same columns twice or remove columns that another
+    process is creating. Every column is written to a temporary file that is
+    moved into place once it is complete. While a column is created, its
+    temporary file and that of the 'objid' column take up as much disk space
+    as these columns in the database, in addition to the clustered copy.
+
+    """
+
+    # Determine the path to the clustered directory and its stamp
+    clustered_dir = path.join(mld, CLUSTERED_DIR)
+    stamp_file = path.join(clustered_dir, 'stamp.json')
+    stamp = get_database_stamp(mld)
+
+    # Make sure that only a single process checks and creates the copy
+    os.makedirs(clustered_dir, exist_ok=True)
+    with use_lock(open_lock_file(path.join(clustered_dir, '.lock')),
+                  None if fcntl is None else fcntl.LOCK_EX):
+        # Check if the clustered copy is outdated
+        try:
+            with open(stamp_file, 'r') as file:
+                outdated = (json.load(file) != stamp)
+        except (OSError, ValueError):
+            outdated = True
+
+        # If so, remove all of its files
+        # Else, only remove the temporary files of processes that were killed
+        pattern = '*' if outdated else '*.tmp'
+        for filename in glob(path.join(clustered_dir, pattern)):
+            os.remove(filename)
+
+        # If it is outdated, write the stamp of the database it is a copy of
+        if outdated:
+            with open(f"{stamp_file}.tmp", 'w') as file:
+                json.dump(stamp, file)
+            os.replace(f"{stamp_file}.tmp", stamp_file)
+
+        # Determine the paths to all columns and which are missing
+        paths = {name: path.join(clustered_dir, f"{name}.npy")
+                 for name in columns}
+        missing = [name for name in columns if not path.exists(paths[name])]
+
+        # Create all missing columns
+        if missing:
+            cluster_columns(mld, missing, paths, batch_size, progress)
+
+    # Return paths
+    return(paths)
+
+
+# This function creates the clustered copy of the provided columns
+def cluster_columns(mld, names, paths, batch_size, progress):
+    # Obtain the objid counts and the rows at which every batch starts
+    objids, counts = read_objid_counts(mld)
+    bounds = get_batch_bounds(counts, batch_size)
+    row_bounds = np.concatenate([[0], np.cumsum(counts)])[bounds]
+    batch_objids = objids[bounds[:-1]]
+
+    # Determine the temporary paths of all columns that are created
+    # The objid column is always scattered, as batches are sorted on it
+    tmp_paths = {name: f"{paths[name]}.{get_worker_id()}.tmp"
+                 for name in ['objid', *names]}
+
+    # Open the master exposure file
+    with h5py.File(path.join(mld, MASTER_EXP_FILE), 'r') as file:
+        # Obtain the datasets of all columns
+        dsets = {name: file[VAEX_COLUMN.format(name)] for name in tmp_paths}
+        n_rows = dsets['objid'].shape[0]
+
+        # Check that the objid counts match the database
+        if(n_rows != row_bounds[-1]):
+            mld_main.raise_error("Objid counts in the master file do not "
+                                 "match the database! Finish the update of "
+                                 "the database with 'mld update -n 0' first!")
+
+        # Create all columns as NumPy files that are mapped into memory
+        out = {name: np.lib.format.open_memmap(
+                   tmp_path, 'w+', dsets[name].dtype, (n_rows,))
+               for name, tmp_path in tmp_paths.items()}
+
+        # Wrap in try-statement to remove all temporary files on failure
+        try:
+            # Scatter all rows chunk by chunk into their batches
+            fill = row_bounds[:-1].copy()
+            pbar = tqdm(desc="Clustering", total=2*n_rows, unit='rows',
+                        dynamic_ncols=True, disable=not progress)
+            for start in range(0, n_rows, batch_size):
+                # Determine the batch of every row in this chunk
+                stop = min(start+batch_size, n_rows)
+                batch = np.searchsorted(
+                    batch_objids, dsets['objid'][start:stop], 'right')-1
+
+                # Determine where every row must be written to
+                order = np.argsort(batch, kind='stable')
+                batch = batch[order]
+                n_batch = np.bincount(batch, minlength=len(fill))
+                first = np.cumsum(n_batch)-n_batch
+                dest = fill[batch]+np.arange(stop-start)-first[batch]
+                fill += n_batch
+
+                # Write all columns
+                for name, dset in dsets.items():
+                    out[name][dest] = dset[start:stop][order]
+                pbar.update(stop-start)
+
+            # Sort every batch on objid
+            for start, stop in zip(row_bounds[:-1], row_bounds[1:]):
+                order = np.argsort(out['objid'][start:stop], kind='stable')
+                for values in out.values():
+                    values[start:stop] = values[start:stop][order]
+                pbar.update(stop-start)
+            pbar.close()
+
+            # Move all created columns into place
+            for name, values in out.items():
+                values.flush()
+                if name in names:
+                    os.replace(tmp_paths[name], paths[name])
+
+        # Remove all temporary files
+        finally:
+            out.clear()
+            for tmp_path in tmp_paths.values():
+                if path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+
+# This function initializes a worker process of apply_objid
+def init_worker(func, per_group, paths):
+    _WORKER['func'] = func
+    _WORKER['per_group'] = per_group
+    _WORKER['data'] = {name: np.load(file, mmap_mode='r')
+                       for name, file in paths.items()}
+
+
+# This function applies the function of this worker to a single batch
+def apply_batch(task):
+    # Unpack the task
+    i, start, objids, counts = task
+    func = _WORKER['func']
+
+    # Obtain the data of this batch
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    data = {name: values[start:start+offsets[-1]]
+            for name, values in _WORKER['data'].items()}
+
+    # Apply func to every group
+    if _WORKER['per_group']:
+        results = [func({name: values[a:b] for name, values in data.items()})
+                   for a, b in zip(offsets[:-1], offsets[1:])]
+        if results and isinstance(results[0], dict):
+            results = {key: [result[key] for result in results]
+                       for key in results[0]}
+        else:
+            results = {'result': results}
+
+    # Apply func to the entire batch
+    else:
+        results = func(data, offsets)
+        if not isinstance(results, dict):
+            results = {'result': results}
+
+    # Create the table of results
+    results = pd.DataFrame(results, index=pd.Index(objids, name='objid'))
+
+    # Return the results
+    return(i, int(offsets[-1]), results)
+
+
+# This function reads all finished batches from a checkpoint directory
+def read_checkpoint(mld, checkpoint, batch_size, n_batches):
+    # Determine the metadata of this call
+    meta = {'database': get_database_stamp(mld), 'batch_size': batch_size,
+            'n_batches': n_batches}
+    meta_file = path.join(checkpoint, 'checkpoint.json')
+
+    # If the checkpoint directory contains results, check if they match
+    if path.exists(meta_file):
+        with open(meta_file, 'r') as file:
+            if(json.load(file) != meta):
+                raise ValueError(f"Checkpoint directory {checkpoint!r} "
+                                 f"contains results of a different database "
+                                 f"or batch size!")
+
+    # Else, create it
+    else:
+        os.makedirs(checkpoint, exist_ok=True)
+        with open(meta_file, 'w') as file:
+            json.dump(meta, file)
+
+    # Read all finished batches
+    finished = {}
+    for i in range(n_batches):
+        batch_file = path.join(checkpoint, f"batch_{i:06d}.pkl")
+        if path.exists(batch_file):
+            finished[i] = pd.read_pickle(batch_file)
+
+    # Return finished
+    return(finished)
+
+
+# This function writes the results of a finished batch to a checkpoint
+def write_checkpoint(checkpoint, i, results):
+    # Write the results to a temporary file and move it into place
+    batch_file = path.join(checkpoint, f"batch_{i:06d}.pkl")
+    results.to_pickle(batch_file+'.tmp')
+    os.replace(batch_file+'.tmp', batch_file)
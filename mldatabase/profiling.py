@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+
+"""
+Profiling
+=========
+Provides the structured profiling and throughput instrumentation that can be
+used for measuring the different stages of a database update.
+
+"""
+
+
+# %% IMPORTS
+# Built-in imports
+from contextlib import contextmanager
+from glob import glob
+import json
+import os
+from os import path
+import sys
+import threading
+import time
+
+# MLDatabase imports
+from mldatabase.__version__ import __version__
+from mldatabase._globals import MLD_NAME, PROFILE_DIR
+
+# Try to import the resource module (not available on Windows)
+try:
+    import resource
+except ImportError:     # pragma: no cover
+    resource = None
+
+# All declaration
+__all__ = ['UpdateProfiler', 'add_profile_hook', 'get_update_profiles',
+           'remove_profile_hook']
+
+
+# %% GLOBALS
+# List of functions that are called whenever a profiled stage finishes
+_HOOKS = []
+
+# Names of all counters that are recorded for every stage
+COUNTERS = ('rows', 'bytes_read', 'bytes_written')
+
+
+# %% CLASS DEFINITIONS
+# Define class that records the profiling information of an update
+class UpdateProfiler(object):
+    """
+    Records the wall time, CPU time, number of rows, bytes read and written,
+    and peak resident set size increase of every stage of a database update.
+
+    Stages with the same name are accumulated into a single record, such that
+    the per-exposure stages report the totals over all processed exposures.
+
+    As the peak resident set size of a process can only grow, every stage
+    records by how much its calls increased it at most ('peak_rss_increase'),
+    while the peak resident set size of the entire process is recorded for
+    the update as a whole ('peak_rss').
+    As stages run concurrently in different threads, the CPU time of a stage
+    is the CPU time of the thread that runs it. Stages that are run in other
+    processes are added with :meth:`~add_stages`.
+
+    Optional
+    --------
+    enabled : bool. Default: True
+        Whether profiling information should be recorded.
+        If any hooks were added with :func:`~add_profile_hook`, profiling
+        information is always recorded.
+
+    """
+
+    def __init__(self, enabled=True):
+        # Save whether this profiler records anything
+        self.enabled = bool(enabled or _HOOKS)
+
+        # Initialize empty dict of stage records
+        # Stages can be recorded by multiple threads at the same time
+        self.stages = {}
+        self._lock = threading.Lock()
+
+        # Save the starting times of this profiler
+        self._started = time.time()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+
+    # This function returns a context manager that profiles a single stage
+    @contextmanager
+    def stage(self, name, **counters):
+        """
+        Context manager that profiles the stage with the given `name`.
+
+        The context manager yields a dict, in which the 'rows', 'bytes_read'
+        and 'bytes_written' counters of this stage can be increased. Any
+        counters provided as keyword arguments are used as their initial
+        values.
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage that is profiled.
+
+        """
+
+        # Create dict of counters of this stage
+        stage_counters = dict.fromkeys(COUNTERS, 0)
+        stage_counters.update(counters)
+
+        # If this profiler is disabled, simply yield the counters
+        if not self.enabled:
+            yield stage_counters
+            return
+
+        # Obtain the starting times and peak RSS
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        rss_start = get_peak_rss()
+
+        # Yield the counters and record the stage afterward
+        try:
+            yield stage_counters
+        finally:
+            rss_increase = (None if rss_start is None else
+                            get_peak_rss()-rss_start)
+            self._record(name, {
+                'calls': 1,
+                'wall_time': time.perf_counter()-wall_start,
+                'cpu_time': time.thread_time()-cpu_start,
+                **{key: int(stage_counters.get(key, 0)) for key in COUNTERS},
+                'peak_rss_increase': rss_increase})
+
+    # This function removes and returns all stage records
+    def pop_stages(self):
+        """
+        Removes all stage records from this profiler and returns them, such
+        that they can be added to a different profiler with
+        :meth:`~add_stages`.
+
+        """
+
+        with self._lock:
+            stages, self.stages = self.stages, {}
+        return(stages)
+
+    # This function adds the stage records of a different profiler
+    def add_stages(self, stages):
+        """
+        Adds the provided `stages`, as returned by :meth:`~pop_stages` of a
+        different profiler (e.g., of a process that processes exposures), to
+        the stage records of this profiler.
+
+        """
+
+        # If this profiler is disabled, do not record anything
+        if not self.enabled:
+            return
+
+        # Add all records
+        for name, record in stages.items():
+            self._record(name, record)
+
+    # This function adds the measurements of a stage to the stage records
+    def _record(self, name, measurements):
+        with self._lock:
+            # Obtain the record of this stage, creating it if it does not exist
+            record = self.stages.setdefault(
+                name, {'calls': 0, 'wall_time': 0.0, 'cpu_time': 0.0,
+                       **dict.fromkeys(COUNTERS, 0),
+                       'peak_rss_increase': None})
+
+            # Add the measurements to the record
+            for key in ('calls', 'wall_time', 'cpu_time', *COUNTERS):
+                record[key] += measurements[key]
+            if measurements['peak_rss_increase'] is not None:
+                record['peak_rss_increase'] = max(
+                    record['peak_rss_increase'] or 0,
+                    measurements['peak_rss_increase'])
+            record = dict(record)
+
+        # Call all hooks with the record of this stage
+        for hook in _HOOKS:
+            hook(name, record)
+
+    # This function returns a JSON-serializable dict of all records
+    def to_dict(self):
+        """
+        Returns a JSON-serializable dict containing all stage records gathered
+        by this profiler, including the derived throughputs of every stage.
+
+        """
+
+        # Initialize empty dict of stages
+        stages = {}
+
+        # Loop over all stage records and add the throughputs to them
+        for name, record in self.stages.items():
+            stages[name] = record = dict(record)
+            wall_time = record['wall_time']
+            for key in COUNTERS:
+                record[f'{key}_per_s'] = (
+                    record[key]/wall_time if wall_time else None)
+
+        # Return the dict of all profiling information
+        return({
+            'version': __version__,
+            'started': self._started,
+            'wall_time': time.perf_counter()-self._wall_start,
+            'cpu_time': time.process_time()-self._cpu_start,
+            'peak_rss': get_peak_rss(),
+            'stages': stages})
+
+    # This function writes all records as a JSON-file to the given directory
+    def dump(self, mld, **info):
+        """
+        Writes all profiling information gathered by this profiler as a
+        JSON-file to the profiles directory in the provided database directory
+        `mld`. Any additional keyword arguments are added to the JSON-file.
+
+        Parameters
+        ----------
+        mld : str
+            The absolute path to the database directory.
+
+        Returns
+        -------
+        filename : str
+            The absolute path to the JSON-file that was written.
+
+        """
+
+        # Make sure that the profiles directory exists
+        profile_dir = path.join(mld, PROFILE_DIR)
+        os.makedirs(profile_dir, exist_ok=True)
+
+        # Determine the name of the JSON-file
+        # It contains the microseconds and process ID, such that updates that
+        # start within the same second do not overwrite each other's profile
+        timestamp = time.strftime('%Y%m%d_%H%M%S',
+                                  time.localtime(self._started))
+        microseconds = int(self._started % 1*1e6)
+        filename = path.join(
+            profile_dir,
+            f"update_{timestamp}_{microseconds:06d}_{os.getpid()}.json")
+
+        # Write the profiling information
+        with open(filename, 'w') as file:
+            json.dump({**self.to_dict(), **info}, file, indent=4)
+
+        # Return filename
+        return(filename)
+
+
+# %% FUNCTION DEFINITIONS
+# This function adds a profile hook
+def add_profile_hook(func):
+    """
+    Adds the provided `func` to the list of profile hooks.
+
+    Every profile hook is called as ``func(name, record)`` whenever a stage of
+    a database update finishes, where `name` is the name of the stage and
+    `record` is a dict with its accumulated profiling information.
+    As long as at least a single profile hook exists, all database updates
+    record profiling information.
+
+    Parameters
+    ----------
+    func : callable
+        The function that must be called whenever a stage finishes.
+
+    """
+
+    # Add func to the list of hooks
+    _HOOKS.append(func)
+
+
+# This function removes a profile hook
+def remove_profile_hook(func):
+    """
+    Removes the provided `func` from the list of profile hooks, which was
+    previously added with :func:`~add_profile_hook`.
+
+    Parameters
+    ----------
+    func : callable
+        The function that must be removed.
+
+    """
+
+    # Remove func from the list of hooks
+    _HOOKS.remove(func)
+
+
+# This function returns the peak RSS of this process in bytes
+def get_peak_rss():
+    # If the resource module is not available, return None
+    if resource is None:    # pragma: no cover
+        return(None)
+
+    # Obtain the maximum RSS of this process (in KiB on Linux)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Convert to bytes and return
+    return(peak_rss*(1 if(sys.platform == 'darwin') else 1024))
+
+
+# This function returns all update profiles that were written for a database
+def get_update_profiles(exp_dir=None):
+    """
+    Returns all update profiles that were written for the micro-lensing
+    database in the provided `exp_dir` with ``mld update --profile``.
+
+    Optional
+    --------
+    exp_dir : str or None. Default: None
+        The relative or absolute path to the directory that contains an
+        existing micro-lensing database.
+        If *None*, the current working directory is used.
+        This argument is equivalent to the optional `-d`/`--dir` argument when
+        using the command-line interface.
+
+    Returns
+    -------
+    profiles : list of dict
+        List with the profiling information of every profiled update, sorted
+        from oldest to newest.
+
+    """
+
+    # Obtain the path to the profiles directory
+    profile_dir = path.join(path.abspath(exp_dir if exp_dir else '.'),
+                            MLD_NAME, PROFILE_DIR)
+
+    # Initialize empty list of profiles
+    profiles = []
+
+    # Read in all profiles
+    for filename in sorted(glob(path.join(profile_dir, 'update_*.json'))):
+        with open(filename, 'r') as file:
+            profiles.append(json.load(file))
+
+    # Return profiles
+    return(profiles)
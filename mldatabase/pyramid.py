@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+
+"""
+Pyramid
+=======
+Provides the functions for building and reading a pyramid of binned light
+curves, which stores the time-binned aggregates of every object at several
+bin widths for fast plotting.
+
+"""
+
+
+# %% IMPORTS
+# Built-in imports
+import os
+from os import path
+
+# Package imports
+import h5py
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+# MLDatabase imports
+from mldatabase import __main__ as mld_main
+from mldatabase._coordination import get_worker_id
+from mldatabase._globals import MASTER_EXP_FILE, MASTER_FILE, PYRAMID_FILE
+from mldatabase.grouping import (
+    BATCH_SIZE, get_batch_bounds, get_clustered_columns, read_objid_counts)
+
+# All declaration
+__all__ = ['build_pyramid', 'get_binned_light_curve']
+
+
+# %% GLOBALS
+# Default hjd bin widths of all levels of the pyramid in days
+BIN_WIDTHS = (0.01, 0.1, 1.0, 10.0, 100.0)
+
+# Define the dtype of the bins in every level of the pyramid
+BINS_DTYPE = [('bin', int),
+              ('count', int),
+              ('mag_mean', float),
+              ('mag_min', float),
+              ('mag_max', float),
+              ('mag_wmean', float)]
+
+
+# %% FUNCTION DEFINITIONS
+# This function builds the pyramid of the database
+def build_pyramid(exp_dir=None, bin_widths=BIN_WIDTHS, *,
+                  batch_size=BATCH_SIZE, progress=True):
+    """
+    Builds the pyramid of binned light curves of the existing micro-lensing
+    database in the provided `exp_dir`, replacing it if it already exists.
+
+    For every object and every bin width, all rows are divided into hjd bins
+    of that width, of which the number of rows, the mean, minimum and maximum
+    'mag' and the error-weighted mean 'mag' are stored. Once a pyramid has
+    been built, it is rebuilt after every update of the database.
+
+    Optional
+    --------
+    exp_dir : str or None. Default: None
+        The relative or absolute path to the directory that contains an
+        existing micro-lensing database.
+        If *None*, the current working directory is used.
+    bin_widths : list of float. Default: (0.01, 0.1, 1.0, 10.0, 100.0)
+        The hjd bin widths of all levels of the pyramid in days.
+    batch_size : int. Default: 10_000_000
+        The number of rows that are binned at once.
+    progress : bool. Default: True
+        Whether to show a progress bar.
+
+    """
+
+    # Obtain access to the database and build the pyramid
+    with mld_main.Database(exp_dir).access() as mld:
+        write_pyramid(mld, bin_widths, batch_size, progress)
+
+
+# This function returns the binned light curve of an object
+def get_binned_light_curve(objid, exp_dir=None, *, hjd_range=None,
+                           n_pixels=1000):
+    """
+    Returns the binned light curve of the provided `objid` in the existing
+    micro-lensing database in the provided `exp_dir`, at the resolution that
+    matches a plot that is `n_pixels` pixels wide.
+
+    The finest level of the pyramid that has at most `n_pixels` bins in
+    `hjd_range` is used, or the coarsest level if there is none.
+
+    Optional
+    --------
+    exp_dir : str or None. Default: None
+        The relative or absolute path to the directory that contains an
+        existing micro-lensing database.
+        If *None*, the current working directory is used.
+    hjd_range : tuple of float or None. Default: None
+        The (inclusive) hjd range of the light curve. If *None*, the entire
+        light curve is used.
+    n_pixels : int. Default: 1000
+        The width of the plot in pixels.
+
+    Returns
+    -------
+    light_curve : :obj:`~pandas.DataFrame` object
+        The bins of the light curve, with the 'hjd' at the center of every
+        bin, its 'count' and its 'mag_mean', 'mag_min', 'mag_max' and
+        'mag_wmean'. The bin width is stored in its 'bin_width' attribute.
+
+    """
+
+    # Obtain access to the database
+    with mld_main.Database(exp_dir).access() as mld:
+        # Check that the pyramid exists and is up-to-date
+        pyramid_file = path.join(mld, PYRAMID_FILE)
+        if not path.exists(pyramid_file):
+            raise OSError("Database has no pyramid of binned light curves! "
+                          "Build it with 'mld update --pyramid' or "
+                          "'build_pyramid' first!")
+        with h5py.File(path.join(mld, MASTER_FILE), 'r') as m_file:
+            db_version = m_file.attrs.get('db_version', 0)
+
+        # Open the pyramid file
+        with h5py.File(pyramid_file, 'r') as file:
+            if(file.attrs['db_version'] != db_version):
+                raise OSError("Pyramid of binned light curves is outdated! "
+                              "Rebuild it with 'build_pyramid' first!")
+
+            # Determine where the bins of this objid can be found
+            bin_widths = file.attrs['bin_widths']
+            objids = file['objids'][()]
+            index = np.searchsorted(objids, objid)
+            found = (index < len(objids) and objids[index] == objid)
+
+            # If no hjd_range was given, use the first and last finest bins
+            if found and hjd_range is None:
+                offsets = file['level0/offsets'][index:index+2]
+                first, last = file['level0/bins'][[offsets[0],
+                                                   offsets[1]-1]]['bin']
+                hjd_range = (first*bin_widths[0], (last+1)*bin_widths[0])
+
+            # Determine the finest level that fits within n_pixels
+            if found:
+                span = hjd_range[1]-hjd_range[0]
+                fits = np.nonzero(span/bin_widths <= n_pixels)[0]
+                level = fits[0] if fits.size else len(bin_widths)-1
+                bins = read_bins(file, level, index)
+                bin_width = bin_widths[level]
+            else:
+                bins = np.empty(0, dtype=BINS_DTYPE)
+                bin_width = np.nan
+
+    # Convert the bins to a light curve
+    light_curve = pd.DataFrame({'hjd': (bins['bin']+0.5)*bin_width})
+    for name, _ in BINS_DTYPE[1:]:
+        light_curve[name] = bins[name]
+
+    # Remove all bins outside of hjd_range
+    if found:
+        light_curve = light_curve[
+            (light_curve['hjd'] >= hjd_range[0]-bin_width/2) &
+            (light_curve['hjd'] <= hjd_range[1]+bin_width/2)]
+        light_curve = light_curve.reset_index(drop=True)
+
+    # Return it
+    light_curve.attrs['bin_width'] = bin_width
+    return(light_curve)
+
+
+# This function reads the bins of an objid in a level of the pyramid
+def read_bins(file, level, index):
+    offsets = file[f"level{level}/offsets"][index:index+2]
+    return(file[f"level{level}/bins"][offsets[0]:offsets[1]])
+
+
+# This function builds or rebuilds the pyramid of the database if required
+def update_pyramid(mld, required=False, progress=True):
+    """
+    Builds the pyramid of binned light curves of the database in `mld` if it
+    is `required` and does not exist yet, or rebuilds it (with the same bin
+    widths) if it exists but is outdated.
+
+    Returns
+    -------
+    built : bool
+        Whether the pyramid was (re)built.
+
+    """
+
+    # If the database has no rows yet, there is nothing to build
+    if not path.exists(path.join(mld, MASTER_EXP_FILE)):
+        return(False)
+
+    # Check if the pyramid exists and is up-to-date
+    pyramid_file = path.join(mld, PYRAMID_FILE)
+    if path.exists(pyramid_file):
+        with h5py.File(pyramid_file, 'r') as file,\
+                h5py.File(path.join(mld, MASTER_FILE), 'r') as m_file:
+            bin_widths = file.attrs['bin_widths']
+            if(file.attrs['db_version'] == m_file.attrs.get('db_version', 0)):
+                return(False)
+
+    # If it does not exist, only build it if it is required
+    elif required:
+        bin_widths = BIN_WIDTHS
+    else:
+        return(False)
+
+    # Build the pyramid
+    write_pyramid(mld, bin_widths, BATCH_SIZE, progress)
+    return(True)
+
+
+# This function writes the pyramid of the database in mld
+def write_pyramid(mld, bin_widths, batch_size, progress):
+    """
+    Writes the pyramid of binned light curves of the database in `mld`, with
+    the provided `bin_widths`, reading the database from its clustered copy
+    in batches of roughly `batch_size` rows.
+
+    """
+
+    # Make sure the clustered copy of the required columns exists
+    columns = ['objid', 'hjd', 'mag', 'magerr']
+    paths = get_clustered_columns(mld, columns, batch_size, progress)
+    data = {name: np.load(file, mmap_mode='r')
+            for name, file in paths.items()}
+
+    # Divide the database into batches of complete objid groups
+    objids, counts = read_objid_counts(mld)
+    bounds = get_batch_bounds(counts, batch_size)
+    row_bounds = np.concatenate([[0], np.cumsum(counts)])
+    bin_widths = np.sort(np.array(bin_widths, dtype=float))
+
+    # Obtain the version of the database
+    with h5py.File(path.join(mld, MASTER_FILE), 'r') as m_file:
+        db_version = m_file.attrs.get('db_version', 0)
+
+    # Write the pyramid to a temporary file and move it into place afterward
+    pyramid_file = path.join(mld, PYRAMID_FILE)
+    tmp_file = f"{pyramid_file}.{get_worker_id()}.tmp"
+    try:
+        with h5py.File(tmp_file, 'w') as file:
+            # Save the pyramid properties and the objids
+            file.attrs['bin_widths'] = bin_widths
+            file.attrs['db_version'] = db_version
+            file.create_dataset('objids', data=objids)
+
+            # Create the bins and offsets of every level
+            levels = []
+            for i in range(len(bin_widths)):
+                group = file.create_group(f"level{i}")
+                bins = group.create_dataset('bins', shape=(0,),
+                                            dtype=BINS_DTYPE,
+                                            maxshape=(None,), chunks=True)
+                offsets = group.create_dataset('offsets',
+                                               shape=(len(objids)+1,),
+                                               dtype=int)
+                offsets[0] = 0
+                levels.append((bins, offsets))
+
+            # Bin all batches
+            pbar = tqdm(desc="Building pyramid", total=row_bounds[-1],
+                        unit='rows', dynamic_ncols=True, disable=not progress)
+            for i in range(len(bounds)-1):
+                # Obtain the data of this batch
+                start, stop = row_bounds[bounds[i]], row_bounds[bounds[i+1]]
+                batch = {name: np.asarray(values[start:stop])
+                         for name, values in data.items()}
+
+                # Bin this batch at every bin width
+                for width, (bins, offsets) in zip(bin_widths, levels):
+                    batch_bins, n_bins = bin_rows(batch, width)
+
+                    # Append the bins and their offsets to this level
+                    n_prev = bins.shape[0]
+                    bins.resize(n_prev+len(batch_bins), axis=0)
+                    bins[n_prev:] = batch_bins
+                    offsets[bounds[i]+1:bounds[i+1]+1] =\
+                        n_prev+np.cumsum(n_bins)
+                pbar.update(stop-start)
+            pbar.close()
+
+        # Move the pyramid into place
+        os.replace(tmp_file, pyramid_file)
+
+    # Remove the temporary file if it still exists
+    finally:
+        if path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+# This function bins the rows of complete objid groups
+def bin_rows(batch, width):
+    """
+    Divides all rows in the provided `batch` (sorted on objid) into hjd bins
+    of the provided `width` per objid.
+
+    Returns
+    -------
+    bins : :obj:`~numpy.ndarray` object
+        The aggregates of all bins, sorted on objid and bin.
+    n_bins : :obj:`~numpy.ndarray` object
+        The number of bins of every objid in `batch`.
+
+    """
+
+    # Sort all rows on objid and bin
+    bin_index = np.floor(batch['hjd']/width).astype(int)
+    order = np.lexsort((bin_index, batch['objid']))
+    objid = batch['objid'][order]
+    bin_index = bin_index[order]
+    mag = batch['mag'][order]
+    magerr = batch['magerr'][order]
+
+    # Determine where every bin starts
+    new = np.ones(len(order), dtype=bool)
+    new[1:] = (objid[1:] != objid[:-1]) | (bin_index[1:] != bin_index[:-1])
+    starts = np.nonzero(new)[0]
+
+    # Determine the weights of all rows, ignoring invalid errors
+    valid = np.isfinite(magerr) & (magerr > 0)
+    weights = np.where(valid, 1/np.where(valid, magerr, 1)**2, 0)
+
+    # Calculate the aggregates of all bins
+    bins = np.empty(len(starts), dtype=BINS_DTYPE)
+    bins['bin'] = bin_index[starts]
+    bins['count'] = np.diff(np.append(starts, len(order)))
+    bins['mag_mean'] = np.add.reduceat(mag, starts)/bins['count']
+    bins['mag_min'] = np.fmin.reduceat(mag, starts)
+    bins['mag_max'] = np.fmax.reduceat(mag, starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        bins['mag_wmean'] = (np.add.reduceat(weights*mag, starts) /
+                             np.add.reduceat(weights, starts))
+
+    # Determine the number of bins of every objid
+    _, n_bins = np.unique(objid[starts], return_counts=True)
+
+    # Return bins and n_bins
+    return(bins, n_bins)
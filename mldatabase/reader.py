@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+"""
+Reader
+======
+Provides a lightweight reader that gives access to the columns of a
+micro-lensing database as NumPy arrays that are mapped into memory, without
+importing vaex.
+
+"""
+
+
+# %% IMPORTS
+# Built-in imports
+from contextlib import contextmanager
+
+# Package imports
+import h5py
+import numpy as np
+
+# MLDatabase imports
+from mldatabase import __main__ as mld_main
+from mldatabase._globals import EXP_HEADER, VAEX_COLUMN
+
+# All declaration
+__all__ = ['ColumnReader', 'open_columns']
+
+
+# %% CLASS DEFINITIONS
+# Define class that provides the columns of the master exposure file
+class ColumnReader(object):
+    """
+    Provides read-only access to the columns of the master exposure file
+    `filename` of a micro-lensing database.
+
+    Every column that is stored contiguously (and uncompressed) is provided
+    as a read-only :obj:`~numpy.memmap` object, which does not copy any data.
+    All columns (including those that are not stored contiguously) can be
+    read in chunks with :meth:`~iter_chunks`.
+
+    Parameters
+    ----------
+    filename : str
+        The path to the master exposure file.
+
+    """
+
+    def __init__(self, filename):
+        # Save provided filename and open it
+        self.filename = filename
+        self._file = h5py.File(filename, 'r')
+
+        # Obtain the datasets of all columns
+        self._dsets = {name: self._file[VAEX_COLUMN.format(name)]
+                       for name in EXP_HEADER
+                       if VAEX_COLUMN.format(name) in self._file}
+
+        # Initialize the memory maps of all columns
+        self._memmaps = {}
+
+    def __repr__(self):
+        return(f"{self.__class__.__name__}({self.filename!r})")
+
+    def __len__(self):
+        return(self._dsets['objid'].shape[0])
+
+    def __contains__(self, name):
+        return(name in self._dsets)
+
+    # This function returns the memory map of a column
+    def __getitem__(self, name):
+        # Check if this column can be mapped into memory
+        if not self.is_contiguous(name):
+            raise ValueError(f"Column {name!r} is not stored contiguously and "
+                             f"cannot be mapped into memory! Use "
+                             f"'iter_chunks' instead.")
+
+        # Create the memory map of this column if it does not exist yet
+        if name not in self._memmaps:
+            dset = self._dsets[name]
+            if dset.size:
+                self._memmaps[name] = np.memmap(
+                    self.filename, dset.dtype, 'r', dset.id.get_offset(),
+                    dset.shape)
+            else:
+                self._memmaps[name] = np.empty(dset.shape, dset.dtype)
+                self._memmaps[name].flags.writeable = False
+
+        # Return it
+        return(self._memmaps[name])
+
+    # The names of all columns
+    @property
+    def columns(self):
+        return(list(self._dsets))
+
+    # This function checks if a column is stored contiguously
+    def is_contiguous(self, name):
+        """
+        Returns whether the column with the provided `name` is stored
+        contiguously and uncompressed, and can thus be mapped into memory.
+
+        """
+
+        # Obtain the dataset of this column
+        try:
+            dset = self._dsets[name]
+        except KeyError:
+            raise KeyError(f"Database has no column {name!r}!")
+
+        # Check that the dataset is neither chunked nor filtered
+        return(dset.chunks is None and
+               (not dset.size or dset.id.get_offset() is not None))
+
+    # This function returns the source of a column
+    def get_source(self, name):
+        """
+        Returns the memory map of the column with the provided `name` if it
+        is stored contiguously, and its h5py dataset otherwise. Both provide
+        :obj:`~numpy.ndarray` objects when sliced.
+
+        """
+
+        return(self[name] if self.is_contiguous(name) else self._dsets[name])
+
+    # This function returns a segment of the rows of a column
+    def get_segment(self, name, row_slice=slice(None)):
+        """
+        Returns the rows in `row_slice` of the column with the provided
+        `name`, as a slice of its memory map if it is stored contiguously,
+        and as a :obj:`~DatasetSegment` of its h5py dataset otherwise. Both
+        provide :obj:`~numpy.ndarray` objects when sliced, but neither reads
+        any rows before that.
+
+        """
+
+        if self.is_contiguous(name):
+            return(self[name][row_slice])
+        else:
+            return(DatasetSegment(self._dsets[name], row_slice))
+
+    # This function iterates over the rows of columns in chunks
+    def iter_chunks(self, columns=None, chunk_size=1_000_000):
+        """
+        Iterates over all rows of the provided `columns` in chunks of
+        `chunk_size` rows. Contiguous columns are provided as slices of their
+        memory maps, while all other columns are read from the file.
+
+        Optional
+        --------
+        columns : list of str or None. Default: None
+            The columns that must be provided. If *None*, all columns are
+            provided.
+        chunk_size : int. Default: 1_000_000
+            The number of rows in a single chunk.
+
+        Yields
+        ------
+        start : int
+            The index of the first row in this chunk.
+        data : dict of :obj:`~numpy.ndarray` objects
+            The columns of this chunk.
+
+        """
+
+        # Determine the columns that must be provided
+        if columns is None:
+            columns = self.columns
+        sources = {name: self.get_source(name) for name in columns}
+
+        # Yield all chunks
+        n_rows = len(self)
+        for start in range(0, n_rows, chunk_size):
+            stop = min(start+chunk_size, n_rows)
+            yield(start, {name: source[start:stop]
+                          for name, source in sources.items()})
+
+    # This function closes the reader
+    def close(self):
+        """
+        Closes the master exposure file. Memory maps that were obtained from
+        this reader remain valid.
+
+        """
+
+        self._memmaps.clear()
+        self._file.close()
+
+
+# Define class that provides a segment of a column without reading it
+class DatasetSegment(object):
+    """
+    Provides the rows in `row_slice` of the h5py dataset `dset`, which are
+    only read when this segment is sliced.
+
+    """
+
+    def __init__(self, dset, row_slice):
+        # Save the dataset and the range of rows in this segment
+        self.dset = dset
+        self.start, self.stop, _ = row_slice.indices(dset.shape[0])
+        self.stop = max(self.start, self.stop)
+
+    def __len__(self):
+        return(self.stop-self.start)
+
+    # This function reads the provided slice of this segment
+    def __getitem__(self, key):
+        start, stop, _ = key.indices(len(self))
+        return(self.dset[self.start+start:self.start+max(start, stop)])
+
+    # The dtype of this segment
+    @property
+    def dtype(self):
+        return(self.dset.dtype)
+
+
+# %% FUNCTION DEFINITIONS
+# This function opens the database as a column reader
+@contextmanager
+def open_columns(exp_dir=None, *, cache_dir=None, cache_size=None):
+    """
+    Context manager for accessing the existing micro-lensing database in the
+    provided `exp_dir` as a :obj:`~ColumnReader` object, which provides its
+    columns as read-only NumPy arrays that are mapped into memory.
+
+    Unlike :func:`~mldatabase.open_database`, this does not import vaex or
+    create a DataFrame, which makes it much faster to open. The database is
+    accessed in the same way, such that it cannot be updated while it is
+    open.
+
+    Optional
+    --------
+    exp_dir : str or None. Default: None
+        The relative or absolute path to the directory that contains an
+        existing micro-lensing database.
+        If *None*, the current working directory is used.
+    cache_dir, cache_size : optional
+        The node-local cache that is used, as in
+        :func:`~mldatabase.open_database`.
+
+    Yields
+    ------
+    reader : :obj:`~ColumnReader` object
+        The reader of the database.
+
+    """
+
+    # Obtain access to the database
+    with mld_main.Database(exp_dir).access() as mld,\
+            mld_main.cached_exp_file(mld, cache_dir, cache_size) as exp_file:
+        # Open the master exposure file
+        reader = ColumnReader(exp_file)
+
+        # Yield the reader, closing it afterward
+        try:
+            yield reader
+        finally:
+            reader.close()
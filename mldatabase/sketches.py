@@ -0,0 +1,518 @@
+# -*- coding: utf-8 -*-
+
+"""
+Sketches
+========
+Provides the approximate statistics sketches of a micro-lensing database,
+which are stored per exposure in the master file and can be combined for any
+selection of exposures without reading the database itself.
+
+"""
+
+
+# %% IMPORTS
+# Built-in imports
+from os import path
+
+# Package imports
+import h5py
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+# MLDatabase imports
+from mldatabase import __main__ as mld_main
+from mldatabase._globals import EXP_HEADER, MASTER_FILE, VAEX_COLUMN
+
+# All declaration
+__all__ = ['Sketch', 'get_sketch']
+
+
+# %% GLOBALS
+# Number of index bits of the HyperLogLog sketch of distinct objids
+HLL_PRECISION = 10
+
+# Bin edges of the histograms of every sketched column
+HISTOGRAM_EDGES = {
+    'mag': np.linspace(10, 30, 401),
+    'magerr': np.logspace(-4, 1, 251)}
+
+# Number of rows that are sampled from every exposure
+SAMPLE_SIZE = 16
+
+# Define the dtype of the 'sketches/exposures' dataset in the master file
+SKETCH_DTYPE = [('expnum', int),
+                ('last_modified', int),
+                ('n_rows', int),
+                ('ra_min', float),
+                ('ra_max', float),
+                ('decl_min', float),
+                ('decl_max', float)]
+
+# Define the dtype of the sampled rows
+SAMPLE_DTYPE = [*EXP_HEADER.items(), ('key', float)]
+
+
+# %% CLASS DEFINITIONS
+# Define class that holds the combined sketches of a selection of exposures
+class Sketch(object):
+    """
+    Holds the combined sketches of a selection of exposures in a
+    micro-lensing database, which provide approximate statistics of all rows
+    in these exposures.
+
+    Sketches can be combined with :meth:`~merge`, e.g., to obtain the
+    statistics of several databases at once.
+
+    The sample holds every row whose random key does not exceed `threshold`,
+    which makes it a uniform sample of all rows. If `threshold` is infinite,
+    it holds every row that has a key.
+
+    """
+
+    def __init__(self, n_expnums, n_rows, registers, histograms, sample,
+                 threshold=np.inf):
+        # Save provided sketches
+        self.n_expnums = n_expnums
+        self.n_rows = n_rows
+        self._registers = registers
+        self._histograms = histograms
+        self._sample = sample
+        self._threshold = threshold
+
+    def __repr__(self):
+        return(f"{self.__class__.__name__}(n_expnums={self.n_expnums!r}, "
+               f"n_rows={self.n_rows!r})")
+
+    # The estimated number of distinct objids
+    @property
+    def n_objids(self):
+        return(int(round(estimate_cardinality(self._registers))))
+
+    # The uniformly sampled rows
+    @property
+    def sample(self):
+        sample = np.sort(self._sample, order='key')
+        return(pd.DataFrame({name: sample[name] for name in EXP_HEADER}))
+
+    # This function returns the histogram of a column
+    def histogram(self, name):
+        """
+        Returns the histogram of the provided column `name`.
+
+        Returns
+        -------
+        edges : :obj:`~numpy.ndarray` object
+            The edges of all bins.
+        counts : :obj:`~numpy.ndarray` object
+            The number of rows in every bin, where the first and last counts
+            are the number of rows below and above all bins.
+
+        """
+
+        return(HISTOGRAM_EDGES[name], self._histograms[name])
+
+    # This function returns the approximate quantiles of a column
+    def quantiles(self, name, q):
+        """
+        Returns the approximate quantiles `q` of the provided column `name`,
+        which are interpolated from its histogram. Quantiles that lie outside
+        of all bins are given as the nearest edge.
+
+        """
+
+        # Obtain the histogram of this column
+        edges, counts = self.histogram(name)
+
+        # If there are no values, all quantiles are unknown
+        q = np.asarray(q, dtype=float)
+        if not counts.sum():
+            return(np.full(q.shape, np.nan))
+
+        # Interpolate the quantiles from the cumulative distribution
+        cdf = np.cumsum(counts[1:-1])+counts[0]
+        cdf = np.r_[counts[0], cdf]/counts.sum()
+        return(np.interp(q, cdf, edges))
+
+    # This function combines this sketch with another one
+    def merge(self, other, sample_size=None):
+        """
+        Returns the sketch of all exposures in this sketch and the provided
+        `other` sketch, which must not contain the same exposures.
+
+        Optional
+        --------
+        sample_size : int or None. Default: None
+            The maximum number of sampled rows. If *None*, the largest sample
+            of both sketches is used.
+
+        """
+
+        # Determine the sample size
+        if sample_size is None:
+            sample_size = max(len(self._sample), len(other._sample))
+
+        # Combine both samples, solely keeping the rows below both thresholds
+        threshold = min(self._threshold, other._threshold)
+        sample = np.concatenate([self._sample, other._sample])
+        sample = np.sort(sample[sample['key'] <= threshold], order='key')
+        if(len(sample) > sample_size):
+            threshold = sample['key'][sample_size-1] if sample_size else -1
+            sample = sample[:sample_size]
+
+        # Combine both sketches
+        return(Sketch(
+            self.n_expnums+other.n_expnums,
+            self.n_rows+other.n_rows,
+            np.maximum(self._registers, other._registers),
+            {name: self._histograms[name]+other._histograms[name]
+             for name in HISTOGRAM_EDGES},
+            sample, threshold))
+
+
+# %% FUNCTION DEFINITIONS
+# This function returns the sketch of a selection of exposures
+def get_sketch(exp_dir=None, expnums=None, *, filters=None, hjd_range=None,
+               region=None, sample_size=1000):
+    """
+    Accesses an existing micro-lensing database in the provided `exp_dir` and
+    returns the combined sketch of the exposures selected by all provided
+    arguments, without reading the database itself.
+
+    The sketch of every exposure is computed by the update that adds it, and
+    consists of a HyperLogLog sketch of its distinct objids, histograms of
+    its 'mag' and 'magerr' and a uniform sample of its rows.
+
+    Optional
+    --------
+    exp_dir : str or None. Default: None
+        The relative or absolute path to the directory that contains an
+        existing micro-lensing database.
+        If *None*, the current working directory is used.
+    expnums, filters, hjd_range : optional
+        Select exposures as in :func:`~mldatabase.get_row_slices`.
+    region : tuple of float or None. Default: None
+        Select solely the exposures whose 'ra' and 'decl' bounds overlap with
+        this (`ra_min`, `ra_max`, `decl_min`, `decl_max`) region. All rows of
+        these exposures are used, including those outside of the region.
+    sample_size : int. Default: 1000
+        The maximum number of sampled rows. As every exposure stores solely
+        its 16 sampled rows, the sample holds fewer rows if the selected
+        exposures are few or differ much in size.
+
+    Returns
+    -------
+    sketch : :obj:`~Sketch` object
+        The combined sketch of all selected exposures.
+
+    """
+
+    # Obtain access to the database
+    with mld_main.Database(exp_dir).access() as mld,\
+            h5py.File(path.join(mld, MASTER_FILE), 'r') as m_file:
+        # Select all exposures that are in the database
+        records = m_file['expnums'][()]
+        mask = records['row_start'] >= 0
+        mask &= mld_main.select_exposures(records, expnums, filters,
+                                          hjd_range)
+
+        # Read their combined sketch
+        return(read_sketch(m_file, records[mask], region, sample_size))
+
+
+# This function reads the combined sketch of exposures from the master file
+def read_sketch(m_file, records, region=None, sample_size=1000):
+    """
+    Reads the combined sketch of the exposures with the provided `records`
+    in the 'expnums' dataset of the opened master file `m_file`, solely using
+    exposures whose sketches are up-to-date.
+
+    """
+
+    # Create an empty sketch
+    sketch = Sketch(0, 0, np.zeros(2**HLL_PRECISION, dtype=np.uint8),
+                    {name: np.zeros(len(edges)+1, dtype=int)
+                     for name, edges in HISTOGRAM_EDGES.items()},
+                    np.empty(0, dtype=SAMPLE_DTYPE))
+
+    # If there are no sketches, return the empty sketch
+    if 'sketches' not in m_file:
+        return(sketch)
+    group = m_file['sketches']
+
+    # Determine the sketches of all provided exposures that are up-to-date
+    exposures = group['exposures'][()]
+    index, valid = match_sketches(exposures, records)
+    mask = np.zeros(exposures.shape, dtype=bool)
+    mask[index[valid]] = True
+
+    # Solely use the exposures that overlap with the region
+    if region is not None:
+        ra_min, ra_max, decl_min, decl_max = region
+        mask &= (exposures['ra_max'] >= ra_min)
+        mask &= (exposures['ra_min'] <= ra_max)
+        mask &= (exposures['decl_max'] >= decl_min)
+        mask &= (exposures['decl_min'] <= decl_max)
+    index = np.flatnonzero(mask)
+    if not index.size:
+        return(sketch)
+
+    # Combine the registers and histograms block by block
+    sketch.n_expnums = index.size
+    sketch.n_rows = int(exposures['n_rows'][index].sum())
+    block_size = 4096
+    for start in range(0, len(exposures), block_size):
+        block = mask[start:start+block_size]
+        if not block.any():
+            continue
+        stop = start+block.size
+        sketch._registers = np.maximum(sketch._registers, np.max(
+            group['hll'][start:stop][block], axis=0))
+        for name in HISTOGRAM_EDGES:
+            sketch._histograms[name] += group[name][start:stop][block].sum(
+                axis=0, dtype=int)
+
+    # Determine the key below which all sampled rows are kept
+    # As every exposure solely stores the SAMPLE_SIZE rows with the smallest
+    # keys, it cannot exceed the largest stored key of an exposure that has
+    # more rows, as rows of it with smaller keys would be missing otherwise
+    keys = group['sample']['key'][index]
+    full = np.isfinite(keys).all(axis=1)
+    threshold = keys[full].max(axis=1).min() if full.any() else np.inf
+
+    # Use the keys of at most sample_size rows
+    valid = np.sort(keys[np.isfinite(keys) & (keys <= threshold)])
+    if(valid.size > sample_size):
+        threshold = valid[sample_size-1] if sample_size else -1
+    sketch._threshold = threshold
+
+    # Read the sampled rows of all exposures that have such keys
+    if(sample_size and valid.size):
+        index = index[keys.min(axis=1) <= threshold]
+        sample = group['sample'][index.tolist()].ravel()
+        sample = np.sort(sample[sample['key'] <= threshold], order='key')
+        sketch._sample = sample[:sample_size]
+
+    # Return the sketch
+    return(sketch)
+
+
+# This function computes the sketches of all exposures that require them
+def update_sketches(m_file, master_exp_file, progress=True):
+    """
+    Computes the sketches of all exposures in the opened master file
+    `m_file` whose sketch is missing or outdated, from their rows in the
+    provided `master_exp_file`.
+
+    Returns
+    -------
+    n_sketched : int
+        The number of exposures that were sketched.
+
+    """
+
+    # Obtain all exposures that are in the database
+    records = m_file['expnums'][()]
+    records = records[records['row_start'] >= 0]
+
+    # Obtain all sketches, creating them if they do not exist
+    group = require_sketches(m_file)
+    exposures = group['exposures'][()]
+
+    # Determine which exposures have no up-to-date sketch
+    index, valid = match_sketches(exposures, records)
+    records = records[~valid]
+    if not records.size:
+        return(0)
+
+    # Sketch these exposures in the order of their rows
+    records = np.sort(records, order='row_start')
+    with h5py.File(master_exp_file, 'r') as file:
+        dsets = {name: file[VAEX_COLUMN.format(name)] for name in EXP_HEADER}
+        sketches = [compute_sketch(dsets, record) for record in tqdm(
+            records, desc="Sketching exposures", dynamic_ncols=True,
+            disable=not progress)]
+
+    # Determine which exposures already have an outdated sketch
+    index, _ = match_sketches(exposures, records)
+    exists = index >= 0
+    n_exposures = len(exposures)
+
+    # Replace their sketches and add those of all other exposures
+    for name in ('exposures', 'hll', *HISTOGRAM_EDGES, 'sample'):
+        dset = group[name]
+        values = np.array([sketch[name] for sketch in sketches])
+        for i, value in zip(index[exists].tolist(), values[exists]):
+            dset[i] = value
+        dset.resize(n_exposures+np.sum(~exists), axis=0)
+        dset[n_exposures:] = values[~exists]
+
+    # Return the number of exposures that were sketched
+    return(len(sketches))
+
+
+# This function finds the sketches of exposures
+def match_sketches(exposures, records):
+    """
+    Finds the sketches in `exposures` of the exposures with the provided
+    `records` in the 'expnums' dataset.
+
+    Returns
+    -------
+    index : :obj:`~numpy.ndarray` object
+        The index of the sketch of every exposure, or -1 if it has none.
+    valid : :obj:`~numpy.ndarray` object
+        Whether the sketch of every exposure is up-to-date.
+
+    """
+
+    # If there are no sketches, no exposure has one
+    if not exposures.size:
+        return(np.full(records.shape, -1), np.zeros(records.shape, bool))
+
+    # Find the sketch with the same expnum of every exposure
+    sorter = np.argsort(exposures['expnum'])
+    index = sorter[np.searchsorted(exposures['expnum'], records['expnum'],
+                                   sorter=sorter).clip(max=len(sorter)-1)]
+    found = (exposures['expnum'][index] == records['expnum'])
+    index[~found] = -1
+
+    # A sketch is up-to-date if it was made from the current exposure files
+    valid = found & (exposures['last_modified'][index] ==
+                     records['last_modified'])
+    return(index, valid)
+
+
+# This function obtains the sketches group in the master file
+def require_sketches(m_file):
+    # Remove the sketches if they were made with different parameters
+    group = m_file.get('sketches')
+    if group is not None and (
+            group.attrs.get('hll_precision') != HLL_PRECISION or
+            group['sample'].shape[1:] != (SAMPLE_SIZE,) or
+            any(group[name].shape[1:] != (len(edges)+1,)
+                for name, edges in HISTOGRAM_EDGES.items())):
+        del m_file['sketches']
+        group = None
+
+    # Create the sketches if they do not exist
+    if group is None:
+        group = m_file.create_group('sketches')
+        group.attrs['hll_precision'] = HLL_PRECISION
+        group.create_dataset('exposures', shape=(0,), dtype=SKETCH_DTYPE,
+                             maxshape=(None,))
+        group.create_dataset('hll', shape=(0, 2**HLL_PRECISION),
+                             dtype=np.uint8, maxshape=(None, None),
+                             chunks=(64, 2**HLL_PRECISION),
+                             compression='gzip')
+        for name, edges in HISTOGRAM_EDGES.items():
+            group.create_dataset(name, shape=(0, len(edges)+1),
+                                 dtype=np.uint32, maxshape=(None, None),
+                                 chunks=(64, len(edges)+1),
+                                 compression='gzip')
+            group.create_dataset(f'{name}_edges', data=edges)
+        group.create_dataset('sample', shape=(0, SAMPLE_SIZE),
+                             dtype=SAMPLE_DTYPE, maxshape=(None, None),
+                             chunks=(64, SAMPLE_SIZE))
+
+    # Return the group
+    return(group)
+
+
+# This function computes the sketch of a single exposure
+def compute_sketch(dsets, record):
+    """
+    Computes the sketch of the exposure with the provided `record` in the
+    'expnums' dataset, from its rows in the provided column datasets
+    `dsets`.
+
+    """
+
+    # Read the columns that are sketched
+    rows = slice(record['row_start'], record['row_stop'])
+    data = {name: dsets[name][rows]
+            for name in ('objid', 'ra', 'decl', *HISTOGRAM_EDGES)}
+    n_rows = len(data['objid'])
+
+    # Determine the bounds of the exposure
+    if n_rows:
+        bounds = (np.nanmin(data['ra']), np.nanmax(data['ra']),
+                  np.nanmin(data['decl']), np.nanmax(data['decl']))
+    else:
+        bounds = (np.nan,)*4
+
+    # Sample the rows with the smallest random keys, which can be merged
+    rng = np.random.default_rng(int(record['expnum']))
+    keys = rng.random(n_rows)
+    index = np.sort(np.argsort(keys)[:SAMPLE_SIZE])
+    sample = np.zeros(SAMPLE_SIZE, dtype=SAMPLE_DTYPE)
+    sample['key'] = np.inf
+    sample['key'][:index.size] = keys[index]
+    if index.size:
+        for name in EXP_HEADER:
+            sample[name][:index.size] = dsets[name][
+                (record['row_start']+index).tolist()]
+
+    # Return the sketch
+    return({
+        'exposures': np.array([(record['expnum'], record['last_modified'],
+                                n_rows, *bounds)], dtype=SKETCH_DTYPE)[0],
+        'hll': get_registers(data['objid']),
+        **{name: get_histogram(data[name], edges)
+           for name, edges in HISTOGRAM_EDGES.items()},
+        'sample': sample})
+
+
+# This function computes the histogram of values with overflow bins
+def get_histogram(values, edges):
+    values = values[np.isfinite(values)]
+    index = np.searchsorted(edges, values, side='right')
+    return(np.bincount(index, minlength=len(edges)+1).astype(np.uint32))
+
+
+# This function hashes objids to 64-bit integers
+def hash_objids(objids):
+    # Use the SplitMix64 finalizer, whose multiplications wrap around
+    x = np.asarray(objids).astype(np.uint64)+np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30)))*np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27)))*np.uint64(0x94D049BB133111EB)
+    return(x ^ (x >> np.uint64(31)))
+
+
+# This function computes the HyperLogLog registers of objids
+def get_registers(objids, precision=HLL_PRECISION):
+    # Hash all distinct objids
+    hashes = hash_objids(np.unique(objids))
+
+    # Split every hash into a register index and the remaining bits
+    index = (hashes >> np.uint64(64-precision)).astype(np.intp)
+    rest = hashes << np.uint64(precision)
+
+    # Determine the bit length of the remaining bits exactly, per 32 bits
+    high = (rest >> np.uint64(32)).astype(float)
+    low = (rest & np.uint64(0xFFFFFFFF)).astype(float)
+    bit_length = np.where(high > 0, 32+np.frexp(high)[1], np.frexp(low)[1])
+
+    # The rank is the position of the first set bit
+    rank = np.minimum(65-bit_length, 65-precision).astype(np.uint8)
+
+    # Keep the maximum rank of every register
+    registers = np.zeros(2**precision, dtype=np.uint8)
+    np.maximum.at(registers, index, rank)
+    return(registers)
+
+
+# This function estimates the number of distinct values from registers
+def estimate_cardinality(registers):
+    # Compute the raw HyperLogLog estimate
+    m = registers.size
+    alpha = 0.7213/(1+1.079/m)
+    estimate = alpha*m*m/np.ldexp(1.0, -registers.astype(int)).sum()
+
+    # Use linear counting for small cardinalities
+    n_zeros = np.count_nonzero(registers == 0)
+    if(estimate <= 2.5*m and n_zeros):
+        estimate = m*np.log(m/n_zeros)
+
+    # Return the estimate
+    return(estimate)
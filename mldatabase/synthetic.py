@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+"""
+Synthetic
+=========
+Provides a generator of synthetic DECam exposure CSV-files, which can be used
+for testing and benchmarking micro-lensing databases.
+
+"""
+
+
+# %% IMPORTS
+# Built-in imports
+import os
+from os import path
+import time
+
+# Package imports
+import numpy as np
+
+# MLDatabase imports
+from mldatabase._globals import EXP_HEADER, REQ_FILES
+
+# All declaration
+__all__ = ['make_exposures', 'mark_outdated']
+
+
+# %% GLOBALS
+# Formats used for writing every column of the exposure files
+EXP_FORMATS = {
+    'objid': '%d',
+    'hjd': '%.6f',
+    'ra': '%.7f',
+    'decl': '%.7f',
+    'mag': '%.4f',
+    'magerr': '%.4f',
+    'type': '%.0f',
+    'contam': '%.3f',
+    'chp': '%.0f',
+    'xp': '%.3f',
+    'yp': '%.3f',
+    'bfloor': '%.4f',
+    'moffset': '%.4f',
+    'fitsky': '%.3f',
+    'errlim': '%.4f',
+    'expnum': '%d'}
+
+# DECam filter bands
+FILTERS = ['g', 'r', 'i', 'z', 'Y']
+
+
+# %% FUNCTION DEFINITIONS
+# This function writes a set of synthetic exposure files
+def make_exposures(exp_dir, n_expnums, n_rows, overlap=0.9, outdated=0,
+                   start=100001, seed=None):
+    """
+    Writes `n_expnums` synthetic DECam exposures, each consisting of an
+    ``Exp<expnum>.csv`` and ``Exp<expnum>_xtr.csv`` file, to `exp_dir`.
+
+    The files follow the formats described by the `EXP_HEADER` and
+    `XTR_HEADER` globals. The required flat exposure files are written as well
+    if they do not exist yet.
+
+    Parameters
+    ----------
+    exp_dir : str
+        The relative or absolute path to the directory the exposure files must
+        be written to. It is created if it does not exist.
+    n_expnums : int
+        The number of exposures to write.
+    n_rows : int
+        The number of rows (detections) in every exposure.
+
+    Optional
+    --------
+    overlap : float. Default: 0.9
+        The fraction of detections in every exposure that belong to a shared
+        pool of objects, which are observed in many exposures. All other
+        detections belong to objects that are only observed once.
+    outdated : float. Default: 0
+        The fraction of the written exposures that is marked as outdated with
+        :func:`~mark_outdated` after writing them.
+    start : int. Default: 100001
+        The expnum of the first exposure that is written.
+        As with real DECam exposures, all expnums should have the same number
+        of digits.
+    seed : int or None. Default: None
+        The seed used for the random number generator.
+
+    Returns
+    -------
+    expnums : :obj:`~numpy.ndarray` object
+        Array containing the expnums of all exposures that were written.
+
+    """
+
+    # Make sure that exp_dir exists
+    exp_dir = path.abspath(exp_dir)
+    os.makedirs(exp_dir, exist_ok=True)
+
+    # Initialize the random number generator
+    rng = np.random.RandomState(seed)
+
+    # Create the pool of persistent objects with fixed positions and mags
+    n_pool = max(1, int(n_rows*overlap))*2
+    pool_ra = rng.uniform(80.0, 82.2, n_pool)
+    pool_decl = rng.uniform(-70.1, -68.9, n_pool)
+    pool_mag = 24-rng.exponential(2.5, n_pool).clip(0, 10)
+
+    # Determine the expnums that must be written
+    expnums = np.arange(start, start+n_expnums)
+
+    # Write the required flat exposure files if they do not exist yet
+    if not path.exists(path.join(exp_dir, REQ_FILES[0])):
+        write_exposure(exp_dir, 0, n_rows, overlap, pool_ra, pool_decl,
+                       pool_mag, rng)
+
+    # Write all exposures
+    for expnum in expnums:
+        write_exposure(exp_dir, expnum, n_rows, overlap, pool_ra, pool_decl,
+                       pool_mag, rng)
+
+    # Mark the requested fraction of exposures as outdated
+    if outdated:
+        mark_outdated(exp_dir, expnums, outdated, seed)
+
+    # Return expnums
+    return(expnums)
+
+
+# This function writes a single synthetic exposure
+def write_exposure(exp_dir, expnum, n_rows, overlap, pool_ra, pool_decl,
+                   pool_mag, rng):
+    # Determine how many detections belong to pool objects
+    n_pool_rows = int(n_rows*overlap)
+    n_single_rows = n_rows-n_pool_rows
+
+    # Select the pool objects observed in this exposure
+    idx = np.sort(rng.choice(len(pool_ra), n_pool_rows, replace=False))
+
+    # Determine the objids, with unique ones for objects observed once
+    objid = np.concatenate([
+        idx+1, np.arange(n_single_rows)+len(pool_ra)+expnum*n_rows+1])
+
+    # Determine the epoch of this exposure
+    hjd = 2457000+(expnum % 100000)*0.01+rng.uniform(0, 0.001)
+
+    # Determine the positions and magnitudes of all detections
+    ra = np.concatenate([pool_ra[idx],
+                         rng.uniform(80.0, 82.2, n_single_rows)])
+    decl = np.concatenate([pool_decl[idx],
+                           rng.uniform(-70.1, -68.9, n_single_rows)])
+    ra += rng.normal(0, 0.1/3600, n_rows)
+    decl += rng.normal(0, 0.1/3600, n_rows)
+    mag = np.concatenate([pool_mag[idx],
+                          24-rng.exponential(2.5, n_single_rows).clip(0, 10)])
+    magerr = 0.005+10**(0.4*(mag-26))
+    mag += rng.normal(0, 1, n_rows)*magerr
+
+    # Create all columns of this exposure
+    columns = {
+        'objid': objid,
+        'hjd': np.full(n_rows, hjd),
+        'ra': ra,
+        'decl': decl,
+        'mag': mag,
+        'magerr': magerr,
+        'type': rng.choice([1, 1, 1, 3, 7], n_rows),
+        'contam': np.where(rng.uniform(size=n_rows) < 0.9, 0,
+                           rng.uniform(size=n_rows)),
+        'chp': rng.randint(1, 63, n_rows),
+        'xp': rng.uniform(0, 2048, n_rows),
+        'yp': rng.uniform(0, 4096, n_rows),
+        'bfloor': rng.uniform(0.001, 0.01, n_rows),
+        'moffset': rng.normal(0, 0.02, n_rows),
+        'fitsky': rng.normal(1000, 30, n_rows),
+        'errlim': rng.uniform(0.001, 0.005, n_rows),
+        'expnum': np.full(n_rows, expnum)}
+
+    # Write the exposure file
+    data = np.column_stack([columns[key] for key in EXP_HEADER])
+    np.savetxt(path.join(exp_dir, f"Exp{expnum}.csv"), data, delimiter=', ',
+               fmt=[EXP_FORMATS[key] for key in EXP_HEADER])
+
+    # Write the xtr file
+    skypc = np.sort(rng.normal(1000, 30, 4))
+    xtr_data = [f"{expnum}", f"{hjd:.6f}", *map("{:.3f}".format, skypc),
+                rng.choice(FILTERS), f"c4d_{expnum:08d}_ooi.fits.fz"]
+    with open(path.join(exp_dir, f"Exp{expnum}_xtr.csv"), 'w') as file:
+        file.write(", ".join(xtr_data)+"\n")
+
+
+# This function marks a fraction of exposures as outdated
+def mark_outdated(exp_dir, expnums, fraction, seed=None):
+    """
+    Marks the given `fraction` of the provided `expnums` in `exp_dir` as
+    outdated, by moving their last-modified times into the future.
+
+    Parameters
+    ----------
+    exp_dir : str
+        The relative or absolute path to the directory that contains the
+        exposure files.
+    expnums : list of int
+        The expnums of the exposures that can be marked as outdated.
+    fraction : float
+        The fraction of `expnums` that must be marked as outdated.
+
+    Optional
+    --------
+    seed : int or None. Default: None
+        The seed used for the random number generator.
+
+    Returns
+    -------
+    outdated : :obj:`~numpy.ndarray` object
+        Array containing the expnums that were marked as outdated.
+
+    """
+
+    # Select the exposures that must be marked as outdated
+    rng = np.random.RandomState(seed)
+    n_outdated = int(round(len(expnums)*fraction))
+    outdated = np.sort(rng.choice(expnums, n_outdated, replace=False))
+
+    # Move the last-modified times of their exposure files into the future
+    mtime = int(time.time())+2
+    for expnum in outdated:
+        os.utime(path.join(path.abspath(exp_dir), f"Exp{expnum}.csv"),
+                 (mtime, mtime))
+
+    # Return outdated
+    return(outdated)
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+# %% IMPORTS
+# Package imports
+import pytest
+
+# MLDatabase imports
+from mldatabase import Database
+from mldatabase.synthetic import make_exposures
+
+
+# %% PYTEST FIXTURES
+# Fixture providing a directory with a small initialized database
+@pytest.fixture
+def exp_dir(tmp_path):
+    # Write six exposures and create a database of them
+    exp_dir = str(tmp_path)
+    make_exposures(exp_dir, 6, 500, seed=0)
+    Database(exp_dir).init()
+
+    # Return exp_dir
+    return(exp_dir)
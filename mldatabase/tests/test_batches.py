@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+# %% IMPORTS
+# Built-in imports
+from os import path
+import time
+
+# Package imports
+import numpy as np
+
+# MLDatabase imports
+from mldatabase import Database, __main__ as mld_main, _writer
+from mldatabase import get_update_profiles
+from mldatabase.__main__ import (
+    MERGE_BATCH_SIZE, estimate_nbytes, get_queue_size, iter_merge_batches)
+from mldatabase._globals import EXP_HEADER, MASTER_EXP_FILE
+from mldatabase._writer import get_working_set, write_columns
+from mldatabase.synthetic import make_exposures
+
+
+# %% HELPER FUNCTIONS
+# This function writes an exposure file with the provided number of rows
+def make_exp_file(filename, n_rows):
+    write_columns(filename, {name: [np.zeros(n_rows, dtype)]
+                             for name, dtype in EXP_HEADER.items()})
+    return(filename)
+
+
+# %% PYTEST CLASSES AND FUNCTIONS
+# Pytest class for dividing temporary files up into merge batches
+class Test_iter_merge_batches(object):
+    # Test if batches of a fixed size are used without a memory budget
+    def test_no_budget(self):
+        files = [f"exp{i}.hdf5" for i in range(2*MERGE_BATCH_SIZE+5)]
+        batches = list(iter_merge_batches(iter(files)))
+        assert ([len(batch) for batch in batches] ==
+                [MERGE_BATCH_SIZE, MERGE_BATCH_SIZE, 5])
+        assert (sum(batches, []) == files)
+
+    # Test if batches stay within the budget, counting only the chunks of
+    # the master exposure file
+    def test_budget(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(_writer, 'CHUNK_SIZE', 100)
+        files = [make_exp_file(str(tmp_path/f"exp{i}.hdf5"), 1000)
+                 for i in range(7)]
+        master_exp_file = make_exp_file(str(tmp_path/"master.hdf5"), 10**5)
+        working_set = get_working_set(EXP_HEADER.values())
+        nbytes = estimate_nbytes(files[0])
+        assert (estimate_nbytes(master_exp_file) > 10*nbytes)
+
+        # Check that three files fit within every batch
+        max_memory = working_set+3*nbytes
+        batches = list(iter_merge_batches(files, max_memory, master_exp_file))
+        assert ([len(batch) for batch in batches] == [3, 3, 1])
+
+    # Test if a file that exceeds the budget on its own is merged on its own
+    def test_oversized(self, tmp_path, capsys):
+        files = [make_exp_file(str(tmp_path/f"exp{i}.hdf5"), n_rows)
+                 for i, n_rows in enumerate([100, 5000, 100])]
+        max_memory = 2*estimate_nbytes(files[0])
+        batches = list(iter_merge_batches(files, max_memory))
+        assert (batches == [[files[0]], [files[1]], [files[2]]])
+        assert ("WARNING" in capsys.readouterr().out)
+
+    # Test if incomplete batches are provided once no file is available
+    def test_delay(self):
+        files = ['a', None, 'b', 'c', None, None, 'd', None]
+        assert (list(iter_merge_batches(iter(files))) == [['a', 'b', 'c',
+                                                           'd']])
+        assert (list(iter_merge_batches(iter(files), max_delay=0)) ==
+                [['a'], ['b', 'c'], ['d']])
+        assert (list(iter_merge_batches(iter(files), max_delay=60)) ==
+                [['a', 'b', 'c', 'd']])
+
+
+# Pytest class for the size of the queue of processed exposures
+class Test_get_queue_size(object):
+    # Test if the queue holds as many exposures as fit within the budget
+    def test_budget(self, tmp_path):
+        exp_dict = {}
+        for expnum in range(4):
+            filename = str(tmp_path/f"exp{expnum}.csv")
+            with open(filename, 'wb') as file:
+                file.write(bytes(1000))
+            exp_dict[expnum] = (filename, filename)
+        assert (get_queue_size(exp_dict) == MERGE_BATCH_SIZE)
+        assert (get_queue_size({}, 10**6) == MERGE_BATCH_SIZE)
+        assert (get_queue_size(exp_dict, 5500) == 5)
+        assert (get_queue_size(exp_dict, 10) == 1)
+
+
+# Pytest class for updating a database within a memory budget
+class Test_update(object):
+    # Test if new exposures are merged together when the database itself
+    # exceeds the budget
+    def test_large_database(self, exp_dir, monkeypatch):
+        monkeypatch.setattr(_writer, 'CHUNK_SIZE', 100)
+        db = Database(exp_dir)
+        master_exp_file = path.join(db.mld, MASTER_EXP_FILE)
+        max_memory = (get_working_set(EXP_HEADER.values()) +
+                      estimate_nbytes(master_exp_file))
+
+        # Add three exposures to the database
+        make_exposures(exp_dir, 3, 500, start=100007, seed=1)
+        db.update(max_memory=max_memory, profile=True)
+
+        # Check that they were merged at once
+        stages = get_update_profiles(exp_dir)[-1]['stages']
+        assert (stages['merge']['calls'] == 1)
+        assert (db.objid_counts()[1].sum() == 9*500)
+
+    # Test if batches are merged while exposures are still being processed
+    def test_pipeline(self, exp_dir, monkeypatch):
+        # Record when every exposure is processed and every batch is merged
+        events = []
+        export_exp_files = mld_main.export_exp_files
+        merge_temp_files = mld_main.merge_temp_files
+
+        def export(*args):
+            time.sleep(0.2)
+            result = export_exp_files(*args)
+            events.append('process')
+            return(result)
+
+        def merge(temp_files_list, *args):
+            events.append(len(temp_files_list))
+            return(merge_temp_files(temp_files_list, *args))
+
+        monkeypatch.setattr(mld_main, 'export_exp_files', export)
+        monkeypatch.setattr(mld_main, 'merge_temp_files', merge)
+        monkeypatch.setattr(mld_main, 'MERGE_BATCH_DELAY', 0)
+        monkeypatch.setattr(mld_main, 'MERGE_POLL_INTERVAL', 0.01)
+
+        # Add five exposures to the database
+        make_exposures(exp_dir, 5, 500, start=100007, seed=1)
+        db = Database(exp_dir)
+        db.update()
+
+        # Check that merging started before the last exposure was processed
+        merges = [i for i, event in enumerate(events) if event != 'process']
+        processes = [i for i, event in enumerate(events)
+                     if event == 'process']
+        assert (len(merges) > 1)
+        assert (sum(events[i] for i in merges) == 5)
+        assert (merges[0] < processes[-1])
+        assert (db.objid_counts()[1].sum() == 11*500)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+# %% IMPORTS
+# Built-in imports
+from os import path
+
+# Package imports
+import h5py
+import numpy as np
+import pytest
+
+# MLDatabase imports
+from mldatabase import Database, blooms, get_light_curves, has_objids
+from mldatabase._globals import MASTER_EXP_FILE, MASTER_FILE, VAEX_COLUMN
+from mldatabase.synthetic import make_exposures, mark_outdated
+
+
+# %% HELPER FUNCTIONS
+# This function reads the objid of every row in a database
+def read_objids(exp_dir):
+    with h5py.File(path.join(Database(exp_dir).mld, MASTER_EXP_FILE),
+                   'r') as file:
+        return(file[VAEX_COLUMN.format('objid')][()])
+
+
+# This function checks the Bloom filters of a database
+def check_blooms(exp_dir):
+    # Read the objids of all rows and the filters
+    objids = read_objids(exp_dir)
+    unique = np.unique(objids)
+    n_blocks = -(-len(objids)//blooms.BLOCK_SIZE)
+    with h5py.File(path.join(Database(exp_dir).mld, MASTER_FILE),
+                   'r') as m_file:
+        # Check that all blocks have an up-to-date filter
+        group = m_file['blooms']
+        assert (group.attrs['n_rows'] == len(objids))
+        assert (blooms.get_valid_blocks(group, len(objids)) == n_blocks)
+        for block in range(n_blocks):
+            assert np.array_equal(group['bits'][block], blooms.compute_bloom(
+                objids[block*blooms.BLOCK_SIZE:
+                       (block+1)*blooms.BLOCK_SIZE]))
+
+        # Check that no filter misses an objid of its block, with both the
+        # full scan and the lookups of single buckets
+        for index in [np.arange(len(unique)), np.arange(0, len(unique), 97)]:
+            maybe = blooms.query_blooms(m_file, unique[index], len(objids))
+            assert (maybe.shape == (n_blocks, len(index)))
+            for block in range(n_blocks):
+                rows = objids[block*blooms.BLOCK_SIZE:
+                              (block+1)*blooms.BLOCK_SIZE]
+                assert maybe[block, np.isin(unique[index], rows)].all()
+
+
+# %% PYTEST FIXTURES
+# Fixture that makes every filter cover a small number of rows
+@pytest.fixture(autouse=True)
+def block_size(monkeypatch):
+    monkeypatch.setattr(blooms, 'BLOCK_SIZE', 700)
+    monkeypatch.setattr(blooms, 'CHUNK_HEIGHT', 2)
+
+
+# %% PYTEST CLASSES AND FUNCTIONS
+# Pytest class for the Bloom filters of a database
+class Test_blooms(object):
+    # Test if the filters have no false negatives
+    def test_filters(self, exp_dir):
+        Database(exp_dir).update(0)
+        check_blooms(exp_dir)
+
+    # Test if the filters are invalidated when a database is updated
+    def test_invalidation(self, exp_dir):
+        # Check after merging new exposures
+        db = Database(exp_dir)
+        db.update(0)
+        make_exposures(exp_dir, 2, 500, start=100007, seed=1)
+        db.update()
+        check_blooms(exp_dir)
+
+        # Check after removing outdated exposures
+        mark_outdated(exp_dir, [100001, 100004], 1)
+        db.update()
+        check_blooms(exp_dir)
+
+    # Test if the objids in a database are found
+    def test_has_objids(self, exp_dir):
+        objids = np.unique(read_objids(exp_dir))
+        missing = np.arange(objids[-1]+1, objids[-1]+1001)
+        assert has_objids(objids, exp_dir).all()
+        assert not has_objids(missing, exp_dir).any()
+        assert has_objids(int(objids[0]), exp_dir) is True
+
+    # Test if light curves match the rows of their objids
+    def test_light_curves(self, exp_dir):
+        objids = read_objids(exp_dir)
+        selected = np.unique(objids)[::50]
+        rows = get_light_curves(selected, exp_dir, columns=['objid', 'hjd'])
+        assert (len(rows) == np.isin(objids, selected).sum())
+        assert np.array_equal(np.unique(rows['objid']), selected)
+        assert (np.diff(rows['objid']) >= 0).all()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+# %% IMPORTS
+# Built-in imports
+import os
+import threading
+
+# Package imports
+import pytest
+
+# MLDatabase imports
+from mldatabase import _cache
+from mldatabase._cache import cached_file, clear_cache
+
+# Skip this module if file locking is not available
+pytestmark = pytest.mark.skipif(_cache.fcntl is None,
+                                reason="Requires file locking")
+
+
+# %% HELPER FUNCTIONS
+# This function writes a file of the provided size
+def make_file(filename, size):
+    with open(filename, 'wb') as file:
+        file.write(os.urandom(size))
+    return(str(filename))
+
+
+# This function returns the names of all entries and lock files in a cache
+def list_cache(cache_dir):
+    return(sorted(name for name in os.listdir(cache_dir)
+                  if not name.startswith('.')))
+
+
+# %% PYTEST CLASSES AND FUNCTIONS
+# Pytest class for the node-local cache of database files
+class Test_cached_file(object):
+    # Test if a file is copied once and used by every later call
+    def test_copy(self, tmp_path):
+        filename = make_file(tmp_path/"db.hdf5", 1000)
+        cache_dir = str(tmp_path/"cache")
+        with cached_file(filename, 1, cache_dir) as cache_file:
+            assert (cache_file != filename)
+            with open(cache_file, 'rb') as file, open(filename, 'rb') as orig:
+                assert (file.read() == orig.read())
+        with cached_file(filename, 1, cache_dir) as cache_file2:
+            assert (cache_file2 == cache_file)
+
+        # Check that another version of the file gets its own copy
+        with cached_file(filename, 2, cache_dir) as cache_file2:
+            assert (cache_file2 != cache_file)
+        assert (len(list_cache(cache_dir)) == 4)
+
+    # Test if evicted entries are removed with their lock files
+    def test_evict(self, tmp_path):
+        files = [make_file(tmp_path/f"db{i}.hdf5", 1000) for i in range(3)]
+        cache_dir = str(tmp_path/"cache")
+        for filename in files:
+            with cached_file(filename, 1, cache_dir, 1500) as cache_file:
+                assert (cache_file != filename)
+        names = list_cache(cache_dir)
+        assert (len(names) == 2)
+        assert (f"{names[0]}.lock" == names[1])
+
+        # Check that clearing the cache removes everything
+        clear_cache(cache_dir)
+        assert (list_cache(cache_dir) == [])
+
+    # Test if entries that are in use are never evicted
+    def test_in_use(self, tmp_path):
+        files = [make_file(tmp_path/f"db{i}.hdf5", 1000) for i in range(2)]
+        cache_dir = str(tmp_path/"cache")
+        with cached_file(files[0], 1, cache_dir, 1500) as cache_file:
+            # Check that the other file is used directly
+            with cached_file(files[1], 1, cache_dir, 1500) as cache_file2:
+                assert (cache_file2 == files[1])
+
+            # Check that the entry in use survives clearing the cache
+            clear_cache(cache_dir)
+            assert os.path.exists(cache_file)
+
+        # Check that the lock file of the other file was removed
+        assert (len(list_cache(cache_dir)) == 2)
+
+    # Test if no process waits while another one copies the file
+    def test_copying(self, tmp_path, monkeypatch):
+        filename = make_file(tmp_path/"db.hdf5", 1000)
+        cache_dir = str(tmp_path/"cache")
+
+        # Make copying wait until it is allowed to finish
+        started = threading.Event()
+        finish = threading.Event()
+        copyfile = _cache.shutil.copyfile
+
+        def wait_copyfile(*args):
+            started.set()
+            assert finish.wait(10)
+            copyfile(*args)
+
+        monkeypatch.setattr(_cache.shutil, 'copyfile', wait_copyfile)
+
+        # Start copying the file in another thread
+        results = []
+
+        def copy():
+            with cached_file(filename, 1, cache_dir) as cache_file:
+                results.append(cache_file)
+
+        thread = threading.Thread(target=copy)
+        thread.start()
+        assert started.wait(10)
+
+        # Check that the file itself is used while it is being copied
+        with cached_file(filename, 1, cache_dir) as cache_file:
+            assert (cache_file == filename)
+        finish.set()
+        thread.join()
+        assert (results[0] != filename)
+
+        # Check that the copy is used afterward
+        with cached_file(filename, 1, cache_dir) as cache_file:
+            assert (cache_file == results[0])
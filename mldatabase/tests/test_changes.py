@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+# %% IMPORTS
+# Built-in imports
+from os import path
+
+# Package imports
+import h5py
+import numpy as np
+
+# MLDatabase imports
+from mldatabase import Database
+from mldatabase._globals import MASTER_EXP_FILE, VAEX_COLUMN
+from mldatabase.synthetic import make_exposures, mark_outdated
+
+
+# %% HELPER FUNCTIONS
+# This function reads columns of a database
+def read_columns(exp_dir, columns):
+    with h5py.File(path.join(Database(exp_dir).mld, MASTER_EXP_FILE),
+                   'r') as file:
+        return({name: file[VAEX_COLUMN.format(name)][()]
+                for name in columns})
+
+
+# %% PYTEST CLASSES AND FUNCTIONS
+# Pytest class for obtaining the changes made since a database version
+class Test_changes(object):
+    # Test if added exposures are logged in a new version
+    def test_added(self, exp_dir):
+        db = Database(exp_dir)
+        version = db.version
+        assert (version > 0)
+        assert (len(db.changes(version)) == 0)
+        assert (db.changed_rows(version).empty)
+
+        # Check that an update without changes keeps the version
+        db.update()
+        assert (db.version == version)
+
+        # Add two exposures
+        make_exposures(exp_dir, 2, 500, start=100007, seed=1)
+        db.update()
+        assert (db.version == version+1)
+
+        # Check that solely their rows are reported as changed
+        changes = db.changes(version)
+        assert (sorted(changes['expnum']) == [100007, 100008])
+        assert not changes['replaced'].any()
+        data = read_columns(exp_dir, ['expnum', 'objid', 'mag'])
+        mask = data['expnum'] >= 100007
+        rows = db.changed_rows(version, ['expnum', 'mag'])
+        assert np.array_equal(rows['expnum'], data['expnum'][mask])
+        assert np.array_equal(rows['mag'], data['mag'][mask])
+        assert np.array_equal(db.changed_objids(version),
+                              np.unique(data['objid'][mask]))
+        assert (db.removed_objids(version).size == 0)
+
+    # Test if the removed rows of replaced exposures are logged
+    def test_replaced(self, exp_dir):
+        db = Database(exp_dir)
+        version = db.version
+        data = read_columns(exp_dir, ['expnum', 'objid'])
+        old_objids = np.unique(data['objid'][data['expnum'] == 100003])
+
+        # Replace an exposure by one with different objects
+        make_exposures(exp_dir, 1, 500, start=100003, seed=7)
+        mark_outdated(exp_dir, [100003], 1)
+        db.update()
+
+        # Check that it is logged as replaced
+        changes = db.changes(version)
+        assert (changes['expnum'].tolist() == [100003])
+        assert changes['replaced'].all()
+
+        # Check that the objids of its removed rows are reported
+        data = read_columns(exp_dir, ['expnum', 'objid'])
+        new_objids = np.unique(data['objid'][data['expnum'] == 100003])
+        assert (np.setdiff1d(old_objids, new_objids).size > 0)
+        assert np.array_equal(db.removed_objids(version), old_objids)
+        assert np.array_equal(db.changed_objids(version),
+                              np.union1d(old_objids, new_objids))
+        assert (db.removed_objids(db.version).size == 0)
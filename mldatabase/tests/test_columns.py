@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+# %% IMPORTS
+# Built-in imports
+from os import path
+
+# Package imports
+import h5py
+import numpy as np
+import vaex
+
+# MLDatabase imports
+from mldatabase import Database
+from mldatabase.__main__ import EXPNUMS_DTYPE, add_exposure_columns
+from mldatabase._globals import MASTER_FILE
+
+
+# %% HELPER FUNCTIONS
+# This function reads the exposure records of a database
+def read_records(exp_dir):
+    with h5py.File(path.join(Database(exp_dir).mld, MASTER_FILE),
+                   'r') as m_file:
+        return(m_file['expnums'][()])
+
+
+# %% PYTEST CLASSES AND FUNCTIONS
+# Pytest class for the exposure data that is added as virtual columns
+class Test_exposure_columns(object):
+    # Test if every row has the values of its exposure
+    def test_values(self, exp_dir):
+        records = read_records(exp_dir)
+        index = {expnum: i for i, expnum in enumerate(records['expnum'])}
+        with Database(exp_dir).open() as df:
+            expnums = df['expnum'].values
+            rows = [index[expnum] for expnum in expnums]
+            for name in ('skypc2', 'skypc90', 'filter', 'n_rows',
+                         'mag_median'):
+                # Check that it is a virtual column
+                assert name in df.virtual_columns
+
+                # Check that its values are those of the exposures
+                values = records[name][rows]
+                if(values.dtype.kind == 'S'):
+                    values = values.astype(str)
+                assert np.array_equal(df[name].values, values)
+
+            # Check that bookkeeping fields and existing columns are not added
+            assert 'row_start' not in df.get_column_names()
+            assert 'hjd' not in df.virtual_columns
+
+    # Test if rows can be selected on the values of their exposures
+    def test_selection(self, exp_dir):
+        record = read_records(exp_dir)[2]
+        with Database(exp_dir).open() as df:
+            selected = df[df['skypc2'] == record['skypc2']]
+            assert (len(selected) == record['n_rows'])
+            assert (selected['expnum'].unique() == [record['expnum']])
+
+    # Test if exposures are looked up correctly in any order
+    def test_lookup(self):
+        records = np.zeros(4, dtype=EXPNUMS_DTYPE)
+        records['expnum'] = [7, 3, 11, 5]
+        records['skypc2'] = [70, 30, 110, 50]
+        df = vaex.from_arrays(expnum=np.array([5, 11, 3, 3, 7, 5]))
+        add_exposure_columns(df, records)
+        assert np.array_equal(df['skypc2'].values, [50, 110, 30, 30, 70, 50])
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+# %% IMPORTS
+# Built-in imports
+import os
+from os import path
+import time
+
+# Package imports
+import h5py
+import numpy as np
+import pytest
+
+# MLDatabase imports
+from mldatabase import Database, __main__ as mld_main
+from mldatabase._coordination import (
+    Heartbeat, claim_exposure, expire_stale_files, get_active_claims)
+from mldatabase._globals import (
+    MASTER_EXP_FILE, REPORTS_DIR, TEMP_EXP_FILE, VAEX_COLUMN)
+from mldatabase.synthetic import make_exposures, mark_outdated
+
+
+# %% HELPER FUNCTIONS
+# This function makes a file look like it was last modified long ago
+def make_stale(filename, age=3600):
+    mtime = time.time()-age
+    os.utime(filename, (mtime, mtime))
+
+
+# This function returns the number of rows of every exposure in a database
+def count_rows(exp_dir):
+    with h5py.File(path.join(Database(exp_dir).mld, MASTER_EXP_FILE),
+                   'r') as file:
+        expnums = file[VAEX_COLUMN.format('expnum')][()]
+    return(dict(zip(*map(np.ndarray.tolist,
+                         np.unique(expnums, return_counts=True)))))
+
+
+# %% PYTEST CLASSES AND FUNCTIONS
+# Pytest class for claiming exposures
+class Test_claims(object):
+    # Test if an exposure can only be claimed once
+    def test_claim(self, tmp_path):
+        mld = str(tmp_path)
+        claim_file = claim_exposure(mld, 1, 600)
+        assert path.exists(claim_file)
+        assert claim_exposure(mld, 1, 600) is None
+        assert (claim_exposure(mld, 2, 600) != claim_file)
+        assert (sorted(get_active_claims(mld, 600)) == [1, 2])
+
+    # Test if a stale claim is expired and can be taken over
+    def test_expiry(self, tmp_path):
+        mld = str(tmp_path)
+        claim_file = claim_exposure(mld, 1, 600)
+        make_stale(claim_file)
+        assert (get_active_claims(mld, 600) == [])
+        assert (claim_exposure(mld, 1, 600) == claim_file)
+        assert (get_active_claims(mld, 600) == [1])
+
+        # Check that stale claims are removed
+        make_stale(claim_file)
+        expire_stale_files(mld, 600)
+        assert not path.exists(claim_file)
+
+    # Test if a heartbeat keeps a claim from becoming stale
+    def test_heartbeat(self, tmp_path):
+        mld = str(tmp_path)
+        claim_file = claim_exposure(mld, 1, 600)
+        make_stale(claim_file)
+        heartbeat = Heartbeat([claim_file], 0.01)
+        heartbeat.start()
+        time.sleep(0.2)
+        heartbeat.stop()
+        assert (get_active_claims(mld, 600) == [1])
+        assert claim_exposure(mld, 1, 600) is None
+
+
+# Pytest class for coordinating the processing of exposures by workers
+class Test_coordinate(object):
+    # Test if only exposures that were reported by workers are merged
+    def test_reports(self, exp_dir):
+        # Let a worker reprocess two outdated exposures
+        db = Database(exp_dir)
+        expnum1, expnum2 = mark_outdated(exp_dir, range(100001, 100007),
+                                         0.4, seed=0).tolist()
+        db.work()
+        mld = db.mld
+
+        # Claim both again, as if the worker is about to release them
+        claim_file1 = claim_exposure(mld, expnum1, 600)
+        claim_file2 = claim_exposure(mld, expnum2, 600)
+
+        # Hide the report of the second, as if it is still being written
+        report_file2 = path.join(mld, REPORTS_DIR, f"exp{expnum2}.npy")
+        os.rename(report_file2, f"{report_file2}.hidden")
+
+        # Check that only the exposure whose report was read is merged
+        db.update(0)
+        assert not path.exists(path.join(mld, TEMP_EXP_FILE.format(expnum1)))
+        assert path.exists(path.join(mld, TEMP_EXP_FILE.format(expnum2)))
+        assert (count_rows(exp_dir)[expnum1] == 500)
+
+        # Release the second exposure and check that it is merged now
+        os.remove(claim_file1)
+        os.remove(claim_file2)
+        os.rename(f"{report_file2}.hidden", report_file2)
+        db.update(0)
+        assert not path.exists(path.join(mld, TEMP_EXP_FILE.format(expnum2)))
+        assert (count_rows(exp_dir) == dict.fromkeys(range(100001, 100007),
+                                                     500))
+
+    # Test if an exposure is merged exactly once if its worker was
+    # interrupted after exporting it, but before reporting it
+    @pytest.mark.parametrize('coordinate', [False, True])
+    @pytest.mark.parametrize('outdated', [False, True])
+    def test_interrupted(self, exp_dir, monkeypatch, outdated, coordinate):
+        # Add a new exposure or make an existing one outdated
+        if outdated:
+            expnum = 100002
+            mark_outdated(exp_dir, [expnum], 1)
+        else:
+            expnum = 100007
+            make_exposures(exp_dir, 1, 500, start=expnum, seed=1)
+
+        # Let a worker be interrupted right before reporting it
+        def interrupted(mld, record):
+            raise RuntimeError
+
+        db = Database(exp_dir)
+        monkeypatch.setattr(mld_main, 'write_report', interrupted)
+        with pytest.raises(RuntimeError):
+            db.work()
+        monkeypatch.undo()
+        temp_file = path.join(db.mld, TEMP_EXP_FILE.format(expnum))
+        assert path.exists(temp_file)
+
+        # Check that the next update merges it exactly once
+        if coordinate:
+            db.update(coordinate=True, interval=0.01)
+        else:
+            db.update(0)
+        assert not path.exists(temp_file)
+        n_expnums = 6+(not outdated)
+        assert (count_rows(exp_dir) == dict.fromkeys(
+            range(100001, 100001+n_expnums), 500))
+        assert (db.objid_counts()[1].sum() == n_expnums*500)
+        row_slice, = db.row_slices([expnum])
+        assert (row_slice.stop-row_slice.start == 500)
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+# %% IMPORTS
+# Package imports
+import numpy as np
+import pytest
+
+# MLDatabase imports
+from mldatabase import Database, crossmatch, get_mean_positions, xmatch
+from mldatabase.crossmatch import get_separations
+from mldatabase.synthetic import make_exposures
+
+
+# %% HELPER FUNCTIONS
+# This function cross-matches a catalog by comparing all pairs
+def brute_force(ra, decl, positions, radius):
+    sep = get_separations(ra[:, None], decl[:, None],
+                          np.asarray(positions['ra'])[None],
+                          np.asarray(positions['decl'])[None])*3600
+    src, obj = np.nonzero(sep <= radius)
+    return(src, np.asarray(positions['objid'])[obj], sep[src, obj])
+
+
+# This function creates a catalog around the provided positions
+def make_catalog(positions, radius, seed=0):
+    # Offset the positions by up to twice the radius
+    rng = np.random.default_rng(seed)
+    n = len(positions['objid'])
+    offset = rng.uniform(0, 2*radius/3600, n)
+    angle = rng.uniform(0, 2*np.pi, n)
+    decl = np.clip(np.asarray(positions['decl'])+offset*np.sin(angle),
+                   -90, 90)
+    ra = (np.asarray(positions['ra']) +
+          offset*np.cos(angle)/np.cos(np.radians(decl))) % 360
+    return(ra, decl)
+
+
+# This function checks that all matches of a catalog are found
+def check_matches(ra, decl, radius, exp_dir, positions):
+    matches = xmatch(ra, decl, radius, exp_dir, nearest=False,
+                     progress=False)
+    src, objids, sep = brute_force(ra, decl, positions, radius)
+    order = np.lexsort((objids, src))
+    matches = matches.sort_values(['index', 'objid'])
+    assert np.array_equal(matches['index'].values, src[order])
+    assert np.array_equal(matches['objid'].values, objids[order])
+    assert np.allclose(matches['sep'].values, sep[order])
+
+
+# %% PYTEST CLASSES AND FUNCTIONS
+# Pytest class for cross-matching catalogs against a database
+class Test_xmatch(object):
+    # Test if all matches within the radius are found
+    @pytest.mark.parametrize('radius', [0.5, 5.0])
+    def test_all(self, exp_dir, radius):
+        positions = get_mean_positions(exp_dir, progress=False)
+        ra, decl = make_catalog(positions, radius)
+        check_matches(ra, decl, radius, exp_dir, positions)
+
+    # Test if solely the nearest object of every source is found
+    def test_nearest(self, exp_dir):
+        positions = get_mean_positions(exp_dir, progress=False)
+        ra, decl = make_catalog(positions, 5.0)
+        matches = xmatch(ra, decl, 5.0, exp_dir, progress=False)
+        src, objids, sep = brute_force(ra, decl, positions, 5.0)
+        for index, objid, value in zip(src, objids, sep):
+            nearest = sep[src == index].min()
+            row = matches[matches['index'] == index].iloc[0]
+            assert np.isclose(row['sep'], nearest)
+            if(value == nearest):
+                assert (row['objid'] == objid)
+        assert (matches['index'].nunique() == len(matches))
+
+    # Test if objects around 'ra' = 0 and the poles are matched
+    @pytest.mark.parametrize('decl', [-30.0, -89.999, 89.999])
+    def test_edges(self, exp_dir, monkeypatch, decl):
+        # Replace the positions of the objects by ones around the edges
+        rng = np.random.default_rng(1)
+        n = 2000
+        positions = {
+            'objid': np.arange(n),
+            'ra': rng.uniform(-0.01, 0.01, n) % 360,
+            'decl': np.clip(decl+rng.uniform(-0.002, 0.002, n), -90, 90),
+            'count': np.ones(n, dtype=int)}
+        monkeypatch.setattr(crossmatch, 'read_positions',
+                            lambda mld, progress: positions)
+
+        # Check the matches of a catalog around them
+        ra, decl = make_catalog(positions, 2.0)
+        check_matches(ra, decl, 2.0, exp_dir, positions)
+
+    # Test if the mean positions are recomputed after an update
+    def test_update(self, exp_dir):
+        positions = get_mean_positions(exp_dir, progress=False)
+        make_exposures(exp_dir, 2, 500, start=100007, seed=1)
+        Database(exp_dir).update()
+        updated = get_mean_positions(exp_dir, progress=False)
+        assert (updated['count'].sum() == positions['count'].sum()+1000)
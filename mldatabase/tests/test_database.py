@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+# %% IMPORTS
+# Built-in imports
+import os
+from os import path
+import threading
+
+# Package imports
+import numpy as np
+import pytest
+
+# MLDatabase imports
+from mldatabase import Database
+from mldatabase.__main__ import ARGS
+from mldatabase.synthetic import make_exposures
+
+
+# %% PYTEST CLASSES AND FUNCTIONS
+# Pytest class for the Database object API
+class Test_Database(object):
+    # Test if a directory that does not exist is rejected
+    def test_missing_dir(self, tmp_path):
+        with pytest.raises(OSError):
+            Database(str(tmp_path/"missing"))
+
+    # Test if the arguments of a database are only used while it is active
+    def test_activate(self, exp_dir, tmp_path):
+        db1 = Database(exp_dir)
+        db2 = Database(str(tmp_path))
+        assert 'mld' not in ARGS
+        with db1.activate(jobs=3):
+            assert (ARGS.dir == db1.dir)
+            assert (ARGS.jobs == 3)
+
+            # Check that a database without a directory is the active one
+            assert (Database().mld == db1.mld)
+
+            # Check that activating another database restores this one after
+            with db2.activate():
+                assert (ARGS.mld == db2.mld)
+                assert 'jobs' not in ARGS
+            assert (ARGS.mld == db1.mld)
+        assert 'mld' not in ARGS
+
+    # Test if the objids and their counts are provided consistently
+    def test_counter(self, exp_dir):
+        db = Database(exp_dir)
+        objids, counts = db.objid_counts()
+        assert (np.diff(objids) > 0).all()
+        assert (counts.sum() == 6*500)
+        assert (db.counter() == dict(zip(objids, counts)))
+        with db.open() as df:
+            assert (len(df) == 6*500)
+            values, n = np.unique(df['objid'].values, return_counts=True)
+            assert np.array_equal(values, objids)
+            assert np.array_equal(n, counts)
+
+    # Test if a database cannot be accessed while it is being updated
+    def test_access(self, exp_dir):
+        db = Database(exp_dir)
+        with db.access() as mld:
+            assert (mld == db.mld)
+        lock_file = path.join(db.mld, '.mld_update.lock')
+        os.mknod(lock_file)
+        with pytest.raises(OSError):
+            with db.access():
+                pass
+        os.remove(lock_file)
+
+    # Test if several databases can be updated at the same time in threads
+    def test_threads(self, tmp_path):
+        # Create three databases with a different number of exposures
+        dbs = []
+        for i in range(3):
+            exp_dir = str(tmp_path/f"dir{i}")
+            make_exposures(exp_dir, i+2, 300, start=100001+10*i, seed=i)
+            Database(exp_dir).init(n_expnums=0)
+            dbs.append(Database(exp_dir))
+
+        # Define function that updates a database, recording any error
+        errors = []
+
+        def update(db):
+            try:
+                db.update(jobs=2)
+            except Exception as error:
+                errors.append(error)
+
+        # Update all databases at the same time
+        threads = [threading.Thread(target=update, args=(db,)) for db in dbs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Check that every database contains only its own exposures
+        assert not errors
+        for i, db in enumerate(dbs):
+            assert (db.objid_counts()[1].sum() == (i+2)*300)
+            with db.open() as df:
+                expnums = np.unique(df['expnum'].values)
+            assert np.array_equal(expnums, np.arange(i+2)+100001+10*i)
+
+        # Check that the arguments of this thread were not changed
+        assert 'mld' not in ARGS
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+# %% IMPORTS
+# Built-in imports
+import os
+from os import path
+
+# Package imports
+import h5py
+import numpy as np
+import pytest
+
+# MLDatabase imports
+from mldatabase import Database, export_database
+from mldatabase._globals import MASTER_EXP_FILE, VAEX_COLUMN
+from mldatabase.synthetic import make_exposures
+
+# Skip this module if pyarrow is not installed
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+
+# %% HELPER FUNCTIONS
+# This function reads columns of a database
+def read_columns(exp_dir, columns):
+    with h5py.File(path.join(Database(exp_dir).mld, MASTER_EXP_FILE),
+                   'r') as file:
+        return({name: file[VAEX_COLUMN.format(name)][()]
+                for name in columns})
+
+
+# This function reads an exported Arrow IPC or Parquet file
+def read_table(filename):
+    if filename.endswith('.parquet'):
+        return(pq.read_table(filename))
+    with pa.ipc.open_file(filename) as reader:
+        return(reader.read_all())
+
+
+# %% PYTEST CLASSES AND FUNCTIONS
+# Pytest class for exporting a database
+class Test_export_database(object):
+    # Test if the entire database is exported in both formats
+    @pytest.mark.parametrize('ext', ['.arrow', '.parquet'])
+    def test_full(self, exp_dir, tmp_path, ext):
+        output = str(tmp_path/f"export{ext}")
+        n_rows = export_database(output, exp_dir, ['objid', 'mag'],
+                                 batch_size=700)
+        data = read_columns(exp_dir, ['objid', 'mag'])
+        table = read_table(output)
+        assert (n_rows == table.num_rows == 6*500)
+        assert np.array_equal(table['objid'].to_numpy(), data['objid'])
+        assert np.array_equal(table['mag'].to_numpy(), data['mag'])
+
+    # Test if only the selected rows are exported
+    def test_filters(self, exp_dir, tmp_path):
+        data = read_columns(exp_dir, ['expnum', 'objid', 'hjd'])
+        expnums = [100005, 100002]
+        objid_range = np.percentile(data['objid'], [20, 70]).astype(int)
+        hjd_range = (data['hjd'].min(), np.median(data['hjd']))
+        output = str(tmp_path/"export.arrow")
+        n_rows = export_database(output, exp_dir, ['expnum', 'objid'],
+                                 expnums=expnums, objid_range=objid_range,
+                                 hjd_range=hjd_range, batch_size=300)
+
+        # Check that the exported rows are the selected ones, in order
+        mask = (np.isin(data['expnum'], expnums) &
+                (data['objid'] >= objid_range[0]) &
+                (data['objid'] <= objid_range[1]) &
+                (data['hjd'] >= hjd_range[0]) & (data['hjd'] <= hjd_range[1]))
+        table = read_table(output)
+        assert (0 < n_rows == mask.sum() == table.num_rows)
+        assert np.array_equal(table['expnum'].to_numpy(),
+                              data['expnum'][mask])
+        assert np.array_equal(table['objid'].to_numpy(), data['objid'][mask])
+
+    # Test if only the rows of the selected exposures are read
+    def test_expnums(self, exp_dir, tmp_path, monkeypatch):
+        # Record which rows are read
+        reads = []
+        get_item = h5py.Dataset.__getitem__
+
+        def read(dset, key):
+            if(dset.name == '/'+VAEX_COLUMN.format('expnum')):
+                reads.append(key)
+            return(get_item(dset, key))
+
+        monkeypatch.setattr(h5py.Dataset, '__getitem__', read)
+
+        # Export a single exposure
+        output = str(tmp_path/"export.arrow")
+        n_rows = export_database(output, exp_dir, ['expnum'],
+                                 expnums=[100003], batch_size=200)
+        monkeypatch.undo()
+
+        # Check that solely its rows were read
+        assert (n_rows == 500)
+        assert (sum(key.stop-key.start for key in reads) == 500)
+        assert (read_table(output)['expnum'].to_numpy() == 100003).all()
+
+    # Test if the rows are divided up over objid partitions
+    def test_partitions(self, exp_dir, tmp_path):
+        output = str(tmp_path/"export")
+        n_rows = export_database(output, exp_dir, ['objid', 'mag'],
+                                 fmt='parquet', batch_size=700,
+                                 n_partitions=3)
+        files = sorted(os.listdir(output))
+        tables = [read_table(path.join(output, name)) for name in files]
+        assert (1 < len(files) <= 3)
+        assert (n_rows == sum(table.num_rows for table in tables) == 6*500)
+
+        # Check that the objid ranges of the partitions do not overlap
+        ranges = sorted((table['objid'].to_numpy().min(),
+                         table['objid'].to_numpy().max()) for table in tables)
+        assert all(a[1] < b[0] for a, b in zip(ranges[:-1], ranges[1:]))
+
+    # Test if an empty database can be exported
+    def test_empty(self, tmp_path):
+        exp_dir = str(tmp_path/"exp")
+        make_exposures(exp_dir, 2, 0, seed=0)
+        Database(exp_dir).init()
+
+        # Check that a single file without rows is written
+        output = str(tmp_path/"export.arrow")
+        assert (export_database(output, exp_dir, ['objid']) == 0)
+        assert (read_table(output).num_rows == 0)
+
+        # Check that no partitions are written
+        output = str(tmp_path/"parts")
+        assert (export_database(output, exp_dir, ['objid'], fmt='parquet',
+                                n_partitions=4) == 0)
+        assert (os.listdir(output) == [])
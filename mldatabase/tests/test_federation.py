@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+# %% IMPORTS
+# Built-in imports
+from collections import Counter
+from os import path
+
+# Package imports
+import h5py
+import numpy as np
+import pytest
+
+# MLDatabase imports
+from mldatabase import Database, Federation
+from mldatabase.__main__ import merge_counts
+from mldatabase._globals import MASTER_EXP_FILE, VAEX_COLUMN
+from mldatabase.synthetic import make_exposures
+
+
+# %% HELPER FUNCTIONS
+# This function reads columns of a database
+def read_columns(exp_dir, columns):
+    with h5py.File(path.join(Database(exp_dir).mld, MASTER_EXP_FILE),
+                   'r') as file:
+        return({name: file[VAEX_COLUMN.format(name)][()]
+                for name in columns})
+
+
+# %% PYTEST FIXTURES
+# Fixture providing a federation of two databases with shared objects
+@pytest.fixture
+def federation(exp_dir, tmp_path):
+    other_dir = str(tmp_path/"other")
+    make_exposures(other_dir, 4, 300, start=200001, seed=1)
+    Database(other_dir).init()
+    return(Federation([exp_dir, other_dir, exp_dir], n_threads=2))
+
+
+# %% PYTEST CLASSES AND FUNCTIONS
+# Pytest class for querying multiple databases as one
+class Test_Federation(object):
+    # Test if a federation requires existing databases
+    def test_invalid(self, tmp_path):
+        with pytest.raises(ValueError):
+            Federation([])
+        with pytest.raises(OSError):
+            Federation([str(tmp_path)])
+
+    # Test if every database is used once, in order
+    def test_dirs(self, federation, exp_dir):
+        assert (len(federation) == 2)
+        assert (federation.dirs[0] == Database(exp_dir).dir)
+        assert (federation.map(lambda db: db.dir) == federation.dirs)
+
+    # Test if the objid counts of all databases are merged
+    def test_counts(self, federation):
+        expected = Counter()
+        for exp_dir in federation.dirs:
+            expected.update(read_columns(exp_dir, ['objid'])['objid'])
+        objids, counts = federation.objid_counts()
+        assert (len(expected) < 6*500+4*300)
+        assert np.array_equal(objids, sorted(expected))
+        assert np.array_equal(counts, [expected[objid] for objid in objids])
+        assert (federation.counter() == expected)
+
+    # Test if sorted counts are merged correctly
+    def test_merge_counts(self):
+        objids, counts = merge_counts(np.array([1, 3, 5]), np.array([1, 1, 2]),
+                                      np.array([2, 3, 6, 7]),
+                                      np.array([4, 5, 1, 1]))
+        assert np.array_equal(objids, [1, 2, 3, 5, 6, 7])
+        assert np.array_equal(counts, [1, 4, 6, 2, 1, 1])
+        objids, counts = merge_counts(np.array([], dtype=int),
+                                      np.array([], dtype=int),
+                                      np.array([4]), np.array([2]))
+        assert np.array_equal(objids, [4])
+        assert np.array_equal(counts, [2])
+
+    # Test if aggregates are combined over all databases
+    def test_aggregates(self, federation):
+        mag = np.concatenate([read_columns(exp_dir, ['mag'])['mag']
+                              for exp_dir in federation.dirs])
+        assert (federation.count() == len(mag) == 6*500+4*300)
+        assert (federation.count('mag < 20') == (mag < 20).sum())
+        assert (federation.sum('mag') == pytest.approx(mag.sum()))
+        assert (federation.mean('mag') == pytest.approx(mag.mean()))
+        assert (federation.mean('mag', 'mag < 20') ==
+                pytest.approx(mag[mag < 20].mean()))
+        assert (federation.minmax('mag') == (mag.min(), mag.max()))
+
+    # Test if light curves are fetched from all databases
+    def test_light_curves(self, federation):
+        objids, counts = federation.objid_counts()
+        objid = objids[np.argmax(counts)]
+        data = federation.light_curves([objid, objids[-1]],
+                                       ['objid', 'hjd', 'mag'])
+        assert (len(data) == counts[np.argmax(counts)]+counts[-1])
+        assert (set(data['dir']) == set(federation.dirs))
+        assert (np.diff(data['objid']) >= 0).all()
+        rows = data[data['objid'] == objid]
+        assert (np.diff(rows['hjd']) >= 0).all()
+        assert (len(federation.light_curve(objid)) == len(rows))
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+# %% IMPORTS
+# Built-in imports
+from os import path
+import threading
+
+# Package imports
+import h5py
+import numpy as np
+import pandas as pd
+import pytest
+
+# MLDatabase imports
+from mldatabase import Database, apply_objid, grouping, iter_objid_batches
+from mldatabase._globals import MASTER_EXP_FILE, VAEX_COLUMN
+
+
+# %% HELPER FUNCTIONS
+# This function returns the mean 'mag' of every group in a batch
+def mean_mag(data, offsets):
+    return(np.add.reduceat(data['mag'], offsets[:-1])/np.diff(offsets))
+
+
+# This function returns the mean and number of 'mag' of an object
+def describe_mag(data):
+    return({'mean': data['mag'].mean(), 'count': len(data['mag'])})
+
+
+# This function fails for every batch
+def fail(data, offsets):
+    raise ValueError("Failed")
+
+
+# This function reads columns of a database as a DataFrame
+def read_columns(exp_dir, columns):
+    with h5py.File(path.join(Database(exp_dir).mld, MASTER_EXP_FILE),
+                   'r') as file:
+        return(pd.DataFrame({name: file[VAEX_COLUMN.format(name)][()]
+                             for name in columns}))
+
+
+# %% PYTEST CLASSES AND FUNCTIONS
+# Pytest class for applying functions to every object in a database
+class Test_apply_objid(object):
+    # Test if the results of every object are correct
+    @pytest.mark.parametrize('n_procs', [1, 2])
+    def test_batches(self, exp_dir, n_procs):
+        results = apply_objid(mean_mag, exp_dir, ['mag'], batch_size=700,
+                              n_procs=n_procs, progress=False)
+        expected = read_columns(exp_dir, ['objid', 'mag']).groupby(
+            'objid')['mag'].mean()
+        assert np.array_equal(results.index, expected.index)
+        assert np.allclose(results['result'], expected)
+
+    # Test if a function can be applied to every object separately
+    def test_per_group(self, exp_dir):
+        results = apply_objid(describe_mag, exp_dir, ['mag'], per_group=True,
+                              batch_size=700, n_procs=2, progress=False)
+        groups = read_columns(exp_dir, ['objid', 'mag']).groupby('objid')
+        assert np.allclose(results['mean'], groups['mag'].mean())
+        assert np.array_equal(results['count'], groups.size())
+
+    # Test if an interrupted call is resumed from its checkpoint
+    def test_checkpoint(self, exp_dir, tmp_path):
+        checkpoint = str(tmp_path/'checkpoint')
+        results = apply_objid(mean_mag, exp_dir, ['mag'], batch_size=700,
+                              n_procs=1, checkpoint=checkpoint,
+                              progress=False)
+        resumed = apply_objid(fail, exp_dir, ['mag'], batch_size=700,
+                              n_procs=1, checkpoint=checkpoint,
+                              progress=False)
+        assert results.equals(resumed)
+
+    # Test if an error in a process is raised
+    def test_error(self, exp_dir):
+        with pytest.raises(ValueError):
+            apply_objid(fail, exp_dir, ['mag'], batch_size=700, n_procs=2,
+                        progress=False)
+
+
+# Pytest class for streaming a database in batches of objid groups
+class Test_iter_objid_batches(object):
+    # Test if every object is provided in a single batch with all its rows
+    def test_groups(self, exp_dir):
+        batches = list(iter_objid_batches(exp_dir, ['hjd'], batch_size=700))
+        assert (len(batches) > 1)
+        objids = np.concatenate([data['objid'] for data, _ in batches])
+        hjd = np.concatenate([data['hjd'] for data, _ in batches])
+
+        # Check that all rows are provided, sorted on objid
+        expected = read_columns(exp_dir, ['objid', 'hjd']).sort_values(
+            'objid', kind='stable')
+        assert np.array_equal(objids, expected['objid'])
+        assert np.array_equal(hjd, expected['hjd'])
+
+        # Check that every batch consists of complete groups
+        for data, offsets in batches:
+            assert (offsets[-1] == len(data['objid']))
+            assert (np.diff(data['objid'][offsets[:-1]]) > 0).all()
+            starts = np.concatenate([[True], np.diff(data['objid']) != 0])
+            assert np.array_equal(np.nonzero(starts)[0], offsets[:-1])
+        firsts = [data['objid'][0] for data, _ in batches]
+        lasts = [data['objid'][-1] for data, _ in batches]
+        assert (np.array(firsts[1:]) > np.array(lasts[:-1])).all()
+
+    # Test if the clustered copy is created only once by concurrent readers
+    def test_concurrent(self, exp_dir, monkeypatch):
+        # Count how often columns are clustered
+        calls = []
+        cluster_columns = grouping.cluster_columns
+
+        def count(*args):
+            calls.append(args[1])
+            cluster_columns(*args)
+
+        monkeypatch.setattr(grouping, 'cluster_columns', count)
+
+        # Define function that reads all values of 'mag' in batches
+        results = []
+
+        def read():
+            results.append(np.concatenate([
+                data['mag'] for data, _ in iter_objid_batches(
+                    exp_dir, ['mag'], batch_size=700)]))
+
+        # Let two threads read the database at the same time
+        threads = [threading.Thread(target=read) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Check that both read the same values from a single copy
+        assert (calls == [['objid', 'mag']])
+        assert (len(results) == 2)
+        assert np.array_equal(results[0], results[1])
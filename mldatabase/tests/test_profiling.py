@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+# %% IMPORTS
+# Built-in imports
+import threading
+import time
+
+# MLDatabase imports
+from mldatabase import Database, UpdateProfiler, get_update_profiles
+from mldatabase.synthetic import make_exposures
+
+
+# %% PYTEST CLASSES AND FUNCTIONS
+# Pytest class for the UpdateProfiler class
+class Test_UpdateProfiler(object):
+    # Test if concurrent stages solely record the CPU time of their thread
+    def test_threads(self):
+        profiler = UpdateProfiler()
+
+        # Define functions that wait and that keep the CPU busy
+        def wait():
+            with profiler.stage('wait'):
+                time.sleep(0.5)
+
+        def work():
+            with profiler.stage('work'):
+                end = time.perf_counter()+0.5
+                while(time.perf_counter() < end):
+                    pass
+
+        # Run both at the same time
+        threads = [threading.Thread(target=wait),
+                   threading.Thread(target=work)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Check that solely the busy stage used CPU time
+        assert (profiler.stages['wait']['wall_time'] >= 0.5)
+        assert (profiler.stages['wait']['cpu_time'] < 0.1)
+        assert (profiler.stages['work']['cpu_time'] > 0.25)
+
+    # Test if the stages of a different profiler can be added
+    def test_add_stages(self):
+        profiler1 = UpdateProfiler()
+        profiler2 = UpdateProfiler()
+        for profiler in (profiler1, profiler2):
+            with profiler.stage('stage', rows=5):
+                pass
+        profiler1.add_stages(profiler2.pop_stages())
+        assert (profiler2.stages == {})
+        assert (profiler1.stages['stage']['calls'] == 2)
+        assert (profiler1.stages['stage']['rows'] == 10)
+
+    # Test if a disabled profiler does not record anything
+    def test_disabled(self):
+        profiler = UpdateProfiler(False)
+        with profiler.stage('stage', rows=5) as counters:
+            counters['rows'] += 1
+        profiler.add_stages({'stage': {}})
+        assert (profiler.stages == {})
+
+    # Test if profilers never overwrite each other's profile
+    def test_dump(self, tmp_path):
+        filenames = {UpdateProfiler().dump(str(tmp_path)) for _ in range(5)}
+        assert (len(filenames) == 5)
+
+
+# Pytest class for profiling updates
+class Test_profile(object):
+    # Test if the stages of processes that process exposures are recorded
+    def test_jobs(self, exp_dir):
+        make_exposures(exp_dir, 3, 500, start=100007, seed=1)
+        Database(exp_dir).update(jobs=2, profile=True)
+        stages = get_update_profiles(exp_dir)[-1]['stages']
+        assert (stages['process']['rows'] == 3)
+        assert (stages['process.read_exp']['calls'] == 3)
+        assert (stages['process.read_exp']['rows'] == 1500)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+# %% IMPORTS
+# Built-in imports
+from os import path
+
+# Package imports
+import h5py
+import numpy as np
+import pandas as pd
+import pytest
+
+# MLDatabase imports
+from mldatabase import Database, build_pyramid, get_binned_light_curve
+from mldatabase._globals import MASTER_EXP_FILE, VAEX_COLUMN
+from mldatabase.pyramid import bin_rows
+from mldatabase.synthetic import make_exposures
+
+
+# %% HELPER FUNCTIONS
+# This function reads the rows of an objid in a database
+def read_rows(exp_dir, objid):
+    with h5py.File(path.join(Database(exp_dir).mld, MASTER_EXP_FILE),
+                   'r') as file:
+        data = pd.DataFrame({
+            name: file[VAEX_COLUMN.format(name)][()]
+            for name in ('objid', 'hjd', 'mag', 'magerr')})
+    return(data[data['objid'] == objid])
+
+
+# This function returns the objid with the most rows in a database
+def get_common_objid(exp_dir):
+    objids, counts = Database(exp_dir).objid_counts()
+    return(objids[np.argmax(counts)])
+
+
+# %% PYTEST CLASSES AND FUNCTIONS
+# Pytest class for binning rows
+class Test_bin_rows(object):
+    # Test if the aggregates of all bins are correct
+    def test_aggregates(self):
+        batch = {'objid': np.array([2, 1, 2, 1, 1]),
+                 'hjd': np.array([0.5, 1.2, 0.7, 1.9, 3.1]),
+                 'mag': np.array([10., 12., 14., 16., 20.]),
+                 'magerr': np.array([1., 1., 0.5, np.nan, 1.])}
+        bins, n_bins = bin_rows(batch, 1.0)
+        assert np.array_equal(n_bins, [2, 1])
+        assert np.array_equal(bins['bin'], [1, 3, 0])
+        assert np.array_equal(bins['count'], [2, 1, 2])
+        assert np.allclose(bins['mag_mean'], [14, 20, 12])
+        assert np.array_equal(bins['mag_min'], [12, 20, 10])
+        assert np.array_equal(bins['mag_max'], [16, 20, 14])
+
+        # Check that invalid errors are ignored in the weighted mean
+        assert np.allclose(bins['mag_wmean'], [12, 20, (10+4*14)/5])
+
+
+# Pytest class for the binned light curves of objects
+class Test_get_binned_light_curve(object):
+    # Test if the finest bins match the rows of an object
+    def test_bins(self, exp_dir):
+        build_pyramid(exp_dir, [0.001, 1.0], progress=False)
+        objid = get_common_objid(exp_dir)
+        rows = read_rows(exp_dir, objid)
+        light_curve = get_binned_light_curve(objid, exp_dir)
+        assert (light_curve.attrs['bin_width'] == 0.001)
+        assert (light_curve['count'].sum() == len(rows))
+
+        # Check every bin against the rows in it
+        groups = rows.groupby(np.floor(rows['hjd']/0.001).astype(int))
+        assert np.allclose(light_curve['hjd'],
+                           (np.array(list(groups.groups))+0.5)*0.001)
+        assert np.allclose(light_curve['mag_mean'], groups['mag'].mean())
+        assert np.allclose(light_curve['mag_min'], groups['mag'].min())
+        assert np.allclose(light_curve['mag_max'], groups['mag'].max())
+
+    # Test if the resolution matches the requested number of pixels
+    def test_resolution(self, exp_dir):
+        build_pyramid(exp_dir, [0.001, 0.01, 1.0], progress=False)
+        objid = get_common_objid(exp_dir)
+        hjd_range = (2457000.0, 2457000.1)
+        widths = [get_binned_light_curve(
+            objid, exp_dir, hjd_range=hjd_range,
+            n_pixels=n_pixels).attrs['bin_width']
+            for n_pixels in (1000, 20, 1)]
+        assert (widths == [0.001, 0.01, 1.0])
+
+        # Check that solely bins within the hjd range are provided
+        light_curve = get_binned_light_curve(
+            objid, exp_dir, hjd_range=(2457000.02, 2457000.04))
+        assert (light_curve['hjd'] >= 2457000.02-0.0005).all()
+        assert (light_curve['hjd'] <= 2457000.04+0.0005).all()
+
+    # Test if an object that is not in the database has no bins
+    def test_missing(self, exp_dir):
+        build_pyramid(exp_dir, progress=False)
+        light_curve = get_binned_light_curve(-1, exp_dir)
+        assert light_curve.empty
+        assert np.isnan(light_curve.attrs['bin_width'])
+
+    # Test if the pyramid is required and rebuilt after every update
+    def test_update(self, exp_dir):
+        objid = get_common_objid(exp_dir)
+        with pytest.raises(OSError):
+            get_binned_light_curve(objid, exp_dir)
+        build_pyramid(exp_dir, [0.001], progress=False)
+
+        # Check that the new rows of the object are binned after an update
+        make_exposures(exp_dir, 2, 500, start=100007, seed=1)
+        Database(exp_dir).update()
+        light_curve = get_binned_light_curve(objid, exp_dir)
+        assert (light_curve.attrs['bin_width'] == 0.001)
+        assert (light_curve['count'].sum() == len(read_rows(exp_dir, objid)))
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+# %% IMPORTS
+# Built-in imports
+from os import path
+import subprocess
+import sys
+
+# Package imports
+import h5py
+import numpy as np
+import pytest
+
+# MLDatabase imports
+from mldatabase import ColumnReader, Database, open_columns
+from mldatabase._globals import EXP_HEADER, MASTER_EXP_FILE, VAEX_COLUMN
+from mldatabase._writer import write_columns
+from mldatabase.reader import DatasetSegment
+
+
+# %% HELPER FUNCTIONS
+# This function reads columns of a database
+def read_columns(exp_dir, columns):
+    with h5py.File(path.join(Database(exp_dir).mld, MASTER_EXP_FILE),
+                   'r') as file:
+        return({name: file[VAEX_COLUMN.format(name)][()]
+                for name in columns})
+
+
+# This function writes an exposure file with numbered rows
+def make_exp_file(filename, n_rows, resizable=False):
+    write_columns(filename, {
+        name: [np.arange(n_rows).astype(dtype)]
+        for name, dtype in EXP_HEADER.items()}, resizable=resizable)
+    return(filename)
+
+
+# %% PYTEST CLASSES AND FUNCTIONS
+# Pytest class for reading the columns of a database
+class Test_open_columns(object):
+    # Test if every column is provided as a read-only memory map
+    def test_memmap(self, exp_dir):
+        data = read_columns(exp_dir, EXP_HEADER)
+        with open_columns(exp_dir) as reader:
+            assert (len(reader) == 6*500)
+            assert (reader.columns == list(EXP_HEADER))
+            for name in EXP_HEADER:
+                assert reader.is_contiguous(name)
+                assert isinstance(reader[name], np.memmap)
+                assert not reader[name].flags.writeable
+                assert np.array_equal(reader[name], data[name],
+                                      equal_nan=True)
+
+            # Check that a column that does not exist is rejected
+            with pytest.raises(KeyError):
+                reader.is_contiguous('missing')
+
+    # Test if all rows are provided in chunks
+    def test_iter_chunks(self, exp_dir):
+        data = read_columns(exp_dir, ['objid', 'mag'])
+        with open_columns(exp_dir) as reader:
+            chunks = list(reader.iter_chunks(['objid', 'mag'], 700))
+        assert ([start for start, _ in chunks] == list(range(0, 3000, 700)))
+        for name in ('objid', 'mag'):
+            assert np.array_equal(
+                np.concatenate([chunk[name] for _, chunk in chunks]),
+                data[name])
+
+    # Test if no vaex is imported
+    def test_no_vaex(self, exp_dir):
+        code = ("import sys; from mldatabase import open_columns\n"
+                f"with open_columns({exp_dir!r}) as reader:\n"
+                "    reader['mag'].sum()\n"
+                "assert 'vaex' not in sys.modules")
+        subprocess.run([sys.executable, '-c', code], check=True)
+
+
+# Pytest class for reading columns that are not stored contiguously
+class Test_ColumnReader(object):
+    # Test if chunked columns are read from the file instead
+    def test_resizable(self, tmp_path):
+        filename = make_exp_file(str(tmp_path/"exp.hdf5"), 1000, True)
+        reader = ColumnReader(filename)
+        assert not reader.is_contiguous('objid')
+        with pytest.raises(ValueError):
+            reader['objid']
+        assert isinstance(reader.get_source('objid'), h5py.Dataset)
+
+        # Check that all rows can be read in chunks
+        objid = np.concatenate([chunk['objid'] for _, chunk in
+                                reader.iter_chunks(['objid'], 300)])
+        assert np.array_equal(objid, np.arange(1000))
+
+        # Check that segments only provide their own rows
+        segment = reader.get_segment('objid', slice(100, 400))
+        assert isinstance(segment, DatasetSegment)
+        assert (len(segment) == 300)
+        assert (segment.dtype == EXP_HEADER['objid'])
+        assert np.array_equal(segment[:], np.arange(100, 400))
+        assert np.array_equal(segment[50:80], np.arange(150, 180))
+        assert np.array_equal(segment[250:1000], np.arange(350, 400))
+        assert (len(reader.get_segment('objid', slice(900, 2000))) == 100)
+        reader.close()
+
+    # Test if segments of contiguous columns are slices of their memory maps
+    def test_segment(self, tmp_path):
+        filename = make_exp_file(str(tmp_path/"exp.hdf5"), 1000)
+        reader = ColumnReader(filename)
+        segment = reader.get_segment('objid', slice(100, 400))
+        assert isinstance(segment, np.memmap)
+        assert np.array_equal(segment, np.arange(100, 400))
+
+        # Check that memory maps remain valid after closing
+        reader.close()
+        assert np.array_equal(segment[:3], [100, 101, 102])
+
+    # Test if columns without rows are provided as empty arrays
+    def test_empty(self, tmp_path):
+        reader = ColumnReader(make_exp_file(str(tmp_path/"exp.hdf5"), 0))
+        assert (len(reader) == 0)
+        assert (reader['mag'].size == 0)
+        assert not reader['mag'].flags.writeable
+        assert not list(reader.iter_chunks())
+        reader.close()
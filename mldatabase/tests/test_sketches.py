@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+# %% IMPORTS
+# Built-in imports
+from os import path
+
+# Package imports
+import h5py
+import numpy as np
+
+# MLDatabase imports
+from mldatabase import Database, Sketch, get_sketch
+from mldatabase._globals import MASTER_EXP_FILE, MASTER_FILE, VAEX_COLUMN
+from mldatabase.sketches import (
+    HISTOGRAM_EDGES, HLL_PRECISION, SAMPLE_DTYPE, SAMPLE_SIZE,
+    estimate_cardinality, get_registers)
+from mldatabase.synthetic import make_exposures
+
+
+# %% HELPER FUNCTIONS
+# This function creates a sketch solely holding the registers of objids
+def make_sketch(objids):
+    return(Sketch(1, len(objids), get_registers(objids),
+                  {name: np.zeros(len(edges)+1, dtype=int)
+                   for name, edges in HISTOGRAM_EDGES.items()},
+                  np.empty(0, dtype=SAMPLE_DTYPE)))
+
+
+# This function returns the keys of all rows in a database by which they are
+# sampled, sorted on key
+def get_sorted_keys(exp_dir):
+    with h5py.File(path.join(Database(exp_dir).mld, MASTER_FILE),
+                   'r') as m_file:
+        records = m_file['expnums'][()]
+    keys = [(np.random.default_rng(int(record['expnum'])).random(
+        record['row_stop']-record['row_start']), record)
+        for record in records]
+    return(np.sort(np.concatenate([
+        np.rec.fromarrays([key, np.full(key.size, record['expnum']),
+                           np.arange(key.size)+record['row_start']],
+                          names='key,expnum,row')
+        for key, record in keys]), order='key'))
+
+
+# %% PYTEST CLASSES AND FUNCTIONS
+# Pytest class for the HyperLogLog sketches of objids
+class Test_hll(object):
+    # Test if merged registers equal the registers of all objids together
+    def test_merge(self):
+        rng = np.random.default_rng(0)
+        objids1 = rng.choice(10**9, 100_000, replace=False)
+        objids2 = np.concatenate([objids1[:50_000],
+                                  rng.choice(10**9, 50_000, replace=False)])
+        sketch = make_sketch(objids1).merge(make_sketch(objids2))
+        union = np.union1d(objids1, objids2)
+        assert np.array_equal(sketch._registers, get_registers(union))
+        assert (abs(sketch.n_objids/union.size-1) < 0.1)
+
+    # Test if the cardinality of few objids is estimated accurately
+    def test_small(self):
+        assert (estimate_cardinality(np.zeros(2**HLL_PRECISION,
+                                              dtype=np.uint8)) == 0)
+        assert (abs(make_sketch(np.arange(100)).n_objids-100) <= 10)
+
+    # Test if the sketches of a database merge into the sketch of all rows
+    def test_database(self, exp_dir):
+        # Obtain the sketches of two halves of the exposures and all of them
+        sketch1 = get_sketch(exp_dir, range(100001, 100004))
+        sketch2 = get_sketch(exp_dir, range(100004, 100007))
+        sketch = get_sketch(exp_dir)
+        merged = sketch1.merge(sketch2)
+
+        # Check that they are equal to each other and the rows
+        with h5py.File(path.join(Database(exp_dir).mld, MASTER_EXP_FILE),
+                       'r') as file:
+            objids = file[VAEX_COLUMN.format('objid')][()]
+        assert (merged.n_expnums == sketch.n_expnums == 6)
+        assert (merged.n_rows == sketch.n_rows == objids.size)
+        assert np.array_equal(merged._registers, sketch._registers)
+        assert np.array_equal(merged._registers, get_registers(objids))
+        for name in HISTOGRAM_EDGES:
+            assert np.array_equal(merged.histogram(name)[1],
+                                  sketch.histogram(name)[1])
+        assert (abs(merged.n_objids/np.unique(objids).size-1) < 0.1)
+
+
+# Pytest class for the uniform samples of rows
+class Test_sample(object):
+    # Test if the sample is uniform across exposures of unequal size
+    def test_unequal(self, tmp_path):
+        # Create a database with exposures of very different sizes
+        exp_dir = str(tmp_path)
+        make_exposures(exp_dir, 4, 2000, seed=0)
+        make_exposures(exp_dir, 20, 50, start=100005, seed=1)
+        Database(exp_dir).init()
+
+        # Check that the sample holds exactly the rows with the smallest keys
+        sample = get_sketch(exp_dir).sample
+        keys = get_sorted_keys(exp_dir)[:len(sample)]
+        with h5py.File(path.join(Database(exp_dir).mld, MASTER_EXP_FILE),
+                       'r') as file:
+            mag = file[VAEX_COLUMN.format('mag')][()]
+        assert (SAMPLE_SIZE < len(sample) < 1000)
+        assert np.array_equal(sample['expnum'], keys['expnum'])
+        assert np.array_equal(sample['mag'], mag[keys['row']])
+
+        # Check that the large exposures provide most rows, as they should
+        large = (sample['expnum'] <= 100004).mean()
+        assert (large > 0.6)
+
+        # Check that merged samples are uniform as well
+        sketch = get_sketch(exp_dir, range(100001, 100003)).merge(
+            get_sketch(exp_dir, range(100003, 100025)), 1000)
+        keys = get_sorted_keys(exp_dir)[:len(sketch.sample)]
+        assert (len(sketch.sample) > SAMPLE_SIZE)
+        assert np.array_equal(sketch.sample['expnum'], keys['expnum'])
+
+        # Check that the sample size is respected
+        sample = get_sketch(exp_dir, sample_size=10).sample
+        assert np.array_equal(sample['expnum'],
+                              get_sorted_keys(exp_dir)[:10]['expnum'])
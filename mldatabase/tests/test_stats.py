@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+# %% IMPORTS
+# Built-in imports
+from os import path
+
+# Package imports
+import h5py
+import numpy as np
+import pytest
+import vaex
+
+# MLDatabase imports
+from mldatabase import Database, get_excluded_expnums
+from mldatabase.__main__ import get_exposure_stats
+from mldatabase._globals import MASTER_EXP_FILE, MASTER_FILE, VAEX_COLUMN
+
+
+# %% HELPER FUNCTIONS
+# This function creates an exposure with the provided columns
+def make_exp_data(mag, contam):
+    mag = np.array(mag, dtype=float)
+    return(vaex.from_arrays(mag=mag, magerr=mag/10,
+                            contam=np.array(contam, dtype=float),
+                            fitsky=np.ones_like(mag)))
+
+
+# %% PYTEST CLASSES AND FUNCTIONS
+# Pytest class for the quality statistics of exposures
+class Test_get_exposure_stats(object):
+    # Test if the statistics ignore values that are not finite
+    def test_nan(self):
+        n_rows, mag, magerr, contam_frac, fitsky = get_exposure_stats(
+            make_exp_data([1, 2, np.nan, 4, 5], [0, 1, np.nan, 0, np.inf]))
+        assert (n_rows == 5)
+        assert (mag == 3)
+        assert (magerr == pytest.approx(0.3))
+        assert (contam_frac == pytest.approx(1/3))
+        assert (fitsky == 1)
+
+    # Test if an exposure without rows has unknown statistics
+    def test_empty(self):
+        stats = get_exposure_stats(make_exp_data([], []))
+        assert (stats[0] == 0)
+        assert np.isnan(stats[1:]).all()
+
+    # Test if the statistics of all exposures are stored when processed
+    def test_database(self, exp_dir):
+        mld = Database(exp_dir).mld
+        with h5py.File(path.join(mld, MASTER_FILE), 'r') as m_file:
+            records = m_file['expnums'][()]
+        with h5py.File(path.join(mld, MASTER_EXP_FILE), 'r') as file:
+            data = {name: file[VAEX_COLUMN.format(name)][()]
+                    for name in ('expnum', 'mag', 'contam')}
+        for record in records:
+            rows = data['expnum'] == record['expnum']
+            assert (record['n_rows'] == rows.sum())
+            assert (record['mag_median'] == np.median(data['mag'][rows]))
+            assert (record['contam_frac'] ==
+                    pytest.approx(np.mean(data['contam'][rows] > 0)))
+
+    # Test if exposures are excluded on their statistics
+    def test_excluded(self, exp_dir):
+        mld = Database(exp_dir).mld
+        with h5py.File(path.join(mld, MASTER_FILE), 'r') as m_file:
+            records = np.sort(m_file['expnums'][()], order='mag_median')
+        threshold = records['mag_median'][3]
+        assert (get_excluded_expnums(exp_dir, min_rows=1).size == 0)
+        assert (get_excluded_expnums(exp_dir, min_rows=501).size == 6)
+        assert (sorted(get_excluded_expnums(exp_dir,
+                                            max_mag_median=threshold)) ==
+                sorted(records['expnum'][4:]))
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+# %% IMPORTS
+# Built-in imports
+from os import path
+
+# Package imports
+import h5py
+import numpy as np
+import pytest
+
+# MLDatabase imports
+from mldatabase import Database, __main__ as mld_main
+from mldatabase._globals import MASTER_EXP_FILE, MASTER_FILE, VAEX_COLUMN
+from mldatabase._journal import read_journal
+from mldatabase.synthetic import make_exposures, mark_outdated
+
+
+# %% HELPER CLASSES AND FUNCTIONS
+# Define exception that simulates a crash during an update
+class Crash(Exception):
+    pass
+
+
+# This function returns a function that crashes on its n-th call
+def crash_on_call(func, n):
+    calls = []
+
+    def wrapper(*args, **kwargs):
+        calls.append(None)
+        if(len(calls) == n):
+            raise Crash
+        return(func(*args, **kwargs))
+    return(wrapper)
+
+
+# This function checks that a database is consistent with its rows
+def check_database(exp_dir):
+    # Read the expnum and objid of every row and all exposure records
+    db = Database(exp_dir)
+    with h5py.File(path.join(db.mld, MASTER_EXP_FILE), 'r') as file:
+        expnums = file[VAEX_COLUMN.format('expnum')][()]
+        objids = file[VAEX_COLUMN.format('objid')][()]
+    with h5py.File(path.join(db.mld, MASTER_FILE), 'r') as m_file:
+        records = m_file['expnums'][()]
+
+    # Check that the objid counts match the rows
+    unique, counts = np.unique(objids, return_counts=True)
+    db_objids, db_counts = db.objid_counts()
+    assert np.array_equal(db_objids, unique)
+    assert np.array_equal(db_counts, counts)
+
+    # Check that the row index covers exactly the rows of every exposure
+    for record in records:
+        start, stop = record['row_start'], record['row_stop']
+        if(start < 0):
+            assert (start == stop == -1)
+            assert not (expnums == record['expnum']).any()
+        else:
+            assert (expnums[start:stop] == record['expnum']).all()
+            assert ((expnums == record['expnum']).sum() == stop-start)
+
+    # Check that no step of an update is left behind
+    assert read_journal(db.mld) is None
+    assert not path.exists(path.join(db.mld, 'temp.hdf5'))
+
+    # Return the number of rows of every exposure
+    return(dict(zip(*map(np.ndarray.tolist,
+                         np.unique(expnums, return_counts=True)))))
+
+
+# %% PYTEST CLASSES AND FUNCTIONS
+# Pytest class for the row index of a database
+class Test_row_index(object):
+    # Test if the row index is correct after merging new exposures
+    def test_merge(self, exp_dir):
+        make_exposures(exp_dir, 3, 500, start=100007, seed=1)
+        Database(exp_dir).update()
+        assert (check_database(exp_dir) ==
+                dict.fromkeys(range(100001, 100010), 500))
+
+    # Test if the row index is correct after removing outdated exposures
+    def test_removal(self, exp_dir):
+        db = Database(exp_dir)
+        version = db.version
+        outdated = mark_outdated(exp_dir, range(100001, 100007), 0.5, seed=1)
+        db.update()
+        assert (check_database(exp_dir) ==
+                dict.fromkeys(range(100001, 100007), 500))
+
+        # Check that the outdated exposures were logged as replaced
+        changes = db.changes(version)
+        assert (db.version == version+1)
+        assert (set(changes['expnum'][changes['replaced']].tolist()) ==
+                set(outdated.tolist()))
+
+    # Test if outdated exposures without rows do not rewrite the database
+    def test_removal_no_rows(self, exp_dir, monkeypatch):
+        db = Database(exp_dir)
+        make_exposures(exp_dir, 1, 0, start=100007, seed=1)
+        db.update()
+        mark_outdated(exp_dir, [100007], 1)
+
+        # Record every removal of rows from the master exposure file
+        calls = []
+        get_removed_row_ranges = mld_main.get_removed_row_ranges
+
+        def record(*args):
+            calls.append(args[1])
+            return(get_removed_row_ranges(*args))
+
+        monkeypatch.setattr(mld_main, 'get_removed_row_ranges', record)
+
+        # Check that nothing was removed
+        db.update()
+        assert not calls
+        assert (check_database(exp_dir) ==
+                dict.fromkeys(range(100001, 100007), 500))
+
+
+# Pytest class for recovering from interrupted updates
+class Test_journal(object):
+    # Test if an update that crashed in any step is rolled forward
+    @pytest.mark.parametrize('state, func, step', [
+        ('begin', 'fsync_file', 1),
+        ('begin', 'fsync_file', 2),
+        ('exported', 'commit_journaled_step', 1),
+        ('exported', 'commit_journaled_step', 2)])
+    def test_crash(self, exp_dir, monkeypatch, state, func, step):
+        # Add new exposures and mark others as outdated, which requires a
+        # removal step followed by a merge step
+        db = Database(exp_dir)
+        version = db.version
+        make_exposures(exp_dir, 3, 500, start=100007, seed=1)
+        mark_outdated(exp_dir, range(100001, 100007), 0.5, seed=1)
+
+        # Crash the update in the requested step
+        monkeypatch.setattr(mld_main, func,
+                            crash_on_call(getattr(mld_main, func), step))
+        with pytest.raises(Crash):
+            db.update()
+        monkeypatch.undo()
+
+        # Check that the interrupted step was journaled
+        assert (read_journal(db.mld)['state'] == state)
+
+        # Check that the next update finishes the interrupted one
+        db.update(0)
+        check_database(exp_dir)
+        assert (db.version > version)
+
+        # Check that all exposures are added once more afterward
+        db.update()
+        assert (check_database(exp_dir) ==
+                dict.fromkeys(range(100001, 100010), 500))
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+# %% IMPORTS
+# Built-in imports
+import os
+from os import path
+import time
+
+# Package imports
+import h5py
+import numpy as np
+import pytest
+
+# MLDatabase imports
+from mldatabase import Database, __main__ as mld_main
+from mldatabase._globals import MASTER_EXP_FILE, VAEX_COLUMN
+from mldatabase._writer import is_resizable
+from mldatabase.synthetic import make_exposures
+
+
+# %% HELPER FUNCTIONS
+# This function returns the number of rows of every exposure in a database
+def count_rows(exp_dir):
+    with h5py.File(path.join(Database(exp_dir).mld, MASTER_EXP_FILE),
+                   'r') as file:
+        expnums = file[VAEX_COLUMN.format('expnum')][()]
+    return(dict(zip(*map(np.ndarray.tolist,
+                         np.unique(expnums, return_counts=True)))))
+
+
+# This function watches a database while performing the provided steps
+def watch(exp_dir, monkeypatch, steps):
+    """
+    Watches the database in `exp_dir`, performing the next of the provided
+    `steps` whenever the watcher waits and all exposures that the previous
+    step wrote were added, and stopping the watcher after the last step.
+    Every step returns the expnums of the exposures it wrote.
+
+    """
+
+    # Initialize the steps and the exposures that must be added
+    steps = iter(steps)
+    expnums = []
+    sleep = time.sleep
+
+    # Define function that replaces waiting for the next scan of DIR
+    def wait(timeout):
+        sleep(0.01)
+        if set(expnums).issubset(count_rows(exp_dir)):
+            step = next(steps, None)
+            if step is None:
+                raise KeyboardInterrupt
+            expnums[:] = step()
+
+    # Watch the database
+    monkeypatch.setattr(mld_main.time, 'sleep', wait)
+    Database(exp_dir).update(watch=True, interval=1, settle=0, latency=0)
+
+
+# This function returns a step that writes new exposures
+def add_exposures(exp_dir, start, n=2):
+    def step():
+        make_exposures(exp_dir, n, 500, start=start, seed=start)
+        return(list(range(start, start+n)))
+    return(step)
+
+
+# %% PYTEST CLASSES AND FUNCTIONS
+# Pytest class for watching a database for new exposures
+class Test_watch(object):
+    # Test if new exposures are appended to the database in place
+    def test_append(self, exp_dir, monkeypatch):
+        master_exp_file = path.join(Database(exp_dir).mld, MASTER_EXP_FILE)
+        inodes = []
+
+        # Define step that records the master exposure file before appending
+        def record():
+            inodes.append(os.stat(master_exp_file).st_ino)
+            return(add_exposures(exp_dir, 100009)())
+
+        # Watch the database while adding two batches of exposures
+        watch(exp_dir, monkeypatch, [add_exposures(exp_dir, 100007), record])
+
+        # Check that the second batch was appended to the same file
+        assert is_resizable(master_exp_file)
+        assert (os.stat(master_exp_file).st_ino == inodes[0])
+        assert (count_rows(exp_dir) == dict.fromkeys(range(100001, 100011),
+                                                     500))
+
+        # Check that the index, objid counts and vaex all cover the new rows
+        db = Database(exp_dir)
+        assert (db.objid_counts()[1].sum() == 10*500)
+        with h5py.File(master_exp_file, 'r') as file:
+            expnums = file[VAEX_COLUMN.format('expnum')][()]
+        for expnum in range(100007, 100011):
+            row_slice, = db.row_slices([expnum])
+            assert (row_slice.stop-row_slice.start == 500)
+            assert (expnums[row_slice] == expnum).all()
+        with db.open() as df:
+            assert (len(df) == 10*500)
+            assert (df['expnum'].values[-500:] == 100010).all()
+
+        # Check that an update without watching stores it contiguously again
+        make_exposures(exp_dir, 1, 500, start=100011, seed=1)
+        db.update()
+        assert not is_resizable(master_exp_file)
+        assert (count_rows(exp_dir)[100011] == 500)
+
+    # Test if an interrupted append is undone and merged again
+    def test_interrupted(self, exp_dir, monkeypatch):
+        # Make appending raise an error after all rows were appended
+        append_columns = mld_main.append_columns
+
+        def interrupted(*args):
+            append_columns(*args)
+            raise RuntimeError
+
+        monkeypatch.setattr(mld_main, 'append_columns', interrupted)
+
+        # Watch the database until appending the second batch fails
+        with pytest.raises(RuntimeError):
+            watch(exp_dir, monkeypatch, [add_exposures(exp_dir, 100007),
+                                         add_exposures(exp_dir, 100009)])
+        monkeypatch.undo()
+
+        # Check that the next update adds every exposure exactly once
+        Database(exp_dir).update()
+        assert (count_rows(exp_dir) == dict.fromkeys(range(100001, 100011),
+                                                     500))
+        assert (Database(exp_dir).objid_counts()[1].sum() == 10*500)
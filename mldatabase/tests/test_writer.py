@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+# %% IMPORTS
+# Built-in imports
+import threading
+
+# Package imports
+import h5py
+import numpy as np
+import pytest
+
+# MLDatabase imports
+from mldatabase import _writer
+from mldatabase._globals import VAEX_COLUMN
+from mldatabase._writer import (
+    append_columns, get_working_set, is_resizable, truncate_columns,
+    write_columns)
+from mldatabase.reader import DatasetSegment
+
+
+# %% HELPER CLASSES AND FUNCTIONS
+# Define segment that records the threads it is read by
+class RecordedSegment(object):
+    def __init__(self, values, threads):
+        self.values = values
+        self.threads = threads
+
+    def __len__(self):
+        return(len(self.values))
+
+    def __getitem__(self, key):
+        self.threads.add(threading.current_thread())
+        return(self.values[key])
+
+    @property
+    def dtype(self):
+        return(self.values.dtype)
+
+
+# This function reads all columns of an HDF5-file
+def read_file(filename):
+    with h5py.File(filename, 'r') as file:
+        names = file['table/columns'].attrs['column_order'].split(',')
+        return({name: file[VAEX_COLUMN.format(name)][()] for name in names})
+
+
+# %% PYTEST CLASSES AND FUNCTIONS
+# Pytest class for writing columns to HDF5-files
+class Test_write_columns(object):
+    # Test if segments of every kind are written in order
+    def test_segments(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(_writer, 'CHUNK_SIZE', 70)
+        source = str(tmp_path/"source.hdf5")
+        write_columns(source, {'x': [np.arange(500.)]}, resizable=True)
+        threads = set()
+
+        # Write a column made of arrays, datasets and other segments
+        filename = str(tmp_path/"exp.hdf5")
+        with h5py.File(source, 'r') as file:
+            dset = file[VAEX_COLUMN.format('x')]
+            n_rows = write_columns(filename, {
+                'x': [np.arange(100.), dset, DatasetSegment(dset,
+                                                            slice(50, 250)),
+                      RecordedSegment(np.arange(300.), threads)],
+                'y': [np.ones(1100, dtype=np.int32)]}, n_threads=4)
+
+        # Check that all rows were written contiguously
+        data = read_file(filename)
+        assert (n_rows == 1100)
+        assert np.array_equal(data['x'], np.concatenate([
+            np.arange(100.), np.arange(500.), np.arange(50., 250.),
+            np.arange(300.)]))
+        assert (data['y'] == 1).all() and (data['y'].dtype == np.int32)
+        with h5py.File(filename, 'r') as file:
+            for name in ('x', 'y'):
+                dset = file[VAEX_COLUMN.format(name)]
+                assert dset.chunks is None
+                assert dset.id.get_offset() is not None
+
+        # Check that segments that are no arrays are read by this thread
+        assert (threads == {threading.current_thread()})
+
+    # Test if columns of unequal length are rejected
+    def test_unequal(self, tmp_path):
+        with pytest.raises(ValueError):
+            write_columns(str(tmp_path/"exp.hdf5"), {'x': [np.arange(3)],
+                                                     'y': [np.arange(4)]})
+
+    # Test if the memory held at once does not depend on the rows
+    def test_working_set(self, monkeypatch):
+        monkeypatch.setattr(_writer, 'CHUNK_SIZE', 10)
+        assert (get_working_set([np.int32, np.float64], 3) == 4*10*8)
+        assert (get_working_set([]) == 0)
+
+
+# Pytest class for growing and shrinking resizable columns
+class Test_resizable(object):
+    # Test if rows are appended in place and can be truncated again
+    def test_append(self, tmp_path):
+        filename = str(tmp_path/"exp.hdf5")
+        write_columns(filename, {'x': [np.arange(10)], 'y': [np.zeros(10)]},
+                      resizable=True)
+        assert is_resizable(filename)
+
+        # Append rows to both columns
+        assert (append_columns(filename, {'x': [np.arange(10, 15)],
+                                          'y': [np.ones(5)]}) == 5)
+        data = read_file(filename)
+        assert np.array_equal(data['x'], np.arange(15))
+        assert np.array_equal(data['y'], np.r_[np.zeros(10), np.ones(5)])
+
+        # Check that columns must be appended to all at once
+        with pytest.raises(ValueError):
+            append_columns(filename, {'x': [np.arange(3)]})
+
+        # Check that the appended rows can be removed again
+        truncate_columns(filename, 10)
+        assert np.array_equal(read_file(filename)['x'], np.arange(10))
+
+    # Test if contiguous files are not resizable
+    def test_contiguous(self, tmp_path):
+        filename = str(tmp_path/"exp.hdf5")
+        write_columns(filename, {'x': [np.arange(10)]})
+        assert not is_resizable(filename)